@@ -3,10 +3,10 @@ import { Layout } from './components/Layout';
 import { Login } from './components/Login';
 import { Button } from './components/Button';
 import { SidebarProgress } from './components/SidebarProgress';
-import { parseContentToBlocks } from './services/parserService';
+import { parseContentToBlocks, chunkQuestionsToBlocks } from './services/parserService';
 
 import { api } from './services/api';
-import { AppView, Question, QuizBlock, UserSession, Stats, Workplace } from './types';
+import { AppView, Question, QuizBlock, UserSession, Stats, Workplace, CommunityNote } from './types';
 import { UploadIllustration, EmptyStateIllustration, SecurityShieldIcon } from './components/Visuals';
 
 
@@ -38,6 +38,7 @@ function App() {
     const [currentQuestionIdx, setCurrentQuestionIdx] = useState(0);
     const [session, setSession] = useState<UserSession>({});
     const [studyGroups, setStudyGroups] = useState<any[]>([]);
+    const [blockNotes, setBlockNotes] = useState<Awaited<ReturnType<typeof api.getBlockCommunityNotes>> | null>(null);
     const [uploadError, setUploadError] = useState<string | null>(null);
     const [isDragging, setIsDragging] = useState(false);
 
@@ -49,9 +50,12 @@ function App() {
 
     const loadData = async () => {
         try {
+            // Queued answers first, so the refresh doesn't bring back older values
+            await api.flushProgress().catch(err => console.error('Failed to flush progress queue', err));
             const [fetchedQuizzes, fetchedProgress, user, groups, fetchedWorkplaces] = await Promise.all([
                 api.getQuizzes(),
-                api.getProgress(),
+                // Full load the first time, then only what changed since the last cursor
+                api.syncProgress(session),
                 api.getMe(),
                 api.getStudyGroups(),
                 api.getWorkplaces()
@@ -97,6 +101,26 @@ function App() {
         }
     }, [isAuthenticated]);
 
+    // Queued progress is sent when the page goes away (tab closed, reload, navigation)
+    useEffect(() => {
+        const flushOnHide = () => {
+            api.flushProgress(true).catch(() => { /* the page is going away */ });
+        };
+        window.addEventListener('pagehide', flushOnHide);
+        return () => window.removeEventListener('pagehide', flushOnHide);
+    }, []);
+
+    // Prefetch community notes for the whole block instead of one request per question
+    useEffect(() => {
+        setBlockNotes(null);
+        if (!isAuthenticated || !activeQuizId) return;
+        let cancelled = false;
+        api.getBlockCommunityNotes(activeQuizId)
+            .then(data => { if (!cancelled) setBlockNotes(data); })
+            .catch(() => { /* CommunityNotes falls back to per-question requests */ });
+        return () => { cancelled = true; };
+    }, [isAuthenticated, activeQuizId]);
+
     const handleLogin = () => {
         setIsAuthenticated(true);
         // Force refresh to ensure clean state and avoid rendering issues
@@ -104,6 +128,8 @@ function App() {
     };
 
     const handleLogout = () => {
+        // Send queued answers while the token is still set
+        api.flushProgress(true).catch(() => { /* best effort */ });
         api.logout();
         setIsAuthenticated(false);
         setQuizzes([]);
@@ -130,6 +156,25 @@ function App() {
     const currentQuestion = activeQuiz?.questions[currentQuestionIdx];
 
     // --- Handlers ---
+    const blockNotesFor = (questionId: string) => {
+        const key = blockNotes?.questions[questionId];
+        if (!blockNotes || !key) return undefined;
+        const group = blockNotes.groups[key];
+        return { notes: group?.notes || [], nextCursor: group?.next_cursor || null };
+    };
+
+    const handleNoteCreated = (questionId: string, note: CommunityNote) => {
+        setBlockNotes(prev => {
+            const key = prev?.questions[questionId];
+            if (!prev || !key) return prev;
+            const group = prev.groups[key] || { count: 0, notes: [], next_cursor: null };
+            return {
+                ...prev,
+                groups: { ...prev.groups, [key]: { ...group, count: group.count + 1, notes: [note, ...group.notes] } }
+            };
+        });
+    };
+
     const handleGoToPricing = () => setCurrentView(AppView.PRICING);
     const handleUpgradeSuccess = async () => {
         setIsLoading(true);
@@ -203,9 +248,8 @@ function App() {
 
         setGeneratingQuiz(true);
         try {
-            const questions = await api.generateAIQuiz(isacaStats.difficulty, 5);
             const title = `Simulado IA - ${isacaStats.difficulty} #${isacaStats.aiQuizzesCount + 1}`;
-            const newQuiz = await api.createQuiz(title, questions, 'ISACA', undefined, undefined, 'Gerado por IA');
+            const newQuiz = await api.generateAIQuizJob(isacaStats.difficulty, 5, title, 'Gerado por IA');
 
             setQuizzes(prev => [...prev, newQuiz]);
             alert(`Novo simulado ${isacaStats.difficulty} desbloqueado e gerado com sucesso!`);
@@ -267,12 +311,13 @@ function App() {
             }
             // Combine all questions from all parsed blocks in the file
             const allQuestions = newBlocks.flatMap(b => b.questions);
-            const updatedQuiz = await api.updateQuizQuestions(quizId, allQuestions);
+            await api.updateQuizQuestions(quizId, allQuestions);
 
-            setQuizzes(prev => prev.map(q => q.id === quizId ? updatedQuiz : q));
+            const appendQuestions = (q: QuizBlock) => q.id === quizId ? { ...q, questions: [...q.questions, ...allQuestions] } : q;
+            setQuizzes(prev => prev.map(appendQuestions));
             setWorkplaces(prev => prev.map(wp => ({
                 ...wp,
-                quizzes: wp.quizzes.map(q => q.id === quizId ? updatedQuiz : q)
+                quizzes: wp.quizzes.map(appendQuestions)
             })));
 
             alert(`${allQuestions.length} questões adicionadas ao bloco!`);
@@ -322,7 +367,7 @@ function App() {
         }
     };
 
-    const processContent = async (filename: string, content: string, provider?: string) => {
+    const processContent = async (filename: string, content: string | Question[], provider?: string) => {
         console.log("processContent started for:", filename);
 
         // Suggest a default name (remove extension and common prefixes)
@@ -345,7 +390,10 @@ function App() {
                 return;
             }
 
-            const newBlocks = parseContentToBlocks(filename, content, finalizedName);
+            // Raw file text is parsed here; autoloaded exams arrive already parsed by the server
+            const newBlocks = typeof content === 'string'
+                ? parseContentToBlocks(filename, content, finalizedName)
+                : chunkQuestionsToBlocks(filename, content, finalizedName);
             console.log("Parser returned blocks:", newBlocks.length);
 
             if (newBlocks.length === 0) {
@@ -437,8 +485,8 @@ function App() {
             }
         }));
 
-        // API Call
-        await api.updateProgress(currentQuestion.id, { selectedAnswer: optionId });
+        // Queued and sent in one batch with the next few clicks
+        api.queueProgress(currentQuestion.id, { selectedAnswer: optionId });
 
         // Check for total win (all questions correct)
         if (activeQuiz) {
@@ -469,7 +517,7 @@ function App() {
             return copy;
         });
 
-        await api.updateProgress(currentQuestion.id, { selectedAnswer: null, aiAnalysis: null });
+        api.queueProgress(currentQuestion.id, { selectedAnswer: null, aiAnalysis: null });
     };
 
     const handleDeleteQuizBlock = async (quizId: string, e: React.MouseEvent) => {
@@ -529,6 +577,7 @@ function App() {
 
         setIsLoading(true);
         try {
+            await api.flushProgress();
             await api.resetBlockProgress(quizId);
 
             // Clear local session for these questions
@@ -555,6 +604,7 @@ function App() {
         if (window.confirm('Resetar TODO o progresso de todos os exames?')) {
             setIsLoading(true);
             try {
+                await api.flushProgress();
                 await api.resetAllProgress();
                 setSession({});
                 setUploadError(null);
@@ -573,15 +623,16 @@ function App() {
 
         setIsLoading(true);
         try {
-            const analysis = await api.analyzeQuestion(currentQuestion);
-
-            setSession(prev => ({
-                ...prev,
-                [currentQuestion.id]: {
-                    ...prev[currentQuestion.id],
-                    aiAnalysis: analysis
-                }
-            }));
+            // Tokens are rendered as they arrive instead of after the whole completion
+            const analysis = await api.streamAnalysis(currentQuestion, (partial) => {
+                setSession(prev => ({
+                    ...prev,
+                    [currentQuestion.id]: {
+                        ...prev[currentQuestion.id],
+                        aiAnalysis: partial
+                    }
+                }));
+            });
 
             await api.updateProgress(currentQuestion.id, { aiAnalysis: analysis });
         } catch (error: any) {
@@ -613,7 +664,7 @@ function App() {
             }
         }));
 
-        await api.updateProgress(currentQuestion.id, updates);
+        api.queueProgress(currentQuestion.id, updates);
     };
 
     const exportData = () => {
@@ -650,9 +701,9 @@ function App() {
         if (mode === 'import') {
             setIsLoading(true);
             try {
-                const result = await api.autoloadExam(examName);
+                const result = await api.loadExamPack(examName);
                 if (result) {
-                    await processContent(result.filename, result.content, provider);
+                    await processContent(result.filename, result.questions, provider);
                 } else {
                     setCurrentView(AppView.UPLOAD);
                 }
@@ -1059,9 +1110,16 @@ function App() {
 
                                 {/* Header with Flags */}
                                 <div className="flex flex-col sm:flex-row sm:justify-between sm:items-start mb-6 gap-2 relative z-10">
-                                    <span className="inline-block px-3 py-1 rounded-full bg-indigo-50 text-indigo-700 text-xs font-bold uppercase tracking-wider">
-                                        Questão {currentQuestionIdx + 1}
-                                    </span>
+                                    <div className="flex items-center gap-2">
+                                        <span className="inline-block px-3 py-1 rounded-full bg-indigo-50 text-indigo-700 text-xs font-bold uppercase tracking-wider">
+                                            Questão {currentQuestionIdx + 1}
+                                        </span>
+                                        {!!currentQuestion.noteCount && (
+                                            <span className="inline-block px-3 py-1 rounded-full bg-amber-50 text-amber-700 text-xs font-bold" title="Dicas públicas da comunidade">
+                                                💬 {currentQuestion.noteCount} {currentQuestion.noteCount === 1 ? 'dica' : 'dicas'}
+                                            </span>
+                                        )}
+                                    </div>
 
                                     <div className="flex flex-wrap gap-2">
                                         {progress.isFlaggedDisagreeKey && (
@@ -1226,6 +1284,8 @@ function App() {
                                     questionId={currentQuestion.id}
                                     userName={currentUser?.username || 'Estudante'}
                                     isPremium={currentUser?.is_premium || false}
+                                    prefetched={blockNotesFor(currentQuestion.id)}
+                                    onNoteCreated={(note) => handleNoteCreated(currentQuestion.id, note)}
                                 />
                             )}
 
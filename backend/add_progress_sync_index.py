@@ -0,0 +1,30 @@
+"""
+Script para adicionar o índice (user_id, updated_at) em user_progress e a tabela
+progress_tombstones usados pela sincronização incremental de GET /progress/?since=...
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from backend.database import engine
+from backend.models import Base
+from sqlalchemy import text
+
+def add_sync_index():
+    print("📝 Criando tabela 'progress_tombstones' (se não existir)...")
+    Base.metadata.create_all(bind=engine)
+
+    print("📝 Criando índice 'ix_user_progress_user_updated_at'...")
+    with engine.connect() as conn:
+        try:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_user_progress_user_updated_at "
+                "ON user_progress (user_id, updated_at)"
+            ))
+            conn.commit()
+            print("✅ Índice criado/verificado!")
+        except Exception as e:
+            print(f"❌ Erro: {e}")
+
+if __name__ == "__main__":
+    add_sync_index()
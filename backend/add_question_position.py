@@ -0,0 +1,49 @@
+"""
+Script para adicionar a coluna 'position' à tabela questions (ordem da questão no bloco)
+e preencher as questões existentes na ordem em que foram importadas.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from backend.database import engine
+from sqlalchemy import text
+
+def add_position_column():
+    # Ordem física de inserção: rowid no SQLite, ctid no PostgreSQL
+    physical_order = "ctid" if engine.dialect.name == "postgresql" else "rowid"
+
+    with engine.connect() as conn:
+        print("📝 Adicionando coluna 'position' à tabela 'questions'...")
+        try:
+            conn.execute(text("ALTER TABLE questions ADD COLUMN position INTEGER"))
+            conn.commit()
+            print("✅ Coluna 'position' adicionada!")
+        except Exception as e:
+            conn.rollback()
+            print(f"ℹ️  Coluna 'position' provavelmente já existe: {e}")
+
+        try:
+            print("\n📝 Preenchendo posições das questões existentes...")
+            result = conn.execute(text(f'''
+                UPDATE questions SET position = (
+                    SELECT ranked.rn FROM (
+                        SELECT id, ROW_NUMBER() OVER (PARTITION BY quiz_id ORDER BY {physical_order}) - 1 AS rn
+                        FROM questions
+                    ) ranked
+                    WHERE ranked.id = questions.id
+                )
+                WHERE position IS NULL
+            '''))
+            print(f"✅ {result.rowcount} questões atualizadas")
+
+            print("\n📝 Criando índice 'ix_questions_quiz_id'...")
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_questions_quiz_id ON questions (quiz_id)"))
+            conn.commit()
+            print("✅ Índice criado/verificado!")
+        except Exception as e:
+            print(f"❌ Erro: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    add_position_column()
@@ -0,0 +1,170 @@
+"""
+Cache of AI question analyses, shared across users.
+
+Entries are keyed by (content key, correct_answer_label, prompt_version, model), where the
+content key covers everything that goes into the prompt (text, options, answer key and
+explanation; see models.create_content_key). The same question gets the same analysis
+whoever asks, and a request that changes any of it can't reuse or overwrite that entry. A process-local
+LRU sits in front of the ai_analysis_cache table. Entries expire after
+ANALYSIS_CACHE_TTL_DAYS; rows from a prompt version or model no longer in use are never
+read and are removed by purge().
+"""
+import datetime
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .database import SessionLocal
+
+MEMORY_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))
+TTL = datetime.timedelta(days=int(os.getenv("ANALYSIS_CACHE_TTL_DAYS", "30")))
+
+_lock = threading.Lock()
+_memory = OrderedDict()  # key -> (analysis, created_at)
+_metrics = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "expired": 0}
+
+
+def make_key(question, prompt_version: int, model: str) -> tuple:
+    """Cache key for a schemas.Question (or anything with text/options/correct_answer_label/explanation)"""
+    options = [{"label": opt.label, "text": opt.text} for opt in question.options]
+    content_key = models.create_content_key(question.text, question.correct_answer_label, question.explanation, options)
+    return (content_key, question.correct_answer_label.upper(), prompt_version, model)
+
+
+def _count(metric: str):
+    with _lock:
+        _metrics[metric] += 1
+
+
+def _expired(created_at) -> bool:
+    return created_at is None or created_at < datetime.datetime.utcnow() - TTL
+
+
+def _remember(key: tuple, analysis: str, created_at):
+    with _lock:
+        _memory[key] = (analysis, created_at)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _from_memory(key: tuple):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        if _expired(entry[1]):
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        _metrics["memory_hits"] += 1
+        return entry[0]
+
+
+def lookup(key: tuple):
+    """Cached analysis for a key, or None. Checks memory first, then the database."""
+    analysis = _from_memory(key)
+    if analysis is not None:
+        return analysis
+
+    db = SessionLocal()
+    try:
+        row = db.get(models.AIAnalysisCache, key)
+        if row is None:
+            _count("misses")
+            return None
+        if _expired(row.created_at):
+            db.delete(row)
+            db.commit()
+            _count("expired")
+            _count("misses")
+            return None
+        _remember(key, row.analysis, row.created_at)
+        _count("db_hits")
+        return row.analysis
+    finally:
+        db.close()
+
+
+def store(key: tuple, analysis: str):
+    now = datetime.datetime.utcnow()
+    _remember(key, analysis, now)
+
+    content_hash, label, prompt_version, model = key
+    db = SessionLocal()
+    try:
+        db.merge(models.AIAnalysisCache(
+            content_hash=content_hash,
+            correct_answer_label=label,
+            prompt_version=prompt_version,
+            model=model,
+            analysis=analysis,
+            created_at=now
+        ))
+        db.commit()
+        _count("stores")
+    except IntegrityError:
+        # Another worker stored the same key first; theirs is just as good
+        db.rollback()
+    finally:
+        db.close()
+
+
+async def alookup(key: tuple):
+    return await run_in_threadpool(lookup, key)
+
+
+async def astore(key: tuple, analysis: str):
+    await run_in_threadpool(store, key, analysis)
+
+
+def purge(prompt_versions: tuple, model: str) -> int:
+    """Delete expired rows and rows from prompt versions/models not in use. Returns rows deleted."""
+    db = SessionLocal()
+    try:
+        table = models.AIAnalysisCache
+        deleted = db.query(table).filter(or_(
+            table.created_at < datetime.datetime.utcnow() - TTL,
+            table.prompt_version.notin_(prompt_versions),
+            table.model != model
+        )).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    with _lock:
+        for key in [k for k, (_, created_at) in _memory.items() if k[2] not in prompt_versions or k[3] != model or _expired(created_at)]:
+            del _memory[key]
+    return deleted
+
+
+def analysis_lengths(prompt_version: int, model: str, limit: int = 1000) -> list:
+    """Lengths in characters of the most recent cached analyses for a prompt version and model"""
+    db = SessionLocal()
+    try:
+        table = models.AIAnalysisCache
+        rows = db.query(func.length(table.analysis)).filter(
+            table.prompt_version == prompt_version, table.model == model
+        ).order_by(table.created_at.desc()).limit(limit).all()
+        return [length for (length,) in rows]
+    finally:
+        db.close()
+
+
+def clear_memory():
+    with _lock:
+        _memory.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_metrics)
+        result["memory_entries"] = len(_memory)
+    lookups = result["memory_hits"] + result["db_hits"] + result["misses"]
+    result["hit_rate"] = round((result["memory_hits"] + result["db_hits"]) / lookups, 3) if lookups else None
+    return result
@@ -0,0 +1,162 @@
+"""
+Cache of verified principals, so get_current_user doesn't query users on every request.
+
+A bearer token maps to a schemas.User snapshot for PRINCIPAL_CACHE_TTL seconds (never past the
+token's own exp). Anything that changes a user must call invalidate_user(): it drops the user's
+entries in this process and logs a row in user_invalidations, which every other process (other
+gunicorn workers, admin scripts' effect on the API) picks up within INVALIDATION_POLL_INTERVAL.
+
+A request that loads a user while that user is being invalidated could otherwise cache the old
+row after the eviction. Every invalidation takes a number from a process-wide sequence and
+records it for the user (again once the change commits); loaders read generation() before
+querying and put() refuses a snapshot of a user invalidated since then.
+"""
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, func
+
+from . import models, schemas
+from .database import SessionLocal
+
+TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+INVALIDATION_POLL_INTERVAL = 5.0
+INVALIDATION_RETENTION = datetime.timedelta(days=1)
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # token -> (principal, expires_at)
+_tokens_by_user = {}      # user id -> set of tokens
+_last_invalidation_id = None
+_last_poll = 0.0
+_sequence = 0             # bumped by every invalidation
+_invalidated_at = {}      # user id -> _sequence at the user's latest invalidation
+_metrics = {"hits": 0, "misses": 0, "invalidations": 0, "stale_puts": 0}
+
+
+def _evict_user(user_id: str):
+    global _sequence
+    _sequence += 1
+    _invalidated_at[user_id] = _sequence
+    for token in _tokens_by_user.pop(user_id, ()):
+        _entries.pop(token, None)
+
+
+def _drop(token: str):
+    principal, _ = _entries.pop(token)
+    tokens = _tokens_by_user.get(principal.id)
+    if tokens:
+        tokens.discard(token)
+        if not tokens:
+            del _tokens_by_user[principal.id]
+
+
+def _poll_invalidations():
+    """Apply invalidations logged by other processes, at most every INVALIDATION_POLL_INTERVAL"""
+    global _last_invalidation_id, _last_poll
+    now = time.monotonic()
+    if now - _last_poll < INVALIDATION_POLL_INTERVAL:
+        return
+    _last_poll = now
+
+    db = SessionLocal()
+    try:
+        table = models.UserInvalidation
+        if _last_invalidation_id is None:
+            # Nothing cached before the first poll, so only later invalidations matter
+            _last_invalidation_id = db.query(func.max(table.id)).scalar() or 0
+            return
+        rows = db.query(table.id, table.user_id).filter(table.id > _last_invalidation_id).order_by(table.id).all()
+    finally:
+        db.close()
+
+    if rows:
+        with _lock:
+            for row in rows:
+                _evict_user(row.user_id)
+        _last_invalidation_id = rows[-1].id
+
+
+def get(token: str):
+    """Cached principal for a token, or None"""
+    _poll_invalidations()
+    with _lock:
+        entry = _entries.get(token)
+        if entry is None:
+            _metrics["misses"] += 1
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.time():
+            _drop(token)
+            _metrics["misses"] += 1
+            return None
+        _entries.move_to_end(token)
+        _metrics["hits"] += 1
+        return principal
+
+
+def generation() -> int:
+    """Read before loading a user from the database, and pass the value to put()"""
+    with _lock:
+        return _sequence
+
+
+def put(token: str, user: models.User, token_exp: float = None, loaded_at: int = None) -> schemas.User:
+    """Cache a snapshot of `user` for `token` and return it.
+
+    With `loaded_at` (generation() read before the user was queried), the snapshot is returned
+    but not cached if the user was invalidated in the meantime.
+    """
+    principal = schemas.User.model_validate(user)
+    expires_at = time.time() + TTL
+    if token_exp:
+        expires_at = min(expires_at, token_exp)
+    with _lock:
+        if loaded_at is not None and _invalidated_at.get(principal.id, 0) > loaded_at:
+            _metrics["stale_puts"] += 1
+            return principal
+        if token in _entries:
+            _drop(token)
+        _entries[token] = (principal, expires_at)
+        _tokens_by_user.setdefault(principal.id, set()).add(token)
+        while len(_entries) > MAX_ENTRIES:
+            _drop(next(iter(_entries)))
+    return principal
+
+
+def invalidate_user(db, user_id: str):
+    """Forget cached principals of a user, here and (once `db` commits) in every other process"""
+    with _lock:
+        _evict_user(user_id)
+        _metrics["invalidations"] += 1
+
+    # Loads that started before the commit may still read the old row: evict and bump again
+    def _after_commit(session):
+        with _lock:
+            _evict_user(user_id)
+
+    event.listen(db, "after_commit", _after_commit, once=True)
+    db.add(models.UserInvalidation(user_id=user_id))
+    db.query(models.UserInvalidation).filter(
+        models.UserInvalidation.created_at < datetime.datetime.utcnow() - INVALIDATION_RETENTION
+    ).delete(synchronize_session=False)
+
+
+def clear():
+    global _last_invalidation_id, _last_poll
+    with _lock:
+        _entries.clear()
+        _tokens_by_user.clear()
+        _invalidated_at.clear()
+    _last_invalidation_id = None
+    _last_poll = 0.0
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_metrics)
+        result["entries"] = len(_entries)
+    return result
@@ -0,0 +1,104 @@
+"""
+Benchmark do dashboard de grupos de estudo: verifica que o número de queries
+de progress_service.get_members_quiz_stats é constante, independente do número
+de membros e quizzes.
+
+Uso: python -m backend.bench_dashboard
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import models, progress_service
+
+QUESTIONS_PER_QUIZ = 50
+
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def seed(db, n_members: int, n_quizzes: int) -> list:
+    usernames = []
+    contents = {}
+    for m in range(n_members):
+        user = models.User(username=f"member{m}", hashed_password=None)
+        db.add(user)
+        db.flush()
+        usernames.append(user.username)
+        for qz in range(n_quizzes):
+            quiz = models.Quiz(title=f"Bloco {qz}", provider="ISACA", user_id=user.id)
+            db.add(quiz)
+            db.flush()
+            for i in range(QUESTIONS_PER_QUIZ):
+                if i not in contents:
+                    options = [{"label": "A", "text": "Opção"}]
+                    contents[i] = models.QuestionContent(
+                        hash=models.create_content_key(f"Questão {i}", "A", None, options),
+                        text=f"Questão {i}", correct_answer_label="A", options=options
+                    )
+                question = models.Question(
+                    quiz_id=quiz.id,
+                    content=contents[i],
+                    option_ids=[f"{quiz.id}-{i}-a"]
+                )
+                db.add(question)
+                db.flush()
+                if i % 2 == 0:
+                    db.add(models.UserProgress(
+                        user_id=user.id,
+                        question_id=question.id,
+                        selected_answer=f"{quiz.id}-{i}-a"
+                    ))
+    db.commit()
+    progress_service.rebuild_summaries(db)
+    return usernames
+
+
+def run(n_members: int, n_quizzes: int):
+    engine, db = make_session()
+    usernames = seed(db, n_members, n_quizzes)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    start = time.perf_counter()
+    stats = progress_service.get_members_quiz_stats(db, usernames + ["fantasma"])
+    elapsed = (time.perf_counter() - start) * 1000
+    event.remove(engine, "before_cursor_execute", listener)
+
+    db.close()
+    engine.dispose()
+
+    for quizzes in stats.values():
+        assert len(quizzes) == n_quizzes
+        for q in quizzes:
+            assert q["total_questions"] == QUESTIONS_PER_QUIZ
+            assert q["answered_questions"] == QUESTIONS_PER_QUIZ // 2
+    return len(statements), elapsed
+
+
+if __name__ == "__main__":
+    print("📊 Dashboard de grupos: queries por chamada\n")
+    counts = set()
+    for n_members, n_quizzes in [(1, 1), (5, 3), (20, 5), (50, 10)]:
+        n_queries, elapsed = run(n_members, n_quizzes)
+        counts.add(n_queries)
+        print(f"   membros={n_members:<3} quizzes/membro={n_quizzes:<3} queries={n_queries}  tempo={elapsed:.1f}ms")
+
+    if len(counts) == 1:
+        print(f"\n✅ Número de queries constante ({counts.pop()})")
+    else:
+        print(f"\n❌ Número de queries variou: {sorted(counts)}")
+        sys.exit(1)
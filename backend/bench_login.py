@@ -0,0 +1,114 @@
+"""
+Benchmark de uma rajada de logins: bcrypt inline nas threads da requisição (como antes)
+contra o pool de processos limitado de password_service.
+
+Enquanto LOGINS logins concorrentes verificam senhas, uma thread "sonda" mede a latência
+de uma requisição barata, para mostrar o impacto do hashing no resto da API.
+
+As latências de login cobrem todas as tentativas: um login rejeitado (503, depois de esperar
+PASSWORD_HASH_MAX_WAIT na fila) conta como falha, e o p99 aparece como "falha" se mais de 1%
+das tentativas falhou.
+
+Uso: python -m backend.bench_login [logins]   (padrão: 200)
+"""
+import sys
+import os
+import json
+import statistics
+import threading
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import password_service
+
+REQUEST_THREADS = 40  # same as Starlette's default threadpool
+PASSWORD = "senha-correta"
+PAYLOAD = {"questions": [{"text": f"Questão {i}", "options": ["A", "B", "C", "D"]} for i in range(50)]}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def format_ms(value: float) -> str:
+    return "falha" if value == float("inf") else f"{value:.0f}"
+
+
+def probe(stop: threading.Event, latencies: list):
+    """A cheap request: serialize a small quiz, every 20ms"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        json.dumps(PAYLOAD)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.02)
+
+
+def run_storm(login, n_logins: int) -> dict:
+    hashed = password_service.pwd_context.hash(PASSWORD)
+    results = []  # (latency, outcome)
+
+    def one_login():
+        start = time.perf_counter()
+        try:
+            outcome = "ok" if login(PASSWORD, hashed) else "invalid"
+        except password_service.HashingOverloaded:
+            outcome = "503"
+        results.append((time.perf_counter() - start, outcome))
+
+    stop = threading.Event()
+    probe_latencies = []
+    probe_thread = threading.Thread(target=probe, args=(stop, probe_latencies))
+    probe_thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(REQUEST_THREADS) as executor:
+        for _ in range(n_logins):
+            executor.submit(one_login)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    probe_thread.join()
+
+    accepted = [lat for lat, outcome in results if outcome == "ok"]
+    rejected = [lat for lat, outcome in results if outcome == "503"]
+    # Every attempt counts; a rejected login is a failure, slower than any success
+    attempts = [lat if outcome == "ok" else float("inf") for lat, outcome in results]
+    return {
+        "elapsed": elapsed,
+        "accepted": len(accepted),
+        "rejected": len(rejected),
+        "login_p50": percentile(attempts, 0.50),
+        "login_p99": percentile(attempts, 0.99),
+        "reject_p99": percentile(rejected, 0.99) if rejected else 0.0,
+        "probe_p50": percentile(probe_latencies, 0.50),
+        "probe_p99": percentile(probe_latencies, 0.99),
+    }
+
+
+def report(name: str, r: dict):
+    print(f"\n📊 {name}")
+    print(f"   total: {r['elapsed']:.1f}s  aceitos: {r['accepted']}  rejeitados (503): {r['rejected']}")
+    print(f"   login p50/p99 (todas as tentativas): {format_ms(r['login_p50'])} / {format_ms(r['login_p99'])} ms")
+    if r["rejected"]:
+        print(f"   rejeição p99: {r['reject_p99']:.1f} ms")
+    print(f"   sonda p50/p99: {r['probe_p50']:.2f} / {r['probe_p99']:.2f} ms")
+
+
+def main():
+    n_logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"🔐 {n_logins} logins concorrentes, bcrypt rounds={password_service.BCRYPT_ROUNDS}, "
+          f"{os.cpu_count()} CPU(s), pool={password_service.WORKERS} processos, "
+          f"fila máx.={password_service.MAX_PENDING}, espera máx.={password_service.MAX_WAIT:.0f}s")
+
+    inline = run_storm(lambda pw, h: password_service.pwd_context.verify(pw, h), n_logins)
+    report("Inline (threads da requisição)", inline)
+
+    password_service.get_pool()  # spawn the workers outside the measurement
+    pooled = run_storm(lambda pw, h: password_service.verify_password(pw, h)[0], n_logins)
+    password_service.shutdown()
+    report("Pool de processos com fila limitada", pooled)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark de busca em user_progress por (user_id, question_id), com e sem o índice
+único composto, numa base SQLite temporária.
+
+Uso: python -m backend.bench_progress_index [linhas]   (padrão: 1.000.000)
+"""
+import sys
+import os
+import random
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, text, insert
+
+from backend import models
+
+USERS = 1000
+LOOKUPS = 2000
+
+
+def seed(engine, n_rows: int):
+    questions_per_user = n_rows // USERS
+    table = models.UserProgress.__table__
+    with engine.begin() as conn:
+        conn.execute(text("PRAGMA foreign_keys=OFF"))
+        batch = []
+        for u in range(USERS):
+            for q in range(questions_per_user):
+                batch.append({
+                    "id": f"p{u}-{q}", "user_id": f"u{u}", "question_id": f"q{u}-{q}",
+                    "selected_answer": "a", "is_flagged_disagree_key": False, "is_flagged_disagree_ai": False
+                })
+            if len(batch) >= 50000:
+                conn.execute(insert(table), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(table), batch)
+    return questions_per_user
+
+
+def time_lookups(engine, keys: list) -> list:
+    timings = []
+    with engine.connect() as conn:
+        stmt = text("SELECT id FROM user_progress WHERE user_id = :u AND question_id = :q")
+        for u, q in keys:
+            start = time.perf_counter()
+            conn.execute(stmt, {"u": u, "q": q}).first()
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings
+
+
+def report(label: str, timings: list):
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99)]
+    print(f"   {label:<12} n={len(timings):<5} p50={p50:.3f}ms  p99={p99:.3f}ms")
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            # Start from the pre-migration layout: no indexes on user_progress
+            for name in ("ux_user_progress_user_question", "ix_user_progress_question_id", "ix_user_progress_user_updated_at"):
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+        print(f"📊 Populando user_progress com {n_rows:,} linhas...")
+        start = time.perf_counter()
+        per_user = seed(engine, n_rows)
+        print(f"   {time.perf_counter() - start:.1f}s\n")
+
+        keys = [(f"u{u}", f"q{u}-{random.randrange(per_user)}") for u in random.choices(range(USERS), k=LOOKUPS)]
+
+        print("🔍 Buscas por (user_id, question_id):")
+        report("sem índice", time_lookups(engine, keys[:50]))  # seq scans are slow; sample fewer
+
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX ux_user_progress_user_question ON user_progress (user_id, question_id)"
+            ))
+        report("com índice", time_lookups(engine, keys))
+        engine.dispose()
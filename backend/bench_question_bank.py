@@ -0,0 +1,102 @@
+"""
+Benchmark do banco de questões compartilhado: vários usuários importam o mesmo arquivo
+(mesmas questões, ids próprios) num SQLite temporário, pelo caminho normal de importação
+(quiz_service.bulk_insert_questions, com índice de busca), comparado com cada usuário
+importando um arquivo diferente.
+
+Com o mesmo arquivo, o primeiro usuário grava o conteúdo e os seguintes só gravam
+referências; com arquivos distintos cada importação grava tudo, como acontecia com
+qualquer importação antes do banco compartilhado.
+
+Uso: python -m backend.bench_question_bank [usuários] [questões]   (padrão: 20 usuários, 1.000 questões)
+"""
+import sys
+import os
+import statistics
+import tempfile
+import time
+import uuid
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from backend import models, quiz_service, schemas, search_service
+
+
+def isaca_file(n: int, edition: str = "") -> list:
+    """An exam file as (text, label, explanation, [(label, text)]); another edition has other content"""
+    return [
+        (
+            f"Qual é a PRINCIPAL responsabilidade do gerente de segurança da informação no cenário {i}{edition}?",
+            "B",
+            f"A governança de segurança deve estar alinhada aos objetivos do negócio (cenário {i}).",
+            [(label, f"Alternativa {label} do cenário {i} sobre riscos e controles") for label in "ABCD"],
+        )
+        for i in range(n)
+    ]
+
+
+def user_questions(exam: list) -> list:
+    """The file as one user's client uploads it: same content, fresh question/option ids"""
+    return [
+        schemas.QuestionCreate(
+            id=str(uuid.uuid4()),
+            text=question_text,
+            correct_answer_label=label,
+            explanation=explanation,
+            options=[schemas.Option(id=str(uuid.uuid4()), label=opt_label, text=opt_text) for opt_label, opt_text in options]
+        )
+        for question_text, label, explanation, options in exam
+    ]
+
+
+def run(n_users: int, n_questions: int, same_file: bool) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), "bank.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    search_service.ensure_schema(engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+
+    timings, growth = [], []
+    for u in range(n_users):
+        user = models.User(username=f"aluno{u}")
+        db.add(user)
+        db.flush()
+        quiz = models.Quiz(title="CISM - Simulado", provider="ISACA", user_id=user.id)
+        db.add(quiz)
+        questions = user_questions(isaca_file(n_questions, "" if same_file else f" (edição {u})"))
+        size_before = os.path.getsize(path)
+        start = time.perf_counter()
+        quiz_service.bulk_insert_questions(db, quiz.id, questions)
+        db.commit()
+        timings.append(time.perf_counter() - start)
+        growth.append(os.path.getsize(path) - size_before)
+
+    result = {
+        "import_ms": statistics.mean(timings) * 1000,
+        "growth_kb": statistics.mean(growth) / 1024,
+        "size_mb": os.path.getsize(path) / 1024 / 1024,
+        "contents": db.query(func.count(models.QuestionContent.hash)).scalar(),
+    }
+    db.close()
+    engine.dispose()
+    return result
+
+
+def report(name: str, r: dict):
+    print(f"   {name:<26} importação {r['import_ms']:6.0f} ms/usuário   +{r['growth_kb']:6.0f} KB/usuário   "
+          f"banco {r['size_mb']:5.1f} MB   {r['contents']:,} conteúdos")
+
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_questions = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f"📚 {n_users} usuários importando {n_questions:,} questões cada (SQLite, com índice de busca)\n")
+    # Distinct files store everything per user, which is what every import cost before the shared bank
+    report("arquivos distintos", run(n_users, n_questions, same_file=False))
+    report("mesmo arquivo", run(n_users, n_questions, same_file=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark de importação de questões: caminho antigo (um objeto ORM por questão)
+versus quiz_service.bulk_insert_questions (executemany / COPY).
+
+Roda sempre num SQLite temporário. Para incluir PostgreSQL, defina
+BENCH_DATABASE_URL apontando para um banco DESCARTÁVEL (as tabelas são criadas
+e as linhas do benchmark removidas no final).
+
+Uso: python -m backend.bench_quiz_import [questões]   (padrão: 10.000)
+"""
+import sys
+import os
+import tempfile
+import time
+import uuid
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import models, schemas, quiz_service, search_service
+
+
+def make_questions(n: int) -> list:
+    return [
+        schemas.QuestionCreate(
+            id=str(uuid.uuid4()),
+            text=f"Qual é a PRINCIPAL responsabilidade do gerente de segurança da informação? ({i})",
+            correct_answer_label="B",
+            explanation="A governança de segurança deve estar alinhada aos objetivos do negócio.\nISACA mindset.",
+            options=[
+                schemas.Option(id=str(uuid.uuid4()), label=label, text=f"Opção {label} da questão {i}")
+                for label in "ABCD"
+            ]
+        )
+        for i in range(n)
+    ]
+
+
+def orm_import(db, quiz_id: str, questions: list):
+    contents = {}
+    for position, q in enumerate(questions):
+        options = [{"label": opt.label, "text": opt.text} for opt in q.options]
+        key = models.create_content_key(q.text, q.correct_answer_label, q.explanation, options)
+        if key not in contents:
+            contents[key] = models.QuestionContent(
+                hash=key, text=q.text, correct_answer_label=q.correct_answer_label,
+                explanation=q.explanation, options=options
+            )
+            db.add(contents[key])
+        db.add(models.Question(
+            id=q.id,
+            quiz_id=quiz_id,
+            position=position,
+            content=contents[key],
+            option_ids=[opt.id for opt in q.options],
+            content_hash=models.create_question_hash(q.text)
+        ))
+
+
+def bulk_import(db, quiz_id: str, questions: list):
+    quiz_service.bulk_insert_questions(db, quiz_id, questions)
+
+
+def run(label: str, url: str, n: int):
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    search_service.ensure_schema(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    print(f"\n🗄️  {label}")
+    for name, importer in [("ORM (antigo)", orm_import), ("bulk", bulk_import)]:
+        db = Session()
+        user = models.User(username=f"bench-{uuid.uuid4().hex[:8]}")
+        db.add(user)
+        db.flush()
+        quiz = models.Quiz(title="Bench", user_id=user.id)
+        db.add(quiz)
+        db.flush()
+
+        questions = make_questions(n)
+        start = time.perf_counter()
+        importer(db, quiz.id, questions)
+        db.commit()
+        elapsed = time.perf_counter() - start
+
+        count = db.query(models.Question).filter(models.Question.quiz_id == quiz.id).count()
+        assert count == n, f"{count} != {n}"
+        print(f"   {name:<14} {n:,} questões em {elapsed:.2f}s ({n / elapsed:,.0f}/s)")
+
+        db.query(models.Question).filter(models.Question.quiz_id == quiz.id).delete(synchronize_session=False)
+        quiz_service.prune_orphan_content(db)  # The next importer starts from an empty bank
+        db.delete(quiz)
+        db.delete(user)
+        db.commit()
+        db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print(f"📊 Importação de {n:,} questões")
+    with tempfile.TemporaryDirectory() as tmp:
+        run("SQLite", f"sqlite:///{os.path.join(tmp, 'bench.db')}", n)
+
+    pg_url = os.getenv("BENCH_DATABASE_URL")
+    if pg_url:
+        if pg_url.startswith("postgres://"):
+            pg_url = pg_url.replace("postgres://", "postgresql://", 1)
+        run("PostgreSQL", pg_url, n)
+    else:
+        print("\nℹ️  Defina BENCH_DATABASE_URL para incluir PostgreSQL")
@@ -0,0 +1,128 @@
+"""
+Benchmark da busca full-text (search_service) numa base SQLite temporária: indexa N questões
+sintéticas em português pelo caminho normal de importação e mede a latência das buscas,
+comparando com um LIKE sem índice.
+
+Uso: python -m backend.bench_search [questões]   (padrão: 100.000)
+"""
+import sys
+import os
+import random
+import statistics
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker
+
+from backend import models, quiz_service, schemas, search_service
+
+QUIZ_SIZE = 5000
+SEARCHES = 200
+WORDS = (
+    "segurança informação governança risco gestão controle auditoria política conformidade "
+    "continuidade negócio incidente resposta ameaça vulnerabilidade ativo proprietário "
+    "criptografia acesso identidade privilégio monitoramento métrica indicador estratégia "
+    "alinhamento diretoria comitê orçamento fornecedor contrato terceirização nuvem "
+    "recuperação desastre impacto análise avaliação tratamento apetite tolerância programa "
+    "arquitetura padrão procedimento evidência investigação forense treinamento conscientização"
+).split()
+QUERIES = [
+    "segurança da informação", "gestão de riscos", "continuidade", "políticas", "criptografia",
+    "resposta a incidentes", "apetite tolerância", "fornecedores", "auditoria evidência", "governanca",
+]
+DOMAIN_WORD_RATE = 0.15  # Share of tokens drawn from WORDS; the rest is Zipf-distributed filler
+FILLER = [f"termo{i}" for i in range(5000)]
+FILLER_WEIGHTS = [1 / (rank + 1) for rank in range(len(FILLER))]
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    filler = iter(rng.choices(FILLER, weights=FILLER_WEIGHTS, k=n))
+    words = [rng.choice(WORDS) if rng.random() < DOMAIN_WORD_RATE else next(filler) for _ in range(n)]
+    return " ".join(words).capitalize()
+
+
+def make_questions(rng: random.Random, n: int) -> list:
+    return [
+        schemas.QuestionCreate(
+            id=models.generate_uuid(),
+            text=sentence(rng, 18) + "?",
+            correct_answer_label="A",
+            explanation=sentence(rng, 30) + ".",
+            options=[schemas.Option(id=models.generate_uuid(), label=label, text=sentence(rng, 6)) for label in "ABCD"]
+        )
+        for _ in range(n)
+    ]
+
+
+def seed(db, user, n_questions: int, rng: random.Random) -> float:
+    start = time.perf_counter()
+    for offset in range(0, n_questions, QUIZ_SIZE):
+        quiz = models.Quiz(title=f"Bloco {offset // QUIZ_SIZE + 1}", user_id=user.id)
+        db.add(quiz)
+        db.flush()
+        quiz_service.bulk_insert_questions(db, quiz.id, make_questions(rng, min(QUIZ_SIZE, n_questions - offset)))
+        db.commit()
+    return time.perf_counter() - start
+
+
+def like_search(db, user, query: str) -> list:
+    conditions = []
+    for term in search_service.query_terms(query):
+        pattern = f"%{term}%"
+        conditions.append(or_(models.QuestionContent.text.ilike(pattern), models.QuestionContent.explanation.ilike(pattern)))
+    return db.query(models.Question.id).join(models.Quiz).join(models.QuestionContent).filter(
+        models.Quiz.user_id == user.id, *conditions
+    ).limit(20).all()
+
+
+def measure(fn, queries: list) -> list:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return sorted(latencies)
+
+
+def report(name: str, latencies: list):
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"   {name:<28} p50 {statistics.median(latencies):7.1f} ms   p95 {p95:7.1f} ms")
+
+
+def main():
+    n_questions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    path = os.path.join(tempfile.mkdtemp(), "search.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    search_service.ensure_schema(engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+
+    user = models.User(username="bench")
+    db.add(user)
+    db.commit()
+    principal = SimpleNamespace(id=user.id, username=user.username)
+
+    print(f"🔎 Indexando {n_questions} questões (SQLite FTS5, {path})...")
+    elapsed = seed(db, user, n_questions, random.Random(42))
+    print(f"✅ Importação + indexação: {elapsed:.1f}s ({n_questions / elapsed:.0f} questões/s)")
+
+    rng = random.Random(7)
+    queries = [rng.choice(QUERIES) for _ in range(SEARCHES)]
+    print(f"\n📊 {SEARCHES} buscas (20 resultados por página):")
+    report("FTS5 (search_service)", measure(lambda q: search_service.search(db, principal, q, 20, 0), queries))
+    report("FTS5, página 5", measure(lambda q: search_service.search(db, principal, q, 20, 80), queries))
+    report("LIKE sem índice", measure(lambda q: like_search(db, principal, q), queries[:20]))
+
+    results, _ = search_service.search(db, principal, "gestão de riscos", 3, 0)
+    print("\n🏆 Top 3 para 'gestão de riscos':")
+    for question, quiz_title, score, matched_in in results:
+        print(f"   {score:6.2f}  [{quiz_title}] {question.text[:70]}...")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ import datetime
 sys.path.append(os.getcwd())
 
 from backend.database import SessionLocal
-from backend import models
+from backend import models, auth_cache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -47,6 +47,8 @@ def create_admin_user():
             exists.is_premium = True
             exists.is_admin = True
             exists.premium_until = datetime.datetime.utcnow() + datetime.timedelta(days=3650)
+            # Running API workers drop their cached copy of this user
+            auth_cache.invalidate_user(db, exists.id)
             print(f"🔄 Usuário administrador resetado/atualizado: {username}")
         
         db.commit()
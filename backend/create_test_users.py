@@ -7,7 +7,7 @@ from passlib.context import CryptContext
 sys.path.append(os.getcwd())
 
 from backend.database import SessionLocal, engine
-from backend import models
+from backend import models, auth_cache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -50,6 +50,7 @@ def create_test_users():
                 exists.hashed_password = get_password_hash(user_data["password"])
                 exists.full_name = user_data["full_name"]
                 exists.email = user_data["email"]
+                auth_cache.invalidate_user(db, exists.id)
                 print(f"🔄 Usuário resetado/atualizado: {user_data['username']}")
         
         db.commit()
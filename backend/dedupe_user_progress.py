@@ -0,0 +1,62 @@
+"""
+Script para remover linhas duplicadas de user_progress (mesmo usuário e mesma questão)
+e criar o índice único (user_id, question_id) usado pelo upsert de progresso.
+
+Mantém a linha atualizada mais recentemente de cada par e reconstrói os contadores
+de quiz_progress_summary no final (criando a tabela se preciso). Funciona antes ou depois
+de migrate_question_content.py.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from backend.database import engine, SessionLocal
+from backend import progress_service
+from backend.models import QuizProgressSummary
+from sqlalchemy import text
+
+def dedupe():
+    with engine.connect() as conn:
+        try:
+            print("📝 Removendo progressos duplicados...")
+            result = conn.execute(text('''
+                DELETE FROM user_progress WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (
+                            PARTITION BY user_id, question_id
+                            ORDER BY updated_at DESC, id DESC
+                        ) AS rn
+                        FROM user_progress
+                    ) ranked
+                    WHERE rn > 1
+                )
+            '''))
+            print(f"✅ {result.rowcount} linhas duplicadas removidas")
+
+            print("\n📝 Criando índices de user_progress...")
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_user_progress_user_question "
+                "ON user_progress (user_id, question_id)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_user_progress_question_id "
+                "ON user_progress (question_id)"
+            ))
+            conn.commit()
+            print("✅ Índices criados/verificados!")
+        except Exception as e:
+            print(f"❌ Erro: {e}")
+            conn.rollback()
+            return
+
+    print("\n🔄 Reconstruindo contadores de progresso...")
+    QuizProgressSummary.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        written = progress_service.rebuild_summaries(db)
+        print(f"✅ {written} resumos (usuário, quiz) gravados")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    dedupe()
@@ -0,0 +1,144 @@
+"""
+Exam catalog and pre-parsed exam packs.
+
+The catalog (provider -> exams, exam -> bank file) is built once and only rebuilt when
+the mtime of EXAMS_BASE_PATH or one of its provider/exam folders changes. Each bank is
+parsed once into a compact JSON pack, cached on disk (EXAM_PACK_CACHE_DIR) and in an
+in-memory LRU, and identified by an ETag derived from the file's path, size and mtime.
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+
+from . import question_parser
+
+# Bump when question_parser output changes, so stale packs are not served
+PACK_VERSION = 1
+
+_lock = threading.Lock()
+_catalog = None  # {"signature": ..., "structure": {...}, "index": {...}}
+
+
+def get_base_path() -> str:
+    return os.getenv("EXAMS_BASE_PATH", "./data/Testescript")
+
+
+def get_cache_dir() -> str:
+    return os.getenv("EXAM_PACK_CACHE_DIR", "./.exam_packs")
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _signature(base_path: str, folders: list) -> tuple:
+    """mtimes of the base folder and every provider/exam folder seen in the last scan"""
+    return (base_path, _mtime(base_path)) + tuple(_mtime(f) for f in folders)
+
+
+def _scan(base_path: str) -> dict:
+    structure = {}
+    index = {}
+    folders = []
+
+    if os.path.exists(base_path):
+        for provider in sorted(os.listdir(base_path)):
+            provider_path = os.path.join(base_path, provider)
+            if not os.path.isdir(provider_path):
+                continue
+            folders.append(provider_path)
+
+            exams = []
+            for exam in sorted(os.listdir(provider_path)):
+                exam_path = os.path.join(provider_path, exam)
+                if not os.path.isdir(exam_path):
+                    continue
+                folders.append(exam_path)
+                exams.append(exam)
+
+                # First .txt file is the question bank
+                bank = next((f for f in sorted(os.listdir(exam_path)) if f.endswith('.txt')), None)
+                if bank and exam.upper() not in index:
+                    index[exam.upper()] = (os.path.join(exam_path, bank), bank)
+            if exams:
+                structure[provider] = exams
+
+    return {"signature": _signature(base_path, folders), "folders": folders, "structure": structure, "index": index}
+
+
+def get_catalog() -> dict:
+    """Current catalog, rescanning only if a folder mtime changed since the last scan"""
+    global _catalog
+    base_path = get_base_path()
+    with _lock:
+        if _catalog is None or _signature(base_path, _catalog["folders"]) != _catalog["signature"]:
+            _catalog = _scan(base_path)
+            print(f"📚 Exam catalog built: {sum(len(e) for e in _catalog['structure'].values())} exams")
+        return _catalog
+
+
+def list_exams() -> dict:
+    return get_catalog()["structure"]
+
+
+def find_exam_file(exam_name: str):
+    """(file_path, filename) of an exam's bank, matching the folder name exactly or without a '(...)' suffix"""
+    index = get_catalog()["index"]
+    search_name = exam_name.split('(')[0].strip().upper()
+    return index.get(exam_name.upper()) or index.get(search_name) or (None, None)
+
+
+def pack_etag(file_path: str):
+    """ETag for a bank's pack, from a single stat(). None if the file is gone."""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    key = f"{PACK_VERSION}:{os.path.abspath(file_path)}:{st.st_size}:{st.st_mtime_ns}"
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:20] + '"'
+
+
+def _build_pack(file_path: str, filename: str) -> bytes:
+    # Question/option ids are left out: they become primary keys when a quiz is created,
+    # so every client must assign its own
+    questions = []
+    for q in question_parser.iter_questions_from_file(file_path):
+        questions.append({
+            "text": q["text"],
+            "options": [{"label": o["label"], "text": o["text"]} for o in q["options"]],
+            "correct_answer_label": q["correct_answer_label"],
+            "explanation": q["explanation"]
+        })
+    return json.dumps({"filename": filename, "questions": questions}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@lru_cache(maxsize=16)
+def _load_pack(file_path: str, filename: str, etag: str) -> bytes:
+    cache_dir = get_cache_dir()
+    cache_file = os.path.join(cache_dir, etag.strip('"') + ".json")
+    try:
+        with open(cache_file, "rb") as f:
+            return f.read()
+    except OSError:
+        pass
+
+    pack = _build_pack(file_path, filename)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(pack)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"⚠️  Could not write exam pack cache: {e}")
+    return pack
+
+
+def get_pack(file_path: str, filename: str, etag: str) -> bytes:
+    """Pack bytes for a bank: memory LRU, then disk cache, then a fresh parse"""
+    return _load_pack(file_path, filename, etag)
@@ -1,11 +1,50 @@
 import os
 import json
+import random
+import asyncio
 import time
-import requests
-from .schemas import Question
+import uuid
+import httpx
+from collections import deque
+from pydantic import ValidationError
+from .schemas import Question, QuestionCreate
+from . import analysis_cache, rate_limiter
 
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 GROQ_MODEL = "llama-3.3-70b-versatile"
+# Bump when the analysis prompt (or the cache key) changes so cached analyses from the old prompt are not served
+ANALYSIS_PROMPT_VERSION = 2
+# Batched analyses come from another prompt and share one output budget, so they are not
+# interchangeable with single ones: they are cached under their own version (numbered from 1001
+# to stay apart), served only to batch requests, and bumped independently of the single prompt.
+BATCH_ANALYSIS_PROMPT_VERSION = 1001
+ANALYSIS_MAX_TOKENS = 2048  # output cap of the single-question prompt
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0   # seconds, doubled on every retry
+BACKOFF_MAX = 10.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+
+# Batched analysis: rough token accounting (about 4 characters per token)
+BATCH_INPUT_TOKEN_BUDGET = 6000
+# Output tokens reserved per question in a batch. Replaced at startup by calibrate_output_budget
+# from the lengths of cached single-question analyses; this default holds until there are enough.
+ANALYSIS_OUTPUT_TOKENS = int(os.getenv("ANALYSIS_OUTPUT_TOKENS", "900"))
+CALIBRATION_MIN_SAMPLES = 50
+BATCH_MAX_OUTPUT_TOKENS = 4096
+BATCH_CONCURRENCY = 3
+
+# In-flight analyses by cache key, for single-flight coalescing
+_inflight = {}
+metrics = {"upstream_calls": 0, "coalesced": 0, "streams": 0, "batch_calls": 0, "batch_questions": 0, "batch_fallbacks": 0, "batch_truncated": 0}
+# Time to first token of recent streamed analyses, in ms
+_ttft_ms = deque(maxlen=500)
+
+# One pooled keep-alive client per event loop, so TLS handshakes are paid once
+_client = None
+_client_loop = None
 
 def get_api_key():
     api_key = os.getenv("GROQ_API_KEY")
@@ -13,11 +52,47 @@ def get_api_key():
         return None
     return api_key
 
-def call_groq(messages: list, max_tokens: int = 2048) -> str:
-    """Makes a request to the Groq API."""
+def get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(90.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=60.0
+            )
+        )
+        _client_loop = loop
+    return _client
+
+async def close_client():
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    """Full-jitter exponential backoff, honouring Retry-After (seconds) when the server sends it"""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+async def call_groq(messages: list, max_tokens: int = 2048) -> str:
+    """Makes a request to the Groq API without blocking the event loop."""
+    content, _ = await complete_groq(messages, max_tokens)
+    return content
+
+async def complete_groq(messages: list, max_tokens: int = 2048) -> tuple:
+    """(content, finish_reason) of a completion; finish_reason "length" means it was cut at max_tokens"""
     api_key = get_api_key()
     if not api_key:
-        return None
+        return None, None
 
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -33,44 +108,146 @@ def call_groq(messages: list, max_tokens: int = 2048) -> str:
 
     print(f"[Groq] Using model: {GROQ_MODEL}")
 
-    max_retries = 3
-    for attempt in range(max_retries):
+    # Wait for room in Groq's RPM/TPM budget instead of collecting a 429
+    prompt_tokens = estimate_messages_tokens(messages)
+    charged = await rate_limiter.acquire_upstream(prompt_tokens + max_tokens)
+    used = prompt_tokens
+    try:
+        content, total_tokens, finish_reason = await _post_with_retries(headers, payload)
+        if content is not None:
+            used = total_tokens or prompt_tokens + estimate_tokens(content)
+        return content, finish_reason
+    finally:
+        await rate_limiter.refund_tokens(charged - used)
+
+async def _post_with_retries(headers: dict, payload: dict) -> tuple:
+    """(content, total tokens reported by Groq, finish_reason) of a completion, or Nones if still rate limited"""
+    client = get_client()
+    for attempt in range(MAX_RETRIES):
         try:
-            response = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=90)
+            response = await client.post(GROQ_API_URL, headers=headers, json=payload)
             print(f"[Groq] Attempt {attempt+1} - Status: {response.status_code}")
 
-            if response.status_code == 429:
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 5
-                    print(f"[Groq] Rate limited, waiting {wait_time}s...")
-                    time.sleep(wait_time)
+            if response.status_code in RETRY_STATUS_CODES:
+                if attempt < MAX_RETRIES - 1:
+                    wait_time = backoff_delay(attempt, response.headers.get("retry-after"))
+                    print(f"[Groq] Status {response.status_code}, retrying in {wait_time:.1f}s...")
+                    await asyncio.sleep(wait_time)
                     continue
-                else:
-                    return None
+                if response.status_code == 429:
+                    return None, None, None
 
             if response.status_code != 200:
                 print(f"[Groq] Error: {response.text[:500]}")
                 response.raise_for_status()
 
             data = response.json()
-            content = data["choices"][0]["message"]["content"]
+            choice = data["choices"][0]
+            content = choice["message"]["content"]
             print(f"[Groq] Success! {len(content)} chars")
-            return content
+            return content, (data.get("usage") or {}).get("total_tokens"), choice.get("finish_reason")
 
-        except requests.exceptions.HTTPError:
-            raise
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
+        except httpx.TransportError:
+            if attempt < MAX_RETRIES - 1:
+                await asyncio.sleep(backoff_delay(attempt))
                 continue
             raise
 
-    return None
+    return None, None, None
 
 
-def analyze_question(question: Question) -> str:
-    if not get_api_key():
-        return "Erro: GROQ_API_KEY não configurada no servidor."
+class IncompleteStream(Exception):
+    """A streamed completion that did not end with finish_reason "stop" and [DONE]"""
+
+    def __init__(self, finish_reason: str = None):
+        super().__init__(f"Stream ended before completion (finish_reason={finish_reason})")
+        self.finish_reason = finish_reason
+
+
+async def stream_groq(messages: list, max_tokens: int = 2048):
+    """Async generator of content deltas from a streamed (stream: true) chat completion.
+
+    Retries like call_groq, but only before the first token has been yielded. After the last
+    delta, raises IncompleteStream if the completion was cut at max_tokens or the stream was
+    dropped before [DONE], so callers can tell a partial text from a finished one.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "stream": True
+    }
+
+    prompt_tokens = estimate_messages_tokens(messages)
+    charged = await rate_limiter.acquire_upstream(prompt_tokens + max_tokens)
+    streamed_chars = 0
+    try:
+        async for delta in _stream_with_retries(headers, payload):
+            streamed_chars += len(delta)
+            yield delta
+    finally:
+        await rate_limiter.refund_tokens(charged - prompt_tokens - streamed_chars // 4)
+
+async def _stream_with_retries(headers: dict, payload: dict):
+    client = get_client()
+    yielded = False
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with client.stream("POST", GROQ_API_URL, headers=headers, json=payload) as response:
+                print(f"[Groq] Stream attempt {attempt+1} - Status: {response.status_code}")
+                if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES - 1:
+                    wait_time = backoff_delay(attempt, response.headers.get("retry-after"))
+                    print(f"[Groq] Status {response.status_code}, retrying in {wait_time:.1f}s...")
+                    await asyncio.sleep(wait_time)
+                    continue
+
+                if response.status_code != 200:
+                    await response.aread()
+                    print(f"[Groq] Error: {response.text[:500]}")
+                    response.raise_for_status()
+
+                finish_reason = None
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        if finish_reason != "stop":
+                            raise IncompleteStream(finish_reason)
+                        return
+                    choices = json.loads(data).get("choices") or []
+                    if not choices:
+                        continue
+                    finish_reason = choices[0].get("finish_reason") or finish_reason
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yielded = True
+                        yield delta
+                raise IncompleteStream(finish_reason)
+
+        except httpx.TransportError:
+            if yielded:
+                # Retrying would repeat the text already sent
+                raise IncompleteStream()
+            if attempt < MAX_RETRIES - 1:
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            raise
+
 
+ANALYSIS_SYSTEM_PROMPT = "Você é um consultor sênior de segurança da informação e privacidade de dados, certificado pela ISACA (CISM, CISA, CRISC) e CompTIA (Security+, CySA+, CASP+). Você possui mais de 15 anos de experiência em governança de TI, gestão de riscos e conformidade regulatória. Ao analisar questões do exame CISM, você aplica o mindset da ISACA — priorizando governança, alinhamento estratégico com o negócio e gestão de riscos sobre soluções puramente técnicas. Responda sempre em Português do Brasil, de forma clara, objetiva e didática, como se estivesse mentorando um profissional que se prepara para a certificação CISM."
+
+def build_analysis_messages(question: Question) -> list:
     prompt = f"""Analyze this CISM exam question. Explain the correct answer and why other options are incorrect.
 
 Question: {question.text}
@@ -83,34 +260,303 @@ Correct Answer: {question.correct_answer_label}
 Existing Explanation: {question.explanation or "None provided"}
 
 Provide a concise analysis focusing on the ISACA mindset."""
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+async def single_flight(key, factory):
+    """Run factory() once per key at a time: concurrent callers with the same key await the same call.
+
+    The shared call is shielded, so a caller disconnecting does not cancel it for the others.
+    """
+    loop = asyncio.get_running_loop()
+    task = _inflight.get(key)
+    if task is None or task.get_loop() is not loop:
+        metrics["upstream_calls"] += 1
+        task = loop.create_task(factory())
+        _inflight[key] = task
+
+        def _done(t):
+            if _inflight.get(key) is t:
+                del _inflight[key]
+            if not t.cancelled():
+                t.exception()  # Mark retrieved even if every caller went away
+
+        task.add_done_callback(_done)
+    else:
+        metrics["coalesced"] += 1
+    return await asyncio.shield(task)
+
+async def _fetch_analysis(cache_key: tuple, messages: list):
+    result, finish_reason = await complete_groq(messages, ANALYSIS_MAX_TOKENS)
+    # Only complete analyses are cached, never truncated ones or the error messages in analyze_question
+    if result is not None and finish_reason != "length":
+        await analysis_cache.astore(cache_key, result)
+    return result
+
+async def analyze_question(question: Question) -> str:
+    if not get_api_key():
+        return "Erro: GROQ_API_KEY não configurada no servidor."
+
+    cache_key = analysis_cache.make_key(question, ANALYSIS_PROMPT_VERSION, GROQ_MODEL)
+    cached = await analysis_cache.alookup(cache_key)
+    if cached is not None:
+        return cached
 
     try:
-        messages = [
-            {"role": "system", "content": "Você é um consultor sênior de segurança da informação e privacidade de dados, certificado pela ISACA (CISM, CISA, CRISC) e CompTIA (Security+, CySA+, CASP+). Você possui mais de 15 anos de experiência em governança de TI, gestão de riscos e conformidade regulatória. Ao analisar questões do exame CISM, você aplica o mindset da ISACA — priorizando governança, alinhamento estratégico com o negócio e gestão de riscos sobre soluções puramente técnicas. Responda sempre em Português do Brasil, de forma clara, objetiva e didática, como se estivesse mentorando um profissional que se prepara para a certificação CISM."},
-            {"role": "user", "content": prompt}
-        ]
-        result = call_groq(messages)
+        messages = build_analysis_messages(question)
+        # Study group members analyzing the same question together share one upstream call
+        result = await single_flight(cache_key, lambda: _fetch_analysis(cache_key, messages))
         if result is None:
             return "Erro: Limite de requisições excedido. Aguarde e tente novamente."
         return result
-    except requests.exceptions.HTTPError as e:
-        status_code = e.response.status_code if e.response is not None else 0
+    except Exception as e:
+        return analysis_error_message(e)
+
+def analysis_error_message(e: Exception) -> str:
+    """User-facing message for a failed analysis"""
+    if isinstance(e, IncompleteStream):
+        print(f"Groq stream incomplete: {e}")
+        return "Erro: A análise foi interrompida antes do fim. Tente novamente."
+    if isinstance(e, rate_limiter.RateLimitExceeded):
+        return "Erro: Limite de requisições excedido. Aguarde e tente novamente."
+    if isinstance(e, httpx.HTTPStatusError):
+        status_code = e.response.status_code
         print(f"Groq API Error ({status_code}): {e}")
         if status_code == 401:
             return "Erro: A chave API do Groq é inválida."
         if status_code == 429:
             return "Erro: Limite de requisições excedido. Aguarde e tente novamente."
         return f"IA Temporariamente indisponível: {e}"
-    except requests.exceptions.Timeout:
+    if isinstance(e, httpx.TimeoutException):
         return "Erro: A requisição expirou. Tente novamente."
+    print(f"Groq API Error: {e}")
+    return f"IA Temporariamente indisponível: {e}"
+
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_analysis(question: Question):
+    """Server-Sent Events for an analysis: {"delta"} messages, then a "done" or "error" event.
+
+    Cached analyses are sent as a single delta. Only a stream that finished normally is stored in
+    the analysis cache; one cut at max_tokens or dropped midway ends with an "error" event.
+    """
+    if not get_api_key():
+        yield sse_event({"detail": "Erro: GROQ_API_KEY não configurada no servidor."}, "error")
+        return
+
+    cache_key = analysis_cache.make_key(question, ANALYSIS_PROMPT_VERSION, GROQ_MODEL)
+    cached = await analysis_cache.alookup(cache_key)
+    if cached is not None:
+        yield sse_event({"delta": cached})
+        yield sse_event({"cached": True}, "done")
+        return
+
+    metrics["streams"] += 1
+    started = time.perf_counter()
+    parts = []
+    try:
+        async for delta in stream_groq(build_analysis_messages(question), ANALYSIS_MAX_TOKENS):
+            if not parts:
+                _ttft_ms.append((time.perf_counter() - started) * 1000)
+            parts.append(delta)
+            yield sse_event({"delta": delta})
     except Exception as e:
-        print(f"Groq API Error: {e}")
-        return f"IA Temporariamente indisponível: {e}"
+        yield sse_event({"detail": analysis_error_message(e)}, "error")
+        return
+
+    if not parts:
+        yield sse_event({"detail": "Erro: Limite de requisições excedido. Aguarde e tente novamente."}, "error")
+        return
+    await analysis_cache.astore(cache_key, "".join(parts))
+    yield sse_event({"cached": False}, "done")
+
+def stats() -> dict:
+    """Upstream call counters and time-to-first-token percentiles of streamed analyses"""
+    samples = sorted(_ttft_ms)
+    result = dict(metrics)
+    result["ttft_samples"] = len(samples)
+    result["ttft_p50_ms"] = round(samples[len(samples) // 2], 1) if samples else None
+    result["ttft_p95_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1) if samples else None
+    return result
+
+def calibrate_output_budget(lengths: list) -> int:
+    """Size the per-question batch output budget from single-question analysis lengths (characters).
+
+    Uses the 95th percentile plus a 20% margin and the JSON wrapping, capped at the single
+    prompt's own limit. With fewer than CALIBRATION_MIN_SAMPLES lengths the budget is kept.
+    """
+    global ANALYSIS_OUTPUT_TOKENS
+    if len(lengths) >= CALIBRATION_MIN_SAMPLES:
+        p95 = sorted(lengths)[int(len(lengths) * 0.95)]
+        ANALYSIS_OUTPUT_TOKENS = min(ANALYSIS_MAX_TOKENS, int((p95 // 4 + 1) * 1.2) + 20)
+    return ANALYSIS_OUTPUT_TOKENS
+
+def strip_code_fences(text: str) -> str:
+    if "```json" in text:
+        return text.split("```json")[1].split("```")[0].strip()
+    if "```" in text:
+        return text.split("```")[1].split("```")[0].strip()
+    return text
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def estimate_messages_tokens(messages: list) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+def format_question_for_prompt(question: Question) -> str:
+    return f"""Question: {question.text}
+
+Options:
+{chr(10).join([f"{opt.label}) {opt.text}" for opt in question.options])}
+
+Correct Answer: {question.correct_answer_label}
+
+Existing Explanation: {question.explanation or "None provided"}"""
+
+def pack_batches(questions: list) -> list:
+    """Greedily split questions into batches that fit the input token budget and the output token cap"""
+    per_batch = max(1, BATCH_MAX_OUTPUT_TOKENS // ANALYSIS_OUTPUT_TOKENS)
+    batches = []
+    current, current_tokens = [], 0
+    for question in questions:
+        tokens = estimate_tokens(format_question_for_prompt(question))
+        if current and (current_tokens + tokens > BATCH_INPUT_TOKEN_BUDGET or len(current) >= per_batch):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(question)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_messages(questions: list) -> list:
+    blocks = "\n\n".join(f"[{i}]\n{format_question_for_prompt(q)}" for i, q in enumerate(questions))
+    prompt = f"""Analyze each of the following {len(questions)} CISM exam questions. For each one, explain the correct answer and why the other options are incorrect, focusing on the ISACA mindset.
+
+Return ONLY a valid JSON object, without markdown, in this format:
+{{"analyses": [{{"index": 0, "analysis": "..."}}]}}
+
+{blocks}"""
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def _complete_items(text: str) -> list:
+    """The objects of the "analyses" array that arrived whole in a completion cut off mid-JSON"""
+    start = text.find("[", text.find('"analyses"'))
+    if start < 0:
+        return []
+    decoder = json.JSONDecoder()
+    items = []
+    position = start + 1
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except ValueError:
+            return items
+        items.append(item)
+
+def parse_batch_analyses(text: str, size: int, truncated: bool = False) -> dict:
+    """{index: analysis} from a batch completion; indexes that are missing or malformed are left out.
+
+    A truncated completion (finish_reason "length") keeps the analyses that were finished.
+    """
+    try:
+        data = json.loads(strip_code_fences(text))
+    except (TypeError, ValueError):
+        if not truncated or not isinstance(text, str):
+            return {}
+        data = {"analyses": _complete_items(text)}
+    items = data.get("analyses") if isinstance(data, dict) else data
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        index, analysis = item.get("index"), item.get("analysis")
+        if isinstance(index, int) and 0 <= index < size and isinstance(analysis, str) and analysis.strip():
+            results[index] = analysis.strip()
+    return results
 
-def generate_quiz(difficulty: str = "Médio", count: int = 5) -> str:
+async def _analyze_batch(batch: list, keys: list) -> dict:
+    """{position in batch: analysis} for one batched call; failures give an empty dict"""
+    metrics["batch_calls"] += 1
+    metrics["batch_questions"] += len(batch)
+    try:
+        text, finish_reason = await complete_groq(build_batch_messages(batch), max_tokens=min(BATCH_MAX_OUTPUT_TOKENS, len(batch) * ANALYSIS_OUTPUT_TOKENS))
+    except Exception as e:
+        print(f"[Groq] Batch analysis failed: {e}")
+        return {}
+    truncated = finish_reason == "length"
+    if truncated:
+        metrics["batch_truncated"] += 1
+    results = parse_batch_analyses(text, len(batch), truncated) if text else {}
+    for i, analysis in results.items():
+        await analysis_cache.astore(keys[i], analysis)
+    return results
+
+async def analyze_questions(questions: list, before_upstream=None) -> dict:
+    """Analyses for many questions, {question id: analysis}, using as few LLM calls as possible.
+
+    Cached analyses are reused, identical questions are analyzed once, and the rest are packed
+    into batched prompts. Questions a batch fails to answer fall back to analyze_question.
+    before_upstream, if given, is awaited with the number of questions left to analyze before
+    any LLM call is made (the endpoint charges the user's rate limit there).
+    """
     if not get_api_key():
-        return "Erro: GROQ_API_KEY não configurada."
+        return {q.id: "Erro: GROQ_API_KEY não configurada no servidor." for q in questions}
+
+    by_key = {}
+    for question in questions:
+        key = analysis_cache.make_key(question, BATCH_ANALYSIS_PROMPT_VERSION, GROQ_MODEL)
+        by_key.setdefault(key, []).append(question)
+
+    analyses = {}
+    missing = []
+    for key, group in by_key.items():
+        # A single-question analysis is at least as good as a batched one
+        cached = await analysis_cache.alookup(analysis_cache.make_key(group[0], ANALYSIS_PROMPT_VERSION, GROQ_MODEL))
+        if cached is None:
+            cached = await analysis_cache.alookup(key)
+        if cached is not None:
+            analyses[key] = cached
+        else:
+            missing.append((key, group[0]))
+
+    if before_upstream is not None:
+        await before_upstream(len(missing))
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    key_by_id = {question.id: key for key, question in missing}
 
+    async def run(batch):
+        async with semaphore:
+            keys = [key_by_id[q.id] for q in batch]
+            results = await _analyze_batch(batch, keys)
+            for i, question in enumerate(batch):
+                if i in results:
+                    analyses[keys[i]] = results[i]
+                else:
+                    metrics["batch_fallbacks"] += 1
+                    analyses[keys[i]] = await analyze_question(question)
+
+    await asyncio.gather(*[run(batch) for batch in pack_batches([q for _, q in missing])])
+
+    return {question.id: analyses[key] for key, group in by_key.items() for question in group}
+
+GENERATION_SYSTEM_PROMPT = "Você é um consultor sênior de segurança da informação certificado pela ISACA (CISM, CISA) e CompTIA (Security+, CySA+). Gere questões realistas no estilo oficial do exame CISM da ISACA, focando em cenários práticos de governança de segurança, gestão de riscos, gestão de programas de segurança e gestão de incidentes. As questões devem refletir o mindset da ISACA, priorizando governança e alinhamento estratégico. Retorne APENAS arrays JSON válidos, sem formatação markdown."
+GENERATION_MAX_TOKENS = 4096
+# Extra requests for questions a completion failed to deliver
+GENERATION_MAX_ROUNDS = 3
+
+def build_generation_messages(difficulty: str, count: int) -> list:
     prompt = f"""Gerar {count} questões de simulação para o exame ISACA CISM em nível de dificuldade "{difficulty}".
 
 Regras:
@@ -132,20 +578,103 @@ Estrutura do JSON:
     "explanation": "Explicação detalhada baseada no CISM"
   }}
 ]"""
+    return [
+        {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+class JSONObjectStream:
+    """Incrementally extracts top-level JSON objects from streamed text.
+
+    Only braces outside strings are tracked, so markdown fences, the enclosing array and
+    anything between objects are ignored, and a truncated trailing object is simply never
+    completed. Objects that are not valid JSON are skipped.
+    """
 
+    def __init__(self):
+        self.buffer = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> list:
+        objects = []
+        for char in text:
+            if self.depth == 0:
+                if char == "{":
+                    self.depth = 1
+                    self.buffer = [char]
+                continue
+
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        objects.append(json.loads("".join(self.buffer)))
+                    except ValueError:
+                        print("Skipping malformed generated object")
+                    self.buffer = []
+        return objects
+
+def to_question_create(item) -> QuestionCreate:
+    """QuestionCreate from a generated item, with fresh ids, or None if it doesn't match the schema"""
+    if not isinstance(item, dict):
+        return None
     try:
-        messages = [
-            {"role": "system", "content": "Você é um consultor sênior de segurança da informação certificado pela ISACA (CISM, CISA) e CompTIA (Security+, CySA+). Gere questões realistas no estilo oficial do exame CISM da ISACA, focando em cenários práticos de governança de segurança, gestão de riscos, gestão de programas de segurança e gestão de incidentes. As questões devem refletir o mindset da ISACA, priorizando governança e alinhamento estratégico. Retorne APENAS arrays JSON válidos, sem formatação markdown."},
-            {"role": "user", "content": prompt}
-        ]
-        text = call_groq(messages, max_tokens=4096)
-        if text is None:
-            return "[]"
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-        return text
-    except Exception as e:
-        print(f"Groq Generation Error: {e}")
-        return "[]"
+        return QuestionCreate(
+            id=str(uuid.uuid4()),
+            text=item.get("text"),
+            options=[{**opt, "id": str(uuid.uuid4())} for opt in item.get("options") or [] if isinstance(opt, dict)],
+            correct_answer_label=item.get("correct_answer_label"),
+            explanation=item.get("explanation")
+        )
+    except ValidationError as e:
+        print(f"Skipping invalid generated question: {e.errors()[:1]}")
+        return None
+
+async def stream_generated_questions(difficulty: str = "Médio", count: int = 5):
+    """Yield valid generated questions as soon as each one is complete in the stream.
+
+    When a completion ends with fewer than `count` valid questions (malformed or truncated
+    items), only the missing number is requested again, up to GENERATION_MAX_ROUNDS times.
+    """
+    if not get_api_key():
+        return
+
+    delivered = 0
+    for round_number in range(GENERATION_MAX_ROUNDS):
+        missing = count - delivered
+        if missing <= 0:
+            return
+        if round_number:
+            print(f"[Groq] Requesting {missing} missing generated questions")
+
+        parser = JSONObjectStream()
+        try:
+            async for delta in stream_groq(build_generation_messages(difficulty, missing), max_tokens=GENERATION_MAX_TOKENS):
+                for item in parser.feed(delta):
+                    question = to_question_create(item)
+                    if question is not None and delivered < count:
+                        delivered += 1
+                        yield question
+        except IncompleteStream as e:
+            # Items that arrived whole were kept; the next round asks for the rest
+            print(f"Groq Generation stream incomplete: {e}")
+        except Exception as e:
+            print(f"Groq Generation Error: {e}")
+            return
+
+async def generate_questions(difficulty: str = "Médio", count: int = 5) -> list:
+    return [q async for q in stream_generated_questions(difficulty, count)]
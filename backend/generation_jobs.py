@@ -0,0 +1,250 @@
+"""
+Background AI quiz generation.
+
+Jobs live in the generation_jobs table, so they survive restarts and can be polled from
+any worker process. GENERATION_WORKERS asyncio tasks per process claim pending jobs with a
+conditional UPDATE (race-free across processes), run the LLM call on the pooled async client
+and store the questions, optionally saving them into a new quiz through the bulk insert path.
+Running jobs refresh started_at as a heartbeat; jobs left "running" by a dead process are
+re-queued after JOB_TIMEOUT. Every write a worker makes is conditional on it still holding
+the claim (status running, same attempt), so a worker that was re-queued behind can't finish
+the job a second time.
+"""
+import asyncio
+import datetime
+import os
+
+from sqlalchemy import update
+from starlette.concurrency import run_in_threadpool
+
+from . import models, gemini_service, quiz_service
+from .database import SessionLocal
+
+WORKERS = int(os.getenv("GENERATION_WORKERS", "2"))
+POLL_INTERVAL = 5.0  # seconds; picks up jobs submitted to other processes
+JOB_TIMEOUT = datetime.timedelta(seconds=300)
+HEARTBEAT_INTERVAL = JOB_TIMEOUT.total_seconds() / 5
+MAX_ATTEMPTS = 2
+
+TERMINAL_STATUSES = ("done", "failed")
+
+_tasks = []
+_wakeup = None
+_loop = None
+
+
+def submit(db, user_id: str, difficulty: str, count: int, quiz_title: str = None, quiz_description: str = None):
+    job = models.GenerationJob(
+        user_id=user_id,
+        difficulty=difficulty,
+        count=count,
+        quiz_title=quiz_title,
+        quiz_description=quiz_description
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    # Submissions come from threadpool endpoints: wake a worker on its own loop
+    if _loop is not None and _wakeup is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+    return job
+
+
+def requeue_stale() -> int:
+    """Put jobs whose worker died back in the queue, or fail them after MAX_ATTEMPTS"""
+    cutoff = datetime.datetime.utcnow() - JOB_TIMEOUT
+    table = models.GenerationJob
+    db = SessionLocal()
+    try:
+        stale = (table.status == "running", table.started_at < cutoff)
+        requeued = db.execute(
+            update(table).where(*stale, table.attempts < MAX_ATTEMPTS).values(status="pending")
+        ).rowcount
+        db.execute(
+            update(table).where(*stale).values(
+                status="failed", error="Tempo esgotado na geração.", finished_at=datetime.datetime.utcnow()
+            )
+        )
+        db.commit()
+        return requeued
+    finally:
+        db.close()
+
+
+def _claim_next():
+    """Mark the oldest pending job as running and return it, or None if the queue is empty"""
+    table = models.GenerationJob
+    db = SessionLocal()
+    try:
+        while True:
+            job_id = db.query(table.id).filter(table.status == "pending").order_by(table.created_at).limit(1).scalar()
+            if job_id is None:
+                return None
+            claimed = db.execute(
+                update(table)
+                .where(table.id == job_id, table.status == "pending")
+                .values(status="running", started_at=datetime.datetime.utcnow(), attempts=table.attempts + 1)
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.get(table, job_id)
+            # Another worker took it first; try the next one
+    finally:
+        db.close()
+
+
+class ClaimLost(Exception):
+    """The job was re-queued or finished by someone else while this worker was running it"""
+
+
+def _owned(job) -> tuple:
+    """WHERE clauses matching the job only while this worker's claim on it is still current"""
+    table = models.GenerationJob
+    return (table.id == job.id, table.status == "running", table.attempts == job.attempts)
+
+
+def _heartbeat(job) -> bool:
+    db = SessionLocal()
+    try:
+        owned = db.execute(
+            update(models.GenerationJob).where(*_owned(job)).values(started_at=datetime.datetime.utcnow())
+        ).rowcount
+        db.commit()
+        return owned == 1
+    finally:
+        db.close()
+
+
+def _save_partial(job, questions: list) -> bool:
+    db = SessionLocal()
+    try:
+        owned = db.execute(
+            update(models.GenerationJob).where(*_owned(job)).values(
+                questions=[q.model_dump() for q in questions],
+                started_at=datetime.datetime.utcnow()
+            )
+        ).rowcount
+        db.commit()
+        return owned == 1
+    finally:
+        db.close()
+
+
+def _complete(job, questions: list) -> bool:
+    """Mark the job done and create its quiz in one transaction, only if the claim is still ours"""
+    table = models.GenerationJob
+    db = SessionLocal()
+    try:
+        owned = db.execute(
+            update(table).where(*_owned(job)).values(
+                status="done",
+                questions=[q.model_dump() for q in questions],
+                error=None,
+                finished_at=datetime.datetime.utcnow()
+            )
+        ).rowcount
+        if owned != 1:
+            db.rollback()
+            return False
+
+        if job.quiz_title:
+            quiz = models.Quiz(
+                title=job.quiz_title,
+                description=job.quiz_description,
+                provider="ISACA",
+                user_id=job.user_id
+            )
+            db.add(quiz)
+            db.flush()
+            quiz_service.bulk_insert_questions(db, quiz.id, questions)
+            db.execute(update(table).where(table.id == job.id).values(quiz_id=quiz.id))
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def _fail(job, error: str) -> bool:
+    retry = job.attempts < MAX_ATTEMPTS
+    values = {"status": "pending", "error": error} if retry else {
+        "status": "failed", "error": error, "finished_at": datetime.datetime.utcnow()
+    }
+    db = SessionLocal()
+    try:
+        owned = db.execute(update(models.GenerationJob).where(*_owned(job)).values(**values)).rowcount
+        db.commit()
+        return owned == 1
+    finally:
+        db.close()
+
+
+async def _keep_alive(job):
+    """Refresh started_at while the LLM call runs, so long generations aren't taken for dead workers"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        if not await run_in_threadpool(_heartbeat, job):
+            return
+
+
+async def _run(job):
+    print(f"🤖 Generation job {job.id}: {job.count} questions ({job.difficulty}), attempt {job.attempts}")
+    heartbeat = asyncio.create_task(_keep_alive(job))
+    try:
+        questions = []
+        # Questions are parsed as they stream in and saved on the job, so polling shows progress
+        async for question in gemini_service.stream_generated_questions(job.difficulty, job.count):
+            questions.append(question)
+            if not await run_in_threadpool(_save_partial, job, questions):
+                raise ClaimLost()
+        if not questions:
+            raise ValueError("A IA não retornou questões válidas.")
+        if not await run_in_threadpool(_complete, job, questions):
+            raise ClaimLost()
+        print(f"✅ Generation job {job.id} done: {len(questions)} questions")
+    except ClaimLost:
+        print(f"⚠️ Generation job {job.id}: attempt {job.attempts} was superseded, result discarded")
+    except Exception as e:
+        print(f"❌ Generation job {job.id} failed: {e}")
+        await run_in_threadpool(_fail, job, str(e))
+    finally:
+        heartbeat.cancel()
+
+
+async def _worker():
+    while True:
+        try:
+            _wakeup.clear()
+            job = await run_in_threadpool(_claim_next)
+            if job is not None:
+                await _run(job)
+                continue
+            try:
+                await asyncio.wait_for(_wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                await run_in_threadpool(requeue_stale)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Generation worker error: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+async def start():
+    global _wakeup, _loop
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    requeued = await run_in_threadpool(requeue_stale)
+    if requeued:
+        print(f"🔄 Re-queued {requeued} interrupted generation jobs")
+    for _ in range(WORKERS):
+        _tasks.append(asyncio.create_task(_worker()))
+
+
+async def stop():
+    global _wakeup, _loop
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _wakeup = None
+    _loop = None
@@ -0,0 +1,115 @@
+"""
+Google ID-token verification with cached signing keys.
+
+Google's JWKS is fetched over a pooled HTTP client and kept for as long as its
+Cache-Control max-age allows, so logins verify signatures locally instead of re-downloading
+the certificates every time. A token signed with an unknown key id triggers one early
+refresh (at most every MIN_REFRESH_INTERVAL seconds), which covers Google rotating keys
+before our copy expires.
+"""
+import os
+import re
+import threading
+import time
+
+import httpx
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+ALGORITHMS = ["RS256"]
+DEFAULT_MAX_AGE = 3600  # seconds, when the response has no usable Cache-Control
+MIN_REFRESH_INTERVAL = 30.0
+CLOCK_SKEW = 10  # seconds
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def cache_max_age(cache_control: str) -> int:
+    if not cache_control or "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class GoogleTokenVerifier:
+    def __init__(self, certs_url: str = GOOGLE_CERTS_URL, client: httpx.Client = None):
+        self.certs_url = certs_url
+        self.client = client
+        self._lock = threading.Lock()
+        self._keys = {}  # kid -> constructed public key
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self.metrics = {"verified": 0, "fetches": 0}
+
+    def _get_client(self) -> httpx.Client:
+        if self.client is None:
+            self.client = httpx.Client(timeout=10.0)
+        return self.client
+
+    def _fetch(self):
+        response = self._get_client().get(self.certs_url)
+        response.raise_for_status()
+        keys = {}
+        for key_data in response.json().get("keys", []):
+            keys[key_data["kid"]] = jwk.construct(key_data, key_data.get("alg", ALGORITHMS[0]))
+        now = time.monotonic()
+        self._keys = keys
+        self._expires_at = now + cache_max_age(response.headers.get("cache-control"))
+        self._last_fetch = now
+        self.metrics["fetches"] += 1
+
+    def _get_key(self, kid: str):
+        with self._lock:
+            now = time.monotonic()
+            expired = now >= self._expires_at
+            # An unknown kid may be a key Google rotated in after our last fetch
+            unknown = kid not in self._keys and now - self._last_fetch >= MIN_REFRESH_INTERVAL
+            if expired or unknown:
+                try:
+                    self._fetch()
+                except httpx.HTTPError as e:
+                    if not self._keys:
+                        raise
+                    # Keep verifying with the keys we have rather than failing every login
+                    print(f"⚠️ Could not refresh Google certs, using cached keys: {e}")
+                    self._expires_at = now + MIN_REFRESH_INTERVAL
+                    self._last_fetch = now
+            return self._keys.get(kid)
+
+    def verify(self, token: str, audience: str) -> dict:
+        """Claims of a valid Google ID token. Raises ValueError when the token is invalid."""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError as e:
+            raise ValueError(f"Malformed token: {e}")
+        key = self._get_key(kid)
+        if key is None:
+            raise ValueError(f"Unknown signing key: {kid}")
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=ALGORITHMS,
+                audience=audience,
+                issuer=GOOGLE_ISSUERS,
+                options={"verify_at_hash": False, "leeway": CLOCK_SKEW},
+            )
+        except JWTError as e:
+            raise ValueError(str(e))
+        with self._lock:
+            self.metrics["verified"] += 1
+        return claims
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+verifier = GoogleTokenVerifier()
+
+
+def verify_id_token(token: str, audience: str) -> dict:
+    return verifier.verify(token, audience)
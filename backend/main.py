@@ -1,18 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from typing import List, Optional
-from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 import os
 import json
+import math
+import asyncio
+from urllib.parse import quote
 
-from google.oauth2 import id_token
-from google.auth.transport import requests
-
-from . import models, schemas, database
+from . import models, schemas, database, progress_service, quiz_service, question_parser, exam_catalog, gemini_service, analysis_cache, generation_jobs, rate_limiter, auth_cache, password_service, google_auth, notes_service, search_service
 import mercadopago
 
 from dotenv import load_dotenv
@@ -32,14 +34,20 @@ MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
 sdk = mercadopago.SDK(MP_ACCESS_TOKEN) if MP_ACCESS_TOKEN else None
 
 # --- Security ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_service.verify_password(plain_password, hashed_password)[0]
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_service.hash_password(password)
+
+def password_hashing_busy():
+    return HTTPException(
+        status_code=503,
+        detail="Servidor ocupado. Tente novamente em instantes.",
+        headers={"Retry-After": "1"},
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -60,8 +68,34 @@ def on_startup():
     try:
         models.Base.metadata.create_all(bind=database.engine)
         print("✅ Database tables created/verified.")
+        search_service.ensure_schema(database.engine)
     except Exception as e:
         print(f"❌ Error during database initialization: {e}")
+    # Warm the exam catalog so the first /exams/* request doesn't scan the folders
+    exam_catalog.get_catalog()
+    try:
+        purged = analysis_cache.purge(
+            (gemini_service.ANALYSIS_PROMPT_VERSION, gemini_service.BATCH_ANALYSIS_PROMPT_VERSION), gemini_service.GROQ_MODEL
+        )
+        if purged:
+            print(f"🧹 Removed {purged} stale AI analyses from cache")
+        budget = gemini_service.calibrate_output_budget(
+            analysis_cache.analysis_lengths(gemini_service.ANALYSIS_PROMPT_VERSION, gemini_service.GROQ_MODEL)
+        )
+        print(f"📏 Batch analysis output budget: {budget} tokens per question")
+    except Exception as e:
+        print(f"❌ Error preparing AI analysis cache: {e}")
+
+@app.on_event("startup")
+async def start_generation_workers():
+    await generation_jobs.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await generation_jobs.stop()
+    await gemini_service.close_client()
+    password_service.shutdown()
+    google_auth.verifier.close()
 
 # CORS
 cors_origins_env = os.getenv("CORS_ORIGINS", "")
@@ -73,6 +107,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Progress-Cursor", "X-Exam-Filename", "X-Next-Cursor"],
 )
 
 def get_db():
@@ -82,7 +117,13 @@ def get_db():
     finally:
         db.close()
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> schemas.User:
+    """Snapshot of the authenticated user. Verified tokens are cached (see auth_cache), so most
+    requests skip both the JWT decode and the users query."""
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -95,12 +136,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    # Read before the query, so a concurrent invalidate_user keeps this snapshot out of the cache
+    loaded_at = auth_cache.generation()
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
-    return user
+    return auth_cache.put(token, user, payload.get("exp"), loaded_at)
 
-async def get_current_admin(current_user: models.User = Depends(get_current_user)):
+async def get_current_admin(current_user: schemas.User = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -116,7 +159,10 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = get_password_hash(user.password)
+    except password_service.HashingOverloaded:
+        raise password_hashing_busy()
     db_user = models.User(
         username=user.username, 
         email=user.email,
@@ -132,24 +178,50 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
 @app.post("/token", response_model=schemas.Token)
 def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        username, hashed_password = user.username, user.hashed_password
+        # Release the connection while bcrypt runs; the user row isn't needed until a rehash
+        db.commit()
+        try:
+            valid, new_hash = password_service.verify_password(form_data.password, hashed_password)
+        except password_service.HashingOverloaded:
+            raise password_hashing_busy()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash uses outdated bcrypt parameters: upgrade it now that we know the password
+        user.hashed_password = new_hash
+        db.commit()
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": username}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+def unique_username(db: Session, base_username: str) -> str:
+    """base_username, or base_username1, base_username2, ... whichever is free first (one query)"""
+    escaped = base_username.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    taken = {
+        row.username for row in
+        db.query(models.User.username).filter(models.User.username.like(f"{escaped}%", escape="\\"))
+    }
+    if base_username not in taken:
+        return base_username
+    counter = 1
+    while f"{base_username}{counter}" in taken:
+        counter += 1
+    return f"{base_username}{counter}"
+
 @app.post("/auth/google", response_model=schemas.Token)
 def google_login(auth: schemas.GoogleAuth, db: Session = Depends(get_db)):
     try:
-        # print(f"DEBUG: Verifying token with Client ID: {GOOGLE_CLIENT_ID}") 
-        # Verify the token
-        id_info = id_token.verify_oauth2_token(auth.token, requests.Request(), GOOGLE_CLIENT_ID)
+        # Verify the token locally against Google's cached signing keys
+        id_info = google_auth.verify_id_token(auth.token, GOOGLE_CLIENT_ID)
 
         # ID token is valid. Get the user's Google Account ID from the decoded token.
         google_sub = id_info['sub']
@@ -167,14 +239,7 @@ def google_login(auth: schemas.GoogleAuth, db: Session = Depends(get_db)):
             # Create new user
             # We need a username. Let's use the email part or generate one.
             # Simple strategy: use email as username if available, else random.
-            new_username = email.split('@')[0]
-            
-            # Ensure username uniqueness
-            counter = 1
-            base_username = new_username
-            while db.query(models.User).filter(models.User.username == new_username).first():
-                new_username = f"{base_username}{counter}"
-                counter += 1
+            new_username = unique_username(db, email.split('@')[0])
             
             user = models.User(
                 username=new_username,
@@ -208,11 +273,19 @@ def google_login(auth: schemas.GoogleAuth, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Google Login Error: {str(e)}")
 
 @app.get("/users/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(get_current_user)):
+def read_users_me(current_user: schemas.User = Depends(get_current_user)):
     return current_user
 
+@app.get("/auth/cache/stats")
+def auth_cache_stats(current_user: schemas.User = Depends(get_current_admin)):
+    return auth_cache.stats()
+
+@app.get("/auth/hashing/stats")
+def password_hashing_stats(current_user: schemas.User = Depends(get_current_admin)):
+    return password_service.stats()
+
 @app.get("/users/validate/{username}")
-def validate_username(username: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def validate_username(username: str, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     """Check if a username exists in the system"""
     user = db.query(models.User).filter(models.User.username == username).first()
     return {"exists": user is not None, "username": username}
@@ -223,18 +296,20 @@ FREE_QUIZ_LIMIT = 1
 FREE_QUESTION_LIMIT = 20
 
 @app.post("/users/upgrade")
-def upgrade_user(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def upgrade_user(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     """Simulates upgrading a user to premium for 6 months"""
-    current_user.is_premium = True
-    current_user.premium_until = datetime.datetime.utcnow() + datetime.timedelta(days=180)
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    user.is_premium = True
+    user.premium_until = datetime.utcnow() + timedelta(days=180)
+    auth_cache.invalidate_user(db, user.id)
     db.commit()
-    db.refresh(current_user)
-    return current_user
+    db.refresh(user)
+    return schemas.User.model_validate(user)
 
 # --- Workplace Routes ---
 
 @app.post("/workplaces/", response_model=schemas.Workplace)
-def create_workplace(workplace: schemas.WorkplaceCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_workplace(workplace: schemas.WorkplaceCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     if not current_user.is_premium:
         count = db.query(models.Workplace).filter(models.Workplace.user_id == current_user.id).count()
         if count >= FREE_WORKPLACE_LIMIT:
@@ -250,24 +325,41 @@ def create_workplace(workplace: schemas.WorkplaceCreate, db: Session = Depends(g
     return db_workplace
 
 @app.get("/workplaces/", response_model=List[schemas.Workplace])
-def list_workplaces(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    workplaces = db.query(models.Workplace).filter(models.Workplace.user_id == current_user.id).all()
+def list_workplaces(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    workplaces = db.query(models.Workplace).options(
+        selectinload(models.Workplace.quizzes).selectinload(models.Quiz.questions)
+    ).filter(models.Workplace.user_id == current_user.id).all()
     return workplaces
 
 @app.delete("/workplaces/{workplace_id}")
-def delete_workplace(workplace_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_workplace(workplace_id: str, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     workplace = db.query(models.Workplace).filter(models.Workplace.id == workplace_id, models.Workplace.user_id == current_user.id).first()
     if not workplace:
         raise HTTPException(status_code=404, detail="Workplace not found")
     
+    # Its quizzes go with it (cascade): drop their progress (with tombstones), counters, notes and search index entries
+    quiz_ids = [row.id for row in db.query(models.Quiz.id).filter(models.Quiz.workplace_id == workplace_id)]
+    question_ids = [row.id for row in db.query(models.Question.id).filter(models.Question.quiz_id.in_(quiz_ids))]
+    if quiz_ids:
+        progress_service.clear_summaries(db, quiz_ids=quiz_ids)
+    if question_ids:
+        # Syncing clients learn that this progress is gone
+        progress_service.record_tombstones(db, current_user.id, question_ids)
+        db.query(models.UserProgress).filter(models.UserProgress.question_id.in_(question_ids), models.UserProgress.user_id == current_user.id).delete(synchronize_session=False)
+        search_service.remove_notes_for_questions(db, question_ids)
+        changed_summaries = notes_service.delete_for_questions(db, question_ids)
+        search_service.remove_questions(db, question_ids)
+    else:
+        changed_summaries = set()
     db.delete(workplace)
     db.commit()
+    notes_service.forget_summaries(changed_summaries)
     return {"ok": True}
 
 # --- Study Group Routes ---
 
 @app.post("/study-groups/", response_model=schemas.StudyGroup)
-def create_study_group(group: schemas.StudyGroupCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_study_group(group: schemas.StudyGroupCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     if not current_user.is_premium:
         raise HTTPException(status_code=403, detail="Grupos de Estudo estão disponíveis apenas na versão completa.")
     db_group = models.StudyGroup(
@@ -281,7 +373,7 @@ def create_study_group(group: schemas.StudyGroupCreate, db: Session = Depends(ge
     return db_group
 
 @app.get("/study-groups/", response_model=List[schemas.StudyGroup])
-def list_study_groups(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def list_study_groups(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     if not current_user.is_premium:
         return []
     
@@ -293,7 +385,7 @@ def list_study_groups(db: Session = Depends(get_db), current_user: models.User =
     return created_groups
 
 @app.get("/study-groups/dashboard")
-def get_study_groups_dashboard(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_study_groups_dashboard(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     if not current_user.is_premium:
         return []
     
@@ -343,34 +435,19 @@ def get_study_groups_dashboard(db: Session = Depends(get_db), current_user: mode
         if note.question_id:
             groups_data[group_key]["questions"].add(note.question_id)
     
-    # Get stats for each member in each group
+    # Get stats for each member in each group (one batch of aggregate queries for all members)
+    all_members = {m for group_info in groups_data.values() for m in group_info["members"]}
+    stats_by_member = progress_service.get_members_quiz_stats(db, list(all_members))
+
     result = []
     for group_key, group_info in groups_data.items():
         members_stats = []
         for member_username in group_info["members"]:
-            member = db.query(models.User).filter(models.User.username == member_username).first()
-            if member:
-                # Get member's quizzes
-                member_quizzes = db.query(models.Quiz).filter(models.Quiz.user_id == member.id).all()
-                quizzes_info = []
-                for quiz in member_quizzes:
-                    total_questions = len(quiz.questions)
-                    answered = db.query(models.UserProgress).filter(
-                        models.UserProgress.user_id == member.id,
-                        models.UserProgress.question_id.in_([q.id for q in quiz.questions])
-                    ).count()
-                    quizzes_info.append({
-                        "title": quiz.title,
-                        "provider": quiz.provider,
-                        "total_questions": total_questions,
-                        "answered_questions": answered,
-                        "progress_percent": round((answered / total_questions * 100) if total_questions > 0 else 0, 1)
-                    })
-                
+            if member_username in stats_by_member:
                 members_stats.append({
                     "username": member_username,
                     "exists": True,
-                    "quizzes": quizzes_info
+                    "quizzes": stats_by_member[member_username]
                 })
             else:
                 members_stats.append({
@@ -397,8 +474,8 @@ def get_study_groups_dashboard(db: Session = Depends(get_db), current_user: mode
 def read_root():
     return {"message": "CISM Backend API is running"}
 
-@app.post("/quizzes/", response_model=schemas.Quiz)
-def create_quiz(quiz: schemas.QuizCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+@app.post("/quizzes/", response_model=schemas.QuizImportResult)
+def create_quiz(quiz: schemas.QuizCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     if not current_user.is_premium:
         count = db.query(models.Quiz).filter(models.Quiz.user_id == current_user.id).count()
         if count >= FREE_QUIZ_LIMIT:
@@ -416,80 +493,120 @@ def create_quiz(quiz: schemas.QuizCreate, db: Session = Depends(get_db), current
         workplace_id=quiz.workplace_id
     )
     db.add(db_quiz)
+    db.flush()  # Assigns id/created_at
+
+    # Quiz and questions go in one transaction; questions are bulk-inserted, not built as ORM objects
+    inserted_ids = quiz_service.bulk_insert_questions(db, db_quiz.id, quiz.questions)
+    result = schemas.QuizImportResult(
+        id=db_quiz.id, title=db_quiz.title, description=db_quiz.description, provider=db_quiz.provider,
+        file_name=db_quiz.file_name, workplace_id=db_quiz.workplace_id, created_at=db_quiz.created_at,
+        inserted_ids=inserted_ids, inserted_count=len(inserted_ids)
+    )
     db.commit()
-    db.refresh(db_quiz)
-
-    if quiz.questions:
-        for q in quiz.questions:
-            db_question = models.Question(
-                id=q.id,
-                quiz_id=db_quiz.id,
-                text=q.text,
-                correct_answer_label=q.correct_answer_label,
-                explanation=q.explanation,
-                options=[opt.dict() for opt in q.options],
-                content_hash=models.create_question_hash(q.text)  # Generate hash for cross-user sharing
-            )
-            db.add(db_question)
-        db.commit()
-        db.refresh(db_quiz)
-    
-    return db_quiz
+    return result
 
-@app.patch("/quizzes/{quiz_id}/questions", response_model=schemas.Quiz)
-def update_quiz_questions(quiz_id: str, update: schemas.QuizUpdateQuestions, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+@app.patch("/quizzes/{quiz_id}/questions", response_model=schemas.QuestionsAppendResult)
+def update_quiz_questions(quiz_id: str, update: schemas.QuizUpdateQuestions, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     db_quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.user_id == current_user.id).first()
     if not db_quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
+    current_count, last_position = db.query(
+        func.count(models.Question.id), func.max(models.Question.position)
+    ).filter(models.Question.quiz_id == quiz_id).one()
+
     if not current_user.is_premium:
-        current_count = db.query(models.Question).filter(models.Question.quiz_id == quiz_id).count()
         if (current_count + len(update.questions)) > FREE_QUESTION_LIMIT:
              raise HTTPException(status_code=403, detail=f"Usuários gratuitos podem ter no máximo {FREE_QUESTION_LIMIT} questões por bloco.")
 
-    for q in update.questions:
-        db_question = models.Question(
-            id=q.id,
-            quiz_id=db_quiz.id,
-            text=q.text,
-            correct_answer_label=q.correct_answer_label,
-            explanation=q.explanation,
-            options=[opt.dict() for opt in q.options],
-            content_hash=models.create_question_hash(q.text)
-        )
-        db.add(db_question)
-    
+    # Append after the current last question
+    next_position = last_position + 1 if last_position is not None else 0
+    inserted_ids = quiz_service.bulk_insert_questions(db, quiz_id, update.questions, start_position=next_position)
     db.commit()
-    db.refresh(db_quiz)
-    return db_quiz
+    return {
+        "quiz_id": quiz_id,
+        "inserted_ids": inserted_ids,
+        "inserted_count": len(inserted_ids),
+        "question_count": current_count + len(inserted_ids)
+    }
+
+@app.get("/quizzes/", response_model=None)
+def read_quizzes(skip: int = 0, limit: int = 100, fields: Optional[str] = None, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """List the user's quizzes. `fields=summary` returns metadata and question counts only."""
+    if fields == "summary":
+        rows = db.query(models.Quiz, func.count(models.Question.id)).outerjoin(
+            models.Question, models.Question.quiz_id == models.Quiz.id
+        ).filter(models.Quiz.user_id == current_user.id).group_by(models.Quiz.id).offset(skip).limit(limit).all()
+        return [
+            schemas.QuizSummary(
+                id=quiz.id, title=quiz.title, description=quiz.description, provider=quiz.provider,
+                file_name=quiz.file_name, workplace_id=quiz.workplace_id, created_at=quiz.created_at,
+                question_count=question_count
+            )
+            for quiz, question_count in rows
+        ]
+    if fields is not None:
+        raise HTTPException(status_code=400, detail="Parâmetro 'fields' inválido. Use 'summary'.")
+
+    # All questions for the page in one extra query instead of one lazy load per quiz
+    quizzes = db.query(models.Quiz).options(selectinload(models.Quiz.questions)).filter(
+        models.Quiz.user_id == current_user.id
+    ).offset(skip).limit(limit).all()
+    # Note badges for every question of the page, from the summary cache (one query for misses)
+    note_summaries = notes_service.summaries_for_questions(db, [q for quiz in quizzes for q in quiz.questions])
+    result = []
+    for quiz in quizzes:
+        item = schemas.Quiz.model_validate(quiz)
+        item.note_summaries = {q.id: schemas.NoteSummary(**note_summaries[q.id]) for q in quiz.questions}
+        result.append(item)
+    return result
+
+@app.get("/quizzes/{quiz_id}/questions", response_model=schemas.QuestionPage)
+def read_quiz_questions(quiz_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """One page of a quiz's questions, in import order"""
+    quiz = db.query(models.Quiz.id).filter(models.Quiz.id == quiz_id, models.Quiz.user_id == current_user.id).first()
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    limit = max(1, min(limit, 500))
+    skip = max(0, skip)
 
-@app.get("/quizzes/", response_model=List[schemas.Quiz])
-def read_quizzes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    quizzes = db.query(models.Quiz).filter(models.Quiz.user_id == current_user.id).offset(skip).limit(limit).all()
-    return quizzes
+    total = db.query(func.count(models.Question.id)).filter(models.Question.quiz_id == quiz_id).scalar()
+    items = db.query(models.Question).filter(models.Question.quiz_id == quiz_id).order_by(
+        models.Question.position, models.Question.id
+    ).offset(skip).limit(limit).all()
+    note_summaries = notes_service.summaries_for_questions(db, items)
+    return {"quiz_id": quiz_id, "total": total, "skip": skip, "limit": limit, "items": items, "note_summaries": note_summaries}
 
 @app.delete("/quizzes/{quiz_id}")
-def delete_quiz(quiz_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_quiz(quiz_id: str, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.user_id == current_user.id).first()
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     # Although cascade is set, explicit deletion helps avoid issues with SQLite foreign keys when not fully synced
-    questions = db.query(models.Question).filter(models.Question.quiz_id == quiz_id).all()
-    question_ids = [q.id for q in questions]
+    question_ids = [row.id for row in db.query(models.Question.id).filter(models.Question.quiz_id == quiz_id)]
     
+    # Drop materialized progress counters for this quiz
+    progress_service.clear_summaries(db, quiz_ids=[quiz_id])
+
     if question_ids:
         # Delete progress
+        progress_service.record_tombstones(db, current_user.id, question_ids)
         db.query(models.UserProgress).filter(models.UserProgress.question_id.in_(question_ids), models.UserProgress.user_id == current_user.id).delete(synchronize_session=False)
         # Delete community notes for THESE specific questions (hashes are different)
-        db.query(models.CommunityNote).filter(models.CommunityNote.question_id.in_(question_ids)).delete(synchronize_session=False)
+        search_service.remove_notes_for_questions(db, question_ids)
+        changed_summaries = notes_service.delete_for_questions(db, question_ids)
+        search_service.remove_questions(db, question_ids)
+    else:
+        changed_summaries = set()
     
     db.delete(quiz)
     db.commit()
+    notes_service.forget_summaries(changed_summaries)
     return {"ok": True}
 
 @app.patch("/quizzes/{quiz_id}/move")
-def move_quiz_to_workplace(quiz_id: str, workplace_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def move_quiz_to_workplace(quiz_id: str, workplace_id: str, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     """Move a quiz to a different workplace (or make it standalone with workplace_id=none)."""
     quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.user_id == current_user.id).first()
     if not quiz:
@@ -508,7 +625,7 @@ def move_quiz_to_workplace(quiz_id: str, workplace_id: str, db: Session = Depend
     return {"ok": True, "quiz_id": quiz_id, "workplace_id": quiz.workplace_id}
 
 @app.post("/quizzes/{target_quiz_id}/merge/{source_quiz_id}")
-def merge_quizzes(target_quiz_id: str, source_quiz_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def merge_quizzes(target_quiz_id: str, source_quiz_id: str, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     """Merge all questions from source quiz into target quiz, then delete source."""
     target = db.query(models.Quiz).filter(models.Quiz.id == target_quiz_id, models.Quiz.user_id == current_user.id).first()
     if not target:
@@ -521,10 +638,21 @@ def merge_quizzes(target_quiz_id: str, source_quiz_id: str, db: Session = Depend
     if target_quiz_id == source_quiz_id:
         raise HTTPException(status_code=400, detail="Cannot merge a quiz with itself")
     
-    # Move all questions from source to target
-    source_questions = db.query(models.Question).filter(models.Question.quiz_id == source_quiz_id).all()
-    for q in source_questions:
+    # Move all questions from source to target, appended after the target's last question
+    next_position = db.query(func.coalesce(func.max(models.Question.position), -1)).filter(models.Question.quiz_id == target_quiz_id).scalar() + 1
+    source_questions = db.query(models.Question).filter(models.Question.quiz_id == source_quiz_id).order_by(
+        models.Question.position, models.Question.id
+    ).all()
+    for offset, q in enumerate(source_questions):
         q.quiz_id = target_quiz_id
+        q.position = next_position + offset
+    
+    # Progress counters follow the questions
+    progress_service.merge_summaries(db, target_quiz_id, source_quiz_id)
+    
+    # Flush the moves first: autoflush is off, and the delete-orphan cascade would
+    # otherwise load the moved questions as still belonging to source and delete them
+    db.flush()
     
     # Delete the now-empty source quiz
     db.delete(source)
@@ -534,104 +662,128 @@ def merge_quizzes(target_quiz_id: str, source_quiz_id: str, db: Session = Depend
     return {"ok": True, "target_quiz_id": target_quiz_id, "questions_moved": len(source_questions)}
 
 @app.post("/progress/", response_model=schemas.UserProgress)
-def update_progress(progress: schemas.UserProgressUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_progress = db.query(models.UserProgress).filter(
-        models.UserProgress.question_id == progress.question_id,
-        models.UserProgress.user_id == current_user.id
-    ).first()
-    
-    if db_progress:
-        # Update existing
-        if progress.selected_answer is not None:
-             db_progress.selected_answer = progress.selected_answer
-        if progress.is_flagged_disagree_key is not None:
-             db_progress.is_flagged_disagree_key = progress.is_flagged_disagree_key
-        if progress.is_flagged_disagree_ai is not None:
-             db_progress.is_flagged_disagree_ai = progress.is_flagged_disagree_ai
-        if progress.ai_analysis is not None:
-             db_progress.ai_analysis = progress.ai_analysis
-    else:
-        # Create new
-        db_progress = models.UserProgress(
-            question_id=progress.question_id,
-            user_id=current_user.id,
-            selected_answer=progress.selected_answer,
-            is_flagged_disagree_key=progress.is_flagged_disagree_key or False,
-            is_flagged_disagree_ai=progress.is_flagged_disagree_ai or False,
-            ai_analysis=progress.ai_analysis
-        )
-        db.add(db_progress)
+def update_progress(progress: schemas.UserProgressUpdate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    results, rows = progress_service.write_progress(db, current_user.id, [progress])
+    if results[0]["status"] == "error":
+        raise HTTPException(status_code=404, detail="Question not found")
+    return rows[progress.question_id]
+
+@app.post("/progress/batch", response_model=List[schemas.ProgressBatchResult])
+def update_progress_batch(updates: List[schemas.UserProgressUpdate], db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """Apply a queue of progress updates in one transaction, returning a result per item"""
+    if len(updates) > progress_service.MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Máximo de {progress_service.MAX_BATCH_SIZE} atualizações por lote.")
+    if not updates:
+        return []
+    results, _ = progress_service.write_progress(db, current_user.id, updates)
+    return results
 
-    db.commit()
-    db.refresh(db_progress)
-    return db_progress
+@app.get("/progress/", response_model=None)
+def get_all_progress(since: Optional[datetime] = None, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """Without `since`: streams every progress row as a JSON list, with the sync cursor in X-Progress-Cursor.
+    With `since` (a cursor from a previous call): returns only rows changed and question_ids reset since then."""
+    if since is None:
+        cursor = progress_service.sync_cursor()
+        user_id = current_user.id
+
+        def stream():
+            # Own session: the request-scoped one may be closed before the body is sent
+            stream_db = database.SessionLocal()
+            try:
+                yield from progress_service.iter_progress_json(stream_db, user_id)
+            finally:
+                stream_db.close()
+
+        return StreamingResponse(stream(), media_type="application/json", headers={"X-Progress-Cursor": cursor.isoformat()})
 
-@app.get("/progress/", response_model=List[schemas.UserProgress])
-def get_all_progress(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return db.query(models.UserProgress).filter(models.UserProgress.user_id == current_user.id).all()
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    if progress_service.cursor_expired(since):
+        raise HTTPException(status_code=410, detail="Cursor de sincronização expirado. Recarregue o progresso completo.")
+    return schemas.ProgressDelta.model_validate(progress_service.get_progress_delta(db, current_user.id, since))
+
+@app.get("/progress/summary", response_model=List[schemas.QuizProgressSummary])
+def get_progress_summary(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """Answered/correct/flagged counters per quiz, read from the materialized summaries"""
+    return progress_service.get_summaries(db, current_user.id)
 
 @app.delete("/progress/reset-block/{quiz_id}")
-def reset_block_progress(quiz_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def reset_block_progress(quiz_id: str, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     # Get question IDs for the quiz
-    questions = db.query(models.Question).filter(models.Question.quiz_id == quiz_id).all()
-    question_ids = [q.id for q in questions]
+    question_ids = [row.id for row in db.query(models.Question.id).filter(models.Question.quiz_id == quiz_id)]
     
     if not question_ids:
         return {"ok": True}
 
+    progress_service.record_tombstones(db, current_user.id, question_ids)
     db.query(models.UserProgress).filter(
         models.UserProgress.question_id.in_(question_ids),
         models.UserProgress.user_id == current_user.id
     ).delete(synchronize_session=False)
+    progress_service.clear_summaries(db, user_id=current_user.id, quiz_ids=[quiz_id])
     
     db.commit()
     return {"ok": True}
 
 @app.delete("/progress/reset-all")
-def reset_all_progress(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def reset_all_progress(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    progress_service.record_tombstones(db, current_user.id)
     db.query(models.UserProgress).filter(models.UserProgress.user_id == current_user.id).delete(synchronize_session=False)
+    progress_service.clear_summaries(db, user_id=current_user.id)
     db.commit()
     return {"ok": True}
     
 # --- Community Notes Routes ---
 
 @app.get("/community-notes/{question_id}", response_model=List[schemas.CommunityNote])
-def get_community_notes(question_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_community_notes(question_id: str, response: Response, limit: int = notes_service.DEFAULT_PAGE_SIZE, before: Optional[str] = None, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """Notes visible to the caller, newest first. Pass X-Next-Cursor back as `before` for the next page."""
     # Get the question to find its hash
     question = db.query(models.Question).filter(models.Question.id == question_id).first()
     if not question:
         return []
-    
-    # If question has a hash, get all notes with that hash (cross-user sharing)
-    if question.content_hash:
-        all_notes = db.query(models.CommunityNote).filter(
-            models.CommunityNote.question_hash == question.content_hash
-        ).order_by(models.CommunityNote.created_at.desc()).all()
+
+    # Public notes, plus group notes the caller wrote or is shared on, filtered in SQL
+    try:
+        notes, next_cursor = notes_service.page_notes(db, question, current_user, limit, before)
+    except notes_service.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return notes
+
+@app.post("/community-notes/bulk", response_model=schemas.CommunityNotesBulk)
+def get_community_notes_bulk(request: schemas.CommunityNotesBulkRequest, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """Visible notes for a whole quiz block (or a list of question ids), grouped by content hash.
+    Two queries whatever the block size: question hashes, then notes (or counts with counts_only)."""
+    if request.quiz_id:
+        question_keys = notes_service.question_keys(db, quiz_id=request.quiz_id, owner_id=current_user.id)
+        # Nothing found: tell an empty quiz apart from someone else's (or a missing) one
+        if not question_keys and not db.query(models.Quiz.id).filter(
+            models.Quiz.id == request.quiz_id, models.Quiz.user_id == current_user.id
+        ).first():
+            raise HTTPException(status_code=404, detail="Quiz not found")
+    elif request.question_ids:
+        if len(request.question_ids) > notes_service.MAX_BULK_QUESTIONS:
+            raise HTTPException(status_code=413, detail=f"Máximo de {notes_service.MAX_BULK_QUESTIONS} questões por requisição.")
+        question_keys = notes_service.question_keys(db, question_ids=request.question_ids)
+    else:
+        raise HTTPException(status_code=400, detail="Informe quiz_id ou question_ids.")
+
+    if request.counts_only:
+        counts = notes_service.count_by_key(db, question_keys, current_user)
+        groups = {key: {"count": count} for key, count in counts.items()}
     else:
-        # Fallback to old behavior for questions without hash
-        all_notes = db.query(models.CommunityNote).filter(
-            models.CommunityNote.question_id == question_id
-        ).order_by(models.CommunityNote.created_at.desc()).all()
-    
-    # Filter based on visibility and study group permissions
-    visible_notes = []
-    for note in all_notes:
-        # Public notes are visible to everyone
-        if note.visibility == "public":
-            visible_notes.append(note)
-        # Group notes are visible only to author and shared users
-        elif note.visibility == "group":
-            # Author can always see their own note
-            if note.user_id == current_user.id:
-                visible_notes.append(note)
-            # Check if current user is in shared_with list
-            elif note.shared_with and current_user.username in note.shared_with:
-                visible_notes.append(note)
-    
-    return visible_notes
+        per_question = max(1, min(request.per_question, notes_service.MAX_NOTES_PER_GROUP))
+        newest = notes_service.newest_by_key(db, question_keys, current_user, per_question)
+        groups = {
+            key: {"count": count, "notes": notes, "next_cursor": next_cursor}
+            for key, (count, notes, next_cursor) in newest.items()
+        }
+    return {"questions": question_keys, "groups": groups}
 
 @app.post("/community-notes/", response_model=schemas.CommunityNote)
-def create_community_note(note: schemas.CommunityNoteCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_community_note(note: schemas.CommunityNoteCreate, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     # Get the question to find its hash
     question = db.query(models.Question).filter(models.Question.id == note.question_id).first()
     
@@ -664,11 +816,35 @@ def create_community_note(note: schemas.CommunityNoteCreate, db: Session = Depen
         shared_with=valid_shared_with
     )
     db.add(db_note)
+    db.flush()
+    summary_key = db_note.question_hash or db_note.question_id
+    if db_note.visibility == "group" and valid_shared_with:
+        notes_service.add_shares(db, db_note.id, valid_shared_with)
+    elif db_note.visibility == "public":
+        notes_service.record_public_note(db, summary_key, db_note.created_at)
+    search_service.index_note(db, db_note)
     db.commit()
+    notes_service.forget_summaries([summary_key])
     db.refresh(db_note)
     return db_note
 
-from . import gemini_service
+
+# --- Search ---
+
+@app.get("/search", response_model=schemas.SearchResults)
+def search_questions(q: str, limit: int = 20, offset: int = 0, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """Ranked full-text search over the caller's questions (text, options, explanation) and the notes they can see"""
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    if offset + limit > search_service.MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"Busca limitada aos {search_service.MAX_RESULTS} primeiros resultados.")
+    results, has_more = search_service.search(db, current_user, q, limit, offset)
+    items = [
+        {"question": question, "quiz_id": question.quiz_id, "quiz_title": quiz_title, "score": score, "matched_in": matched_in}
+        for question, quiz_title, score, matched_in in results
+    ]
+    return {"query": q, "offset": offset, "limit": limit, "has_more": has_more, "items": items}
+
 
 # --- AI Debug Endpoint (public, for diagnostics) ---
 @app.get("/ai/debug")
@@ -735,33 +911,148 @@ def ai_debug():
     
     return results
 
+def enforce_ai_rate_limit(user: schemas.User, batch_questions: int = None):
+    """Per-user token bucket for the AI endpoints (its own bucket for batch analysis): 429 with Retry-After when exhausted"""
+    try:
+        if batch_questions is None:
+            rate_limiter.check_user(user.id)
+        else:
+            rate_limiter.check_user_batch(user.id, batch_questions)
+    except rate_limiter.RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Muitas requisições de IA. Aguarde alguns segundos e tente novamente.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
 @app.post("/ai/analyze", response_model=str)
-def ai_analyze_question(question: schemas.Question, current_user: models.User = Depends(get_current_user)):
+async def ai_analyze_question(question: schemas.Question, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if not current_user.is_premium:
         raise HTTPException(status_code=403, detail="Análise por IA está disponível apenas na versão completa.")
-    # In a real app, you might want to rate limit this or check user quotas
-    return gemini_service.analyze_question(question)
+    await run_in_threadpool(enforce_ai_rate_limit, current_user)
+    # Give the pooled DB connection back before waiting on the LLM
+    db.close()
+    return await gemini_service.analyze_question(question)
+
+MAX_ANALYSIS_BATCH = 100
+
+@app.post("/ai/analyze/batch", response_model=Dict[str, str])
+async def ai_analyze_questions(questions: List[schemas.Question], current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Analyze a whole block at once; returns {question_id: analysis}"""
+    if not current_user.is_premium:
+        raise HTTPException(status_code=403, detail="Análise por IA está disponível apenas na versão completa.")
+    if len(questions) > MAX_ANALYSIS_BATCH:
+        raise HTTPException(status_code=413, detail=f"Máximo de {MAX_ANALYSIS_BATCH} questões por requisição")
+    db.close()
+
+    # One batch token per question that needs the LLM; fully cached blocks cost 1
+    async def charge(uncached: int):
+        await run_in_threadpool(enforce_ai_rate_limit, current_user, max(1, uncached))
+
+    return await gemini_service.analyze_questions(questions, before_upstream=charge)
+
+@app.post("/ai/analyze/stream")
+async def ai_analyze_question_stream(question: schemas.Question, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not current_user.is_premium:
+        raise HTTPException(status_code=403, detail="Análise por IA está disponível apenas na versão completa.")
+    await run_in_threadpool(enforce_ai_rate_limit, current_user)
+    db.close()
+    return StreamingResponse(
+        gemini_service.stream_analysis(question),
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser as they arrive
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/ai/cache/stats")
+def ai_cache_stats(current_user: schemas.User = Depends(get_current_admin)):
+    return {**analysis_cache.stats(), **gemini_service.stats()}
+
+@app.get("/ai/limits/stats")
+def ai_limits_stats(current_user: schemas.User = Depends(get_current_admin)):
+    return rate_limiter.stats()
 
 @app.post("/ai/generate", response_model=List[schemas.QuestionCreate])
-def ai_generate_quiz(difficulty: str = "Médio", count: int = 5, current_user: models.User = Depends(get_current_user)):
+async def ai_generate_quiz(difficulty: str = "Médio", count: int = 5, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if not current_user.is_premium:
         raise HTTPException(status_code=403, detail="Geração por IA está disponível apenas na versão completa.")
-    
-    quiz_json = gemini_service.generate_quiz(difficulty, count)
-    try:
-        questions = json.loads(quiz_json)
-        # Ensure questions match QuestionCreate schema
-        # We need to map labels and texts correctly
-        return questions
-    except Exception as e:
-        print(f"Error parsing AI quiz JSON: {e}")
+    await run_in_threadpool(enforce_ai_rate_limit, current_user)
+    db.close()
+
+    # Items are validated as they stream in; malformed ones are re-requested, not fatal
+    questions = await gemini_service.generate_questions(difficulty, count)
+    if not questions:
         raise HTTPException(status_code=500, detail="Erro ao processar o quiz gerado pela IA. Tente novamente.")
+    return questions
+
+MAX_GENERATED_QUESTIONS = 20
+
+@app.post("/ai/generate/jobs", response_model=schemas.GenerationJob, status_code=202)
+def submit_generation_job(
+    difficulty: str = "Médio",
+    count: int = 5,
+    save: bool = False,
+    title: Optional[str] = None,
+    description: Optional[str] = None,
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue an AI quiz generation. With save=true the questions are also saved into a new quiz."""
+    if not current_user.is_premium:
+        raise HTTPException(status_code=403, detail="Geração por IA está disponível apenas na versão completa.")
+    if count < 1 or count > MAX_GENERATED_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"count deve estar entre 1 e {MAX_GENERATED_QUESTIONS}")
+    enforce_ai_rate_limit(current_user)
+
+    quiz_title = (title or f"Simulado IA - {difficulty}") if save else None
+    return generation_jobs.submit(db, current_user.id, difficulty, count, quiz_title, description if save else None)
+
+def get_user_job(db: Session, job_id: str, user_id: str) -> models.GenerationJob:
+    job = db.query(models.GenerationJob).filter(
+        models.GenerationJob.id == job_id,
+        models.GenerationJob.user_id == user_id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/ai/generate/jobs/{job_id}", response_model=schemas.GenerationJob)
+def read_generation_job(job_id: str, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    return get_user_job(db, job_id, current_user.id)
+
+@app.get("/ai/generate/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """SSE: a "status" event on every status change, then the finished job as a "done" event"""
+    get_user_job(db, job_id, current_user.id)
+    user_id = current_user.id
+    db.close()
+
+    def load():
+        session = database.SessionLocal()
+        try:
+            return schemas.GenerationJob.model_validate(get_user_job(session, job_id, user_id))
+        finally:
+            session.close()
+
+    async def events():
+        last_status = None
+        while True:
+            job = await run_in_threadpool(load)
+            if job.status in generation_jobs.TERMINAL_STATUSES:
+                yield gemini_service.sse_event(job.model_dump(mode="json"), "done")
+                return
+            if job.status != last_status:
+                last_status = job.status
+                yield gemini_service.sse_event({"status": job.status}, "status")
+            await asyncio.sleep(1)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # --- Mercado Pago Routes ---
 
 @app.post("/payments/create-preference")
-def create_payment_preference(current_user: models.User = Depends(get_current_user)):
+def create_payment_preference(current_user: schemas.User = Depends(get_current_user)):
     if not sdk:
         raise HTTPException(status_code=500, detail="Mercado Pago não configurado (Falta MP_ACCESS_TOKEN)")
 
@@ -820,6 +1111,7 @@ async def mercadopago_webhook(request: Request, db: Session = Depends(get_db)):
                             print(f"✅ Payment approved for user: {user.username}")
                             user.is_premium = True
                             user.premium_until = datetime.utcnow() + timedelta(days=180)
+                            auth_cache.invalidate_user(db, user.id)
                             db.commit()
                             return {"status": "success"}
         elif payment_id and not sdk:
@@ -834,6 +1126,7 @@ async def mercadopago_webhook(request: Request, db: Session = Depends(get_db)):
                     print(f"✅ [SIMULATION] Payment approved for user: {user.username}")
                     user.is_premium = True
                     user.premium_until = datetime.utcnow() + timedelta(days=180)
+                    auth_cache.invalidate_user(db, user.id)
                     db.commit()
                     return {"status": "success", "simulated": True}
 
@@ -843,51 +1136,14 @@ async def mercadopago_webhook(request: Request, db: Session = Depends(get_db)):
 @app.get("/exams/available")
 def list_available_exams():
     """List exams available in the filesystem structure Resilience"""
-    base_path = os.getenv("EXAMS_BASE_PATH", "./data/Testescript")
-    structure = {}
-    
-    if os.path.exists(base_path):
-        for provider in os.listdir(base_path):
-            provider_path = os.path.join(base_path, provider)
-            if os.path.isdir(provider_path):
-                exams = []
-                for exam in os.listdir(provider_path):
-                    if os.path.isdir(os.path.join(provider_path, exam)):
-                        exams.append(exam)
-                if exams:
-                    structure[provider] = sorted(exams)
-    
-    return structure
+    # Cached catalog, rescanned only when a folder mtime changes
+    return exam_catalog.list_exams()
 
 @app.get("/exams/autoload/{exam_name}")
-def autoload_exam(exam_name: str, current_user: models.User = Depends(get_current_user)):
+def autoload_exam(exam_name: str, current_user: schemas.User = Depends(get_current_user)):
     print(f"DEBUG: autoload_exam called with exam_name='{exam_name}'")
     
-    base_path = os.getenv("EXAMS_BASE_PATH", "./data/Testescript")
-    file_path = None
-    filename = None
-    
-    # Normalize exam_name for folder search
-    search_name = exam_name.split('(')[0].strip().upper()
-    
-    if os.path.exists(base_path):
-        for provider in os.listdir(base_path):
-            provider_path = os.path.join(base_path, provider)
-            if not os.path.isdir(provider_path):
-                continue
-                
-            for exam_dir in os.listdir(provider_path):
-                # Check both exact and normalized
-                if exam_dir.upper() == exam_name.upper() or exam_dir.upper() == search_name:
-                    exam_path = os.path.join(provider_path, exam_dir)
-                    # Look for the first .txt file
-                    for f in os.listdir(exam_path):
-                        if f.endswith('.txt'):
-                            file_path = os.path.join(exam_path, f)
-                            filename = f
-                            break
-                if file_path: break
-            if file_path: break
+    file_path, filename = exam_catalog.find_exam_file(exam_name)
 
     if file_path:
         print(f"DEBUG: Looking for file at {file_path}")
@@ -903,4 +1159,39 @@ def autoload_exam(exam_name: str, current_user: models.User = Depends(get_curren
             print(f"DEBUG: Read {len(content)} characters")
             return {"content": content, "filename": filename}
     
+    base_path = os.getenv("EXAMS_BASE_PATH", "./data/Testescript")
     raise HTTPException(status_code=404, detail=f"Exame '{exam_name}' não encontrado no servidor em {base_path}")
+
+@app.get("/exams/autoload/{exam_name}/stream")
+def autoload_exam_stream(exam_name: str, current_user: schemas.User = Depends(get_current_user)):
+    """Parse the exam bank on the server and stream one question per line (NDJSON) as it is read.
+    The file name comes in the X-Exam-Filename header (URL-encoded)."""
+    file_path, filename = exam_catalog.find_exam_file(exam_name)
+    if not file_path or not os.path.exists(file_path):
+        base_path = os.getenv("EXAMS_BASE_PATH", "./data/Testescript")
+        raise HTTPException(status_code=404, detail=f"Exame '{exam_name}' não encontrado no servidor em {base_path}")
+
+    def stream():
+        for question in question_parser.iter_questions_from_file(file_path):
+            yield json.dumps(question, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Exam-Filename": quote(filename)}
+    )
+
+@app.get("/exams/pack/{exam_name}")
+def get_exam_pack(exam_name: str, request: Request, current_user: schemas.User = Depends(get_current_user)):
+    """Pre-parsed exam bank as JSON ({filename, questions}), cached by file mtime and served with an ETag.
+    Questions carry no ids; clients assign their own before creating quizzes."""
+    file_path, filename = exam_catalog.find_exam_file(exam_name)
+    etag = exam_catalog.pack_etag(file_path) if file_path else None
+    if not etag:
+        raise HTTPException(status_code=404, detail=f"Exame '{exam_name}' não encontrado no servidor em {exam_catalog.get_base_path()}")
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=exam_catalog.get_pack(file_path, filename, etag), media_type="application/json", headers=headers)
@@ -0,0 +1,56 @@
+"""
+Script para criar a tabela community_note_shares (audiência das notas de grupo) e
+preenchê-la a partir da coluna JSON shared_with das notas existentes, além dos índices
+de paginação de community_notes. Pode ser executado mais de uma vez.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from backend.database import SessionLocal, engine
+from backend.models import CommunityNote, CommunityNoteShare
+
+BATCH_SIZE = 1000
+
+def migrate():
+    print("📝 Criando tabela 'community_note_shares' e índices de paginação...")
+    CommunityNoteShare.__table__.create(bind=engine, checkfirst=True)
+    for index in CommunityNote.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    print("✅ Tabela e índices criados/verificados!")
+
+    db = SessionLocal()
+    try:
+        existing = {(row.note_id, row.username) for row in db.query(CommunityNoteShare.note_id, CommunityNoteShare.username)}
+        notes = db.query(CommunityNote.id, CommunityNote.shared_with).filter(
+            CommunityNote.visibility == "group",
+            CommunityNote.shared_with.isnot(None)
+        ).all()
+
+        print("\n📝 Copiando 'shared_with' para 'community_note_shares'...")
+        pending = []
+        inserted = 0
+        for note_id, shared_with in notes:
+            for username in dict.fromkeys(shared_with or []):
+                if (note_id, username) not in existing:
+                    existing.add((note_id, username))
+                    pending.append({"note_id": note_id, "username": username})
+            if len(pending) >= BATCH_SIZE:
+                db.bulk_insert_mappings(CommunityNoteShare, pending)
+                inserted += len(pending)
+                pending = []
+        if pending:
+            db.bulk_insert_mappings(CommunityNoteShare, pending)
+            inserted += len(pending)
+
+        db.commit()
+        print(f"✅ {inserted} compartilhamentos inseridos")
+        print("\n🎉 Migração concluída!")
+    except Exception as e:
+        print(f"❌ Erro durante migração: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
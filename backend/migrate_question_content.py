@@ -0,0 +1,147 @@
+"""
+Script para migrar as questões para o banco compartilhado 'question_content': cria a tabela,
+adiciona as colunas 'content_key' e 'option_ids' em questions, agrupa as questões idênticas
+(mesmo texto, gabarito, explicação e alternativas) numa única linha de conteúdo e remove as
+colunas antigas (text, options, explanation, correct_answer_label) de questions.
+Em seguida recria o índice de busca, agora com um documento por conteúdo.
+
+Execute junto com o deploy da versão que lê o conteúdo compartilhado. Pode ser executado
+mais de uma vez (retoma de onde parou); depois da migração, serve para remover conteúdo
+que nenhuma questão referencia mais.
+
+Uso: python -m backend.migrate_question_content [--keep-legacy-columns]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import bindparam, column, func, inspect, select, table, text, update
+from sqlalchemy.types import JSON
+
+from backend.database import SessionLocal, engine
+from backend.models import Question, QuestionContent, create_content_key
+from backend import quiz_service, search_service
+
+BATCH_SIZE = 1000
+LEGACY_COLUMNS = ["text", "correct_answer_label", "explanation", "options"]
+
+legacy_questions = table(
+    "questions",
+    column("id"), column("content_key"),
+    column("text"), column("correct_answer_label"), column("explanation"), column("options", JSON)
+)
+
+
+def question_columns() -> set:
+    return {c["name"] for c in inspect(engine).get_columns("questions")}
+
+
+def add_columns():
+    print("📝 Criando tabela 'question_content' e colunas de referência em 'questions'...")
+    QuestionContent.__table__.create(bind=engine, checkfirst=True)
+    existing = question_columns()
+    with engine.begin() as conn:
+        if "content_key" not in existing:
+            conn.execute(text("ALTER TABLE questions ADD COLUMN content_key VARCHAR REFERENCES question_content (hash)"))
+        if "option_ids" not in existing:
+            conn.execute(text("ALTER TABLE questions ADD COLUMN option_ids JSON"))
+    for index in Question.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    print("✅ Tabela, colunas e índices criados/verificados!")
+
+
+def fold_duplicates(db) -> int:
+    """Point every question at its content row, one committed batch at a time. Returns questions moved."""
+    questions = Question.__table__
+    set_reference = update(questions).where(questions.c.id == bindparam("question_id")).values(
+        content_key=bindparam("key"), option_ids=bindparam("ids")
+    )
+    moved = 0
+    while True:
+        rows = db.execute(
+            select(legacy_questions).where(legacy_questions.c.content_key.is_(None)).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return moved
+        contents = {}
+        references = []
+        for row in rows:
+            options = [{"label": opt.get("label"), "text": opt.get("text")} for opt in row.options or []]
+            key = create_content_key(row.text, row.correct_answer_label, row.explanation, options)
+            contents.setdefault(key, {
+                "hash": key,
+                "text": row.text,
+                "correct_answer_label": row.correct_answer_label,
+                "explanation": row.explanation,
+                "options": options,
+            })
+            references.append({"question_id": row.id, "key": key, "ids": [opt.get("id") for opt in row.options or []]})
+        quiz_service.insert_contents(db, contents)
+        db.execute(set_reference, references)
+        db.commit()
+        moved += len(rows)
+        print(f"   {moved} questões migradas...")
+
+
+def drop_legacy_columns():
+    print("\n📝 Removendo colunas antigas de 'questions'...")
+    legacy = [name for name in LEGACY_COLUMNS if name in question_columns()]
+    if not legacy:
+        print("ℹ️  Colunas antigas já removidas")
+        return
+    with engine.begin() as conn:
+        for name in legacy:
+            conn.execute(text(f"ALTER TABLE questions DROP COLUMN {name}"))
+            print(f"✅ Coluna '{name}' removida")
+    if engine.dialect.name == "sqlite":
+        print("ℹ️  Execute VACUUM para devolver o espaço liberado ao sistema de arquivos")
+
+
+def migrate(keep_legacy_columns: bool = False):
+    add_columns()
+
+    db = SessionLocal()
+    try:
+        if "text" in question_columns():
+            print("\n📝 Agrupando questões idênticas em 'question_content'...")
+            moved = fold_duplicates(db)
+            print(f"✅ {moved} questões apontam para o conteúdo compartilhado")
+
+        missing = db.query(func.count(Question.id)).filter(Question.content_key.is_(None)).scalar()
+        if missing:
+            print(f"❌ {missing} questões continuam sem conteúdo; colunas antigas mantidas")
+            return
+
+        pruned = quiz_service.prune_orphan_content(db)
+        search_service.remove_contents(db, pruned)
+        db.commit()
+        if pruned:
+            print(f"🧹 {len(pruned)} conteúdos sem referência removidos")
+
+        total = db.query(func.count(Question.id)).scalar()
+        unique = db.query(func.count(QuestionContent.hash)).scalar()
+        print(f"\n📊 {total} questões, {unique} conteúdos únicos")
+    except Exception as e:
+        print(f"❌ Erro durante migração: {e}")
+        db.rollback()
+        return
+    finally:
+        db.close()
+
+    if not keep_legacy_columns:
+        drop_legacy_columns()
+
+    print("\n🔄 Recriando índice de busca por conteúdo...")
+    search_service.drop_legacy_schema(engine)
+    search_service.ensure_schema(engine)
+    db = SessionLocal()
+    try:
+        indexed = search_service.rebuild(db)
+        print(f"✅ {indexed} questões indexadas")
+    finally:
+        db.close()
+    print("\n🎉 Migração concluída!")
+
+
+if __name__ == "__main__":
+    migrate(keep_legacy_columns="--keep-legacy-columns" in sys.argv)
@@ -1,10 +1,11 @@
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import JSON
 from .database import Base
 import datetime
 import uuid
 import hashlib
+import json
 
 def generate_uuid():
     return str(uuid.uuid4())
@@ -14,6 +15,17 @@ def create_question_hash(question_text: str) -> str:
     normalized_text = question_text.strip().lower()
     return hashlib.sha256(normalized_text.encode()).hexdigest()[:16]  # Use first 16 chars
 
+def create_content_key(question_text: str, correct_answer_label: str, explanation: str, options: list) -> str:
+    """Key of a question's full content (text, answer key, explanation and option labels/texts).
+
+    Unlike create_question_hash, which groups questions by text for shared notes, two questions
+    only share a content key when everything shown to the user is identical."""
+    payload = json.dumps(
+        [question_text, correct_answer_label, explanation, [[opt.get("label"), opt.get("text")] for opt in options or []]],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
 class Quiz(Base):
     __tablename__ = "quizzes"
 
@@ -26,26 +38,39 @@ class Quiz(Base):
     file_name = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
-    questions = relationship("Question", back_populates="quiz", cascade="all, delete-orphan")
+    questions = relationship("Question", back_populates="quiz", cascade="all, delete-orphan", order_by="Question.position")
     user = relationship("User", back_populates="quizzes")
     workplace = relationship("Workplace", back_populates="quizzes")
 
-class Question(Base):
-    __tablename__ = "questions"
+class QuestionContent(Base):
+    """Canonical question content shared by every quiz that imported the same question.
 
-    id = Column(String, primary_key=True, default=generate_uuid)
-    quiz_id = Column(String, ForeignKey("quizzes.id"))
+    Rows are immutable and keyed by create_content_key; Question rows reference them. Options are
+    stored without ids, since option ids belong to each Question (progress rows point at them)."""
+    __tablename__ = "question_content"
+
+    hash = Column(String, primary_key=True)
     text = Column(Text)
     correct_answer_label = Column(String)
     explanation = Column(Text, nullable=True)
-    
-    # Store options as JSON: [{"id": "abc", "label": "A", "text": "Option text"}]
-    options = Column(JSON)
+    options = Column(JSON)  # [{"label": "A", "text": "Option text"}]
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class Question(Base):
+    __tablename__ = "questions"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    quiz_id = Column(String, ForeignKey("quizzes.id"), index=True)
+    position = Column(Integer, nullable=True)  # Order within the quiz (import order), used for paging
+    content_key = Column(String, ForeignKey("question_content.hash"), index=True)
+    # Ids of this question's options, in the order of content.options
+    option_ids = Column(JSON)
     
     # Hash of question text to identify identical questions across different users/quizzes
     content_hash = Column(String, index=True, nullable=True)
 
     quiz = relationship("Quiz", back_populates="questions")
+    content = relationship("QuestionContent", lazy="joined")
     # progress relationship might be multiple now? No, usually one per user per question. But simplistic:
     # progress = relationship("UserProgress", back_populates="question", uselist=False) 
     # ^ logic changes with multi-user. One question has many progresses (one per user).
@@ -53,12 +78,39 @@ class Question(Base):
     progresses = relationship("UserProgress", back_populates="question", cascade="all, delete-orphan")
     notes = relationship("CommunityNote", back_populates="question", cascade="all, delete-orphan")
 
+    # Read-through accessors to the shared content, so callers keep using question.text etc.
+    @property
+    def text(self):
+        return self.content.text if self.content else None
+
+    @property
+    def correct_answer_label(self):
+        return self.content.correct_answer_label if self.content else None
+
+    @property
+    def explanation(self):
+        return self.content.explanation if self.content else None
+
+    @property
+    def options(self):
+        if self.content is None:
+            return []
+        return merge_options(self.content.options, self.option_ids)
+
+def merge_options(content_options: list, option_ids: list) -> list:
+    """Options as the API returns them: the shared label/text with the question's own ids"""
+    ids = option_ids or []
+    return [
+        {"id": ids[i] if i < len(ids) else None, "label": opt.get("label"), "text": opt.get("text")}
+        for i, opt in enumerate(content_options or [])
+    ]
+
 class UserProgress(Base):
     __tablename__ = "user_progress"
 
     id = Column(String, primary_key=True, default=generate_uuid)
     user_id = Column(String, ForeignKey("users.id")) # Link Progress to User
-    question_id = Column(String, ForeignKey("questions.id")) # Removed unique=True
+    question_id = Column(String, ForeignKey("questions.id"), index=True) # Unique per user, see __table_args__
     
     selected_answer = Column(String, nullable=True) # Option ID
     is_flagged_disagree_key = Column(Boolean, default=False)
@@ -70,6 +122,82 @@ class UserProgress(Base):
     question = relationship("Question", back_populates="progresses")
     user = relationship("User", back_populates="progress")
 
+    __table_args__ = (
+        # One row per (user, question); also the conflict target of the progress upsert
+        Index("ux_user_progress_user_question", "user_id", "question_id", unique=True),
+        # Delta sync: GET /progress/?since=... scans one user's rows by updated_at
+        Index("ix_user_progress_user_updated_at", "user_id", "updated_at"),
+    )
+
+class ProgressTombstone(Base):
+    """Marks a progress row deleted by a reset, so delta syncs can remove it on the client"""
+    __tablename__ = "progress_tombstones"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    question_id = Column(String, primary_key=True)  # No FK: the question itself may be gone
+    deleted_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_progress_tombstones_user_deleted_at", "user_id", "deleted_at"),
+    )
+
+class QuizProgressSummary(Base):
+    """Materialized per-(user, quiz) progress counters, maintained on every progress write"""
+    __tablename__ = "quiz_progress_summary"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    quiz_id = Column(String, ForeignKey("quizzes.id"), primary_key=True)
+    answered_count = Column(Integer, default=0, nullable=False)
+    correct_count = Column(Integer, default=0, nullable=False)
+    flagged_count = Column(Integer, default=0, nullable=False)
+
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class AIAnalysisCache(Base):
+    """AI analyses shared across users, keyed by question content rather than question id"""
+    __tablename__ = "ai_analysis_cache"
+
+    content_hash = Column(String, primary_key=True)  # create_content_key of everything in the prompt
+    correct_answer_label = Column(String, primary_key=True)
+    prompt_version = Column(Integer, primary_key=True)
+    model = Column(String, primary_key=True)
+    analysis = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class GenerationJob(Base):
+    """An AI quiz generation request, run by the background workers in generation_jobs.py"""
+    __tablename__ = "generation_jobs"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    status = Column(String, default="pending", nullable=False)  # pending, running, done, failed
+    difficulty = Column(String, nullable=False)
+    count = Column(Integer, nullable=False)
+    # When quiz_title is set, the generated questions are saved into a new quiz
+    quiz_title = Column(String, nullable=True)
+    quiz_description = Column(String, nullable=True)
+    quiz_id = Column(String, nullable=True)  # No FK: the quiz may be deleted later
+    questions = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created_at", "status", "created_at"),
+    )
+
+class RateLimitBucket(Base):
+    """Token-bucket state shared by all worker processes (see rate_limiter.DatabaseBackend)"""
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # Unix time of the last refill
+    version = Column(Integer, default=0, nullable=False)  # Compare-and-set guard
+
 class CommunityNote(Base):
     __tablename__ = "community_notes"
 
@@ -88,6 +216,28 @@ class CommunityNote(Base):
     question = relationship("Question", back_populates="notes")
     user = relationship("User", back_populates="community_notes")
 
+    __table_args__ = (
+        # Keyset pagination of a question's notes, newest first (see notes_service.page_notes)
+        Index("ix_community_notes_hash_created_id", "question_hash", "created_at", "id"),
+        Index("ix_community_notes_question_created_id", "question_id", "created_at", "id"),
+    )
+
+class CommunityNoteShare(Base):
+    """Audience of a "group" note, one row per username (mirrors CommunityNote.shared_with)"""
+    __tablename__ = "community_note_shares"
+
+    # The (note_id, username) primary key is the index visibility checks probe
+    note_id = Column(String, ForeignKey("community_notes.id", ondelete="CASCADE"), primary_key=True)
+    username = Column(String, primary_key=True)
+
+class NoteSummary(Base):
+    """Public note count and last public note time per question, maintained on note writes (see notes_service)"""
+    __tablename__ = "note_summaries"
+
+    question_hash = Column(String, primary_key=True)  # Group key: content hash, or question id when unhashed
+    public_count = Column(Integer, default=0, nullable=False)
+    last_note_at = Column(DateTime, nullable=True)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -108,6 +258,14 @@ class User(Base):
     community_notes = relationship("CommunityNote", back_populates="user")
     study_groups = relationship("StudyGroup", back_populates="creator")
 
+class UserInvalidation(Base):
+    """Log of user changes (premium, roles, profile) that cached principals must drop; see auth_cache.py"""
+    __tablename__ = "user_invalidations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
 class Workplace(Base):
     __tablename__ = "workplaces"
 
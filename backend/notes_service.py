@@ -0,0 +1,286 @@
+"""
+Community notes queries, and the per-question note summaries behind the "N notes" badges.
+
+Visibility is resolved in SQL: a note is visible to a user when it is public, or when it is a
+"group" note the user wrote or is listed in community_note_shares for. Pages are fetched
+newest first with a keyset cursor on (created_at, id), so each request reads one index range
+no matter how many notes a question has accumulated.
+
+note_summaries keeps (public_count, last_note_at) per group key, updated in the same
+transaction as note inserts and deletions, with a process-local cache in front. Writers evict
+the keys they touched (forget_summaries) once committed; other processes see the change within
+NOTE_SUMMARY_CACHE_TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import and_, case, exists, func, or_
+from sqlalchemy.orm import Session, aliased
+
+from . import models
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BULK_QUESTIONS = 500
+MAX_NOTES_PER_GROUP = 50
+
+SUMMARY_CACHE_TTL = float(os.getenv("NOTE_SUMMARY_CACHE_TTL", "30"))
+SUMMARY_CACHE_SIZE = int(os.getenv("NOTE_SUMMARY_CACHE_SIZE", "50000"))
+
+_summary_lock = threading.Lock()
+_summaries = OrderedDict()  # group key -> ((public_count, last_note_at), expires_at)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(note: models.CommunityNote) -> str:
+    return f"{note.created_at.isoformat()}|{note.id}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, note_id = cursor.split("|", 1)
+        return datetime.fromisoformat(created_at), note_id
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def visible_to(user) -> object:
+    """Filter clause: notes `user` may read"""
+    note = models.CommunityNote
+    share = models.CommunityNoteShare
+    shared_with_user = exists().where(share.note_id == note.id, share.username == user.username)
+    return or_(
+        note.visibility == "public",
+        and_(note.visibility == "group", or_(note.user_id == user.id, shared_with_user))
+    )
+
+
+def for_question(question: models.Question):
+    """Filter clause: notes attached to a question (by content hash, across users, when it has one)"""
+    if question.content_hash:
+        return models.CommunityNote.question_hash == question.content_hash
+    return models.CommunityNote.question_id == question.id
+
+
+def page_notes(db: Session, question: models.Question, user, limit: int = DEFAULT_PAGE_SIZE, before: str = None) -> tuple:
+    """One page of visible notes, newest first. Returns (notes, cursor of the next page or None)."""
+    note = models.CommunityNote
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(note).filter(for_question(question), visible_to(user))
+    if before:
+        created_at, note_id = decode_cursor(before)
+        query = query.filter(or_(
+            note.created_at < created_at,
+            and_(note.created_at == created_at, note.id < note_id)
+        ))
+    notes = query.order_by(note.created_at.desc(), note.id.desc()).limit(limit + 1).all()
+    if len(notes) > limit:
+        return notes[:limit], encode_cursor(notes[limit - 1])
+    return notes, None
+
+
+def question_keys(db: Session, quiz_id: str = None, question_ids: list = None, owner_id: str = None) -> dict:
+    """Question id -> group key (content hash, or the question id when it has none), in one query.
+    With quiz_id, only if the quiz belongs to owner_id."""
+    query = db.query(models.Question.id, models.Question.content_hash)
+    if quiz_id is not None:
+        query = query.join(models.Quiz, models.Quiz.id == models.Question.quiz_id).filter(
+            models.Question.quiz_id == quiz_id, models.Quiz.user_id == owner_id
+        )
+    else:
+        query = query.filter(models.Question.id.in_(question_ids))
+    return {question_id: content_hash or question_id for question_id, content_hash in query}
+
+
+def _for_keys(question_keys: dict):
+    """Filter clause and group-key expression for the notes of many questions (see for_question)"""
+    note = models.CommunityNote
+    hashes = {key for question_id, key in question_keys.items() if key != question_id}
+    unhashed = [question_id for question_id, key in question_keys.items() if key == question_id]
+    clause = or_(note.question_hash.in_(hashes), and_(note.question_hash.is_(None), note.question_id.in_(unhashed)))
+    return clause, func.coalesce(note.question_hash, note.question_id)
+
+
+def count_by_key(db: Session, question_keys: dict, user) -> dict:
+    """Group key -> number of notes visible to `user`, in one query"""
+    if not question_keys:
+        return {}
+    clause, key = _for_keys(question_keys)
+    rows = db.query(key, func.count(models.CommunityNote.id)).filter(clause, visible_to(user)).group_by(key)
+    return dict(rows.all())
+
+
+def newest_by_key(db: Session, question_keys: dict, user, per_key: int) -> dict:
+    """Group key -> (visible count, newest `per_key` notes, cursor for older ones), in one query"""
+    if not question_keys:
+        return {}
+    note = models.CommunityNote
+    clause, key = _for_keys(question_keys)
+    ranked = db.query(
+        note,
+        func.row_number().over(partition_by=key, order_by=(note.created_at.desc(), note.id.desc())).label("rank"),
+        func.count().over(partition_by=key).label("total"),
+        key.label("group_key")
+    ).filter(clause, visible_to(user)).subquery()
+    ranked_note = aliased(note, ranked)
+    rows = db.query(ranked_note, ranked.c.total, ranked.c.group_key).filter(
+        ranked.c.rank <= per_key
+    ).order_by(ranked.c.group_key, ranked.c.rank)
+
+    groups = {}
+    for row_note, total, group_key in rows:
+        groups.setdefault(group_key, (total, []))[1].append(row_note)
+    return {
+        group_key: (total, notes, encode_cursor(notes[-1]) if total > len(notes) else None)
+        for group_key, (total, notes) in groups.items()
+    }
+
+
+def add_shares(db: Session, note_id: str, usernames: list):
+    db.add_all(models.CommunityNoteShare(note_id=note_id, username=u) for u in dict.fromkeys(usernames))
+
+
+def _summary_insert(db: Session):
+    """INSERT construct with ON CONFLICT support for the bound database (Postgres or SQLite)"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(models.NoteSummary)
+
+
+def group_key(question: models.Question) -> str:
+    return question.content_hash or question.id
+
+
+def record_public_note(db: Session, key: str, created_at: datetime):
+    """Count a new public note in its summary row, race-free (does not commit)"""
+    table = models.NoteSummary
+    stmt = _summary_insert(db).values(question_hash=key, public_count=1, last_note_at=created_at)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.question_hash],
+        set_={
+            "public_count": table.public_count + 1,
+            "last_note_at": case(
+                (or_(table.last_note_at.is_(None), stmt.excluded.last_note_at > table.last_note_at), stmt.excluded.last_note_at),
+                else_=table.last_note_at
+            )
+        }
+    ))
+
+
+def refresh_summaries(db: Session, keys: set):
+    """Recompute the summaries of these group keys from community_notes (does not commit)"""
+    if not keys:
+        return
+    note = models.CommunityNote
+    table = models.NoteSummary
+    key = func.coalesce(note.question_hash, note.question_id)
+    rows = db.query(key, func.count(note.id), func.max(note.created_at)).filter(
+        or_(note.question_hash.in_(keys), and_(note.question_hash.is_(None), note.question_id.in_(keys))),
+        note.visibility == "public"
+    ).group_by(key).all()
+
+    empty = set(keys) - {k for k, _, _ in rows}
+    if empty:
+        db.query(table).filter(table.question_hash.in_(empty)).delete(synchronize_session=False)
+    if rows:
+        stmt = _summary_insert(db).values([
+            {"question_hash": k, "public_count": count, "last_note_at": last_note_at}
+            for k, count, last_note_at in rows
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.question_hash],
+            set_={"public_count": stmt.excluded.public_count, "last_note_at": stmt.excluded.last_note_at}
+        ))
+
+
+def rebuild_summaries(db: Session) -> int:
+    """Recompute every summary from community_notes to repair drift. Returns rows written. Commits."""
+    note = models.CommunityNote
+    key = func.coalesce(note.question_hash, note.question_id)
+    rows = db.query(key, func.count(note.id), func.max(note.created_at)).filter(
+        note.visibility == "public", key.isnot(None)
+    ).group_by(key).all()
+    db.query(models.NoteSummary).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.NoteSummary, [
+        {"question_hash": k, "public_count": count, "last_note_at": last_note_at}
+        for k, count, last_note_at in rows
+    ])
+    db.commit()
+    with _summary_lock:
+        _summaries.clear()
+    return len(rows)
+
+
+def forget_summaries(keys):
+    """Evict cached summaries; call after committing a change to them"""
+    with _summary_lock:
+        for key in keys:
+            _summaries.pop(key, None)
+
+
+def get_summaries(db: Session, keys) -> dict:
+    """Group key -> (public_count, last_note_at) for every key, from the cache or one query for the misses"""
+    result, missing = {}, []
+    now = time.monotonic()
+    with _summary_lock:
+        for key in set(keys):
+            entry = _summaries.get(key)
+            if entry is not None and entry[1] > now:
+                _summaries.move_to_end(key)
+                result[key] = entry[0]
+            else:
+                missing.append(key)
+    if not missing:
+        return result
+
+    table = models.NoteSummary
+    loaded = {key: (0, None) for key in missing}
+    for i in range(0, len(missing), MAX_BULK_QUESTIONS):
+        rows = db.query(table.question_hash, table.public_count, table.last_note_at).filter(
+            table.question_hash.in_(missing[i:i + MAX_BULK_QUESTIONS])
+        )
+        loaded.update({key: (count, last_note_at) for key, count, last_note_at in rows})
+    with _summary_lock:
+        for key, summary in loaded.items():
+            _summaries[key] = (summary, now + SUMMARY_CACHE_TTL)
+            _summaries.move_to_end(key)
+        while len(_summaries) > SUMMARY_CACHE_SIZE:
+            _summaries.popitem(last=False)
+    result.update(loaded)
+    return result
+
+
+def summaries_for_questions(db: Session, questions) -> dict:
+    """Question id -> {"count", "last_note_at"} for the badges of a list of questions"""
+    keys = {question.id: group_key(question) for question in questions}
+    summaries = get_summaries(db, keys.values())
+    return {
+        question_id: {"count": summaries[key][0], "last_note_at": summaries[key][1]}
+        for question_id, key in keys.items()
+    }
+
+
+def delete_for_questions(db: Session, question_ids: list) -> set:
+    """Delete the notes attached to these question ids, with their share rows, and refresh the
+    affected summaries. Returns the summary keys to forget after commit."""
+    note = models.CommunityNote
+    affected = {
+        key for (key,) in db.query(func.coalesce(note.question_hash, note.question_id)).filter(
+            note.question_id.in_(question_ids), note.visibility == "public"
+        ).distinct()
+    }
+    note_ids = db.query(note.id).filter(note.question_id.in_(question_ids))
+    db.query(models.CommunityNoteShare).filter(
+        models.CommunityNoteShare.note_id.in_(note_ids.scalar_subquery())
+    ).delete(synchronize_session=False)
+    db.query(note).filter(note.question_id.in_(question_ids)).delete(synchronize_session=False)
+    refresh_summaries(db, affected)
+    return affected
@@ -0,0 +1,117 @@
+"""
+bcrypt hashing and verification off the request path.
+
+Hashes are computed in a small dedicated process pool (PASSWORD_HASH_WORKERS processes, run at a
+lower CPU priority), so a burst of logins can't monopolize the API worker. At most
+PASSWORD_HASH_MAX_PENDING operations may be queued or running in the pool; further callers wait
+for a slot (blocked, not burning CPU) for up to PASSWORD_HASH_MAX_WAIT seconds, and only then
+get HashingOverloaded, so a login storm is served in turn instead of mostly rejected. A waiting
+caller holds its request thread, so keep MAX_WAIT well below client timeouts.
+
+Logins use passlib's verify_and_update: when BCRYPT_ROUNDS (or the scheme) changes, the stored
+hash is transparently upgraded the next time the user logs in.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+MAX_WAIT = float(os.getenv("PASSWORD_HASH_MAX_WAIT", "10"))
+# Inline hashing (no pool), e.g. for scripts and tests
+USE_POOL = os.getenv("PASSWORD_HASH_POOL", "true").lower() == "true"
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_pool = None
+_pool_lock = threading.Lock()
+_admission = threading.BoundedSemaphore(MAX_PENDING)
+_metrics_lock = threading.Lock()
+metrics = {"hashed": 0, "verified": 0, "rehashed": 0, "queued": 0, "rejected": 0}
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+def _count(metric: str):
+    with _metrics_lock:
+        metrics[metric] += 1
+
+
+def _lower_priority():
+    try:
+        os.nice(5)
+    except OSError:
+        pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, initializer=_lower_priority)
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _run(fn, *args):
+    if not _admission.acquire(blocking=False):
+        _count("queued")
+        if not _admission.acquire(timeout=MAX_WAIT):
+            _count("rejected")
+            raise HashingOverloaded()
+    try:
+        if not USE_POOL:
+            return fn(*args)
+        return get_pool().submit(fn, *args).result()
+    finally:
+        _admission.release()
+
+
+def hash_password(password: str) -> str:
+    _count("hashed")
+    return _run(_hash, password)
+
+
+def verify_password(password: str, hashed_password: str) -> tuple:
+    """(valid, new_hash). new_hash is set when the stored hash uses outdated parameters."""
+    if not hashed_password:
+        return False, None
+    _count("verified")
+    try:
+        valid, new_hash = _run(_verify_and_update, password, hashed_password)
+    except ValueError:
+        # Not a recognizable hash
+        return False, None
+    if valid and new_hash:
+        _count("rehashed")
+    return valid, new_hash
+
+
+def stats() -> dict:
+    with _metrics_lock:
+        result = dict(metrics)
+    result["workers"] = WORKERS if USE_POOL else 0
+    result["max_pending"] = MAX_PENDING
+    result["max_wait"] = MAX_WAIT
+    result["bcrypt_rounds"] = BCRYPT_ROUNDS
+    return result
@@ -0,0 +1,396 @@
+import os
+from types import SimpleNamespace
+from typing import Optional
+from datetime import datetime, timedelta
+from sqlalchemy import column, func, inspect, select, insert, literal, table
+from sqlalchemy.types import JSON
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+
+def get_members_quiz_stats(db: Session, usernames: list) -> dict:
+    """Per-quiz progress for every member in `usernames`, computed with a fixed number of queries.
+
+    Returns {username: [quiz_info, ...]} for existing users only; unknown usernames are
+    simply absent from the result. The number of queries does not depend on how many
+    members, quizzes or questions are involved.
+    """
+    if not usernames:
+        return {}
+
+    # 1. Resolve all members at once
+    users = db.query(models.User.id, models.User.username).filter(
+        models.User.username.in_(set(usernames))
+    ).all()
+    if not users:
+        return {}
+    user_ids = [u.id for u in users]
+
+    # 2. All quizzes owned by those members
+    quizzes = db.query(
+        models.Quiz.id, models.Quiz.user_id, models.Quiz.title, models.Quiz.provider
+    ).filter(models.Quiz.user_id.in_(user_ids)).order_by(models.Quiz.created_at).all()
+
+    # 3. Question totals per quiz
+    totals = dict(
+        db.query(models.Question.quiz_id, func.count(models.Question.id))
+        .join(models.Quiz, models.Quiz.id == models.Question.quiz_id)
+        .filter(models.Quiz.user_id.in_(user_ids))
+        .group_by(models.Question.quiz_id)
+        .all()
+    )
+
+    # 4. Answered counts per quiz, read from the materialized summaries (owner's own progress)
+    answered = dict(
+        db.query(models.QuizProgressSummary.quiz_id, models.QuizProgressSummary.answered_count)
+        .join(models.Quiz, models.Quiz.id == models.QuizProgressSummary.quiz_id)
+        .filter(
+            models.Quiz.user_id.in_(user_ids),
+            models.QuizProgressSummary.user_id == models.Quiz.user_id
+        )
+        .all()
+    )
+
+    quizzes_by_user = {u.id: [] for u in users}
+    for quiz in quizzes:
+        total_questions = totals.get(quiz.id, 0)
+        answered_questions = answered.get(quiz.id, 0)
+        quizzes_by_user[quiz.user_id].append({
+            "title": quiz.title,
+            "provider": quiz.provider,
+            "total_questions": total_questions,
+            "answered_questions": answered_questions,
+            "progress_percent": round((answered_questions / total_questions * 100) if total_questions > 0 else 0, 1)
+        })
+
+    return {u.username: quizzes_by_user[u.id] for u in users}
+
+
+# --- Materialized progress summaries ---
+
+def progress_state(progress, question) -> tuple:
+    """(answered, correct, flagged) as 0/1 ints for a progress row, or all zeros if there is none"""
+    if progress is None:
+        return (0, 0, 0)
+    answered = 1 if progress.selected_answer else 0
+    correct = 0
+    if answered and question is not None:
+        selected = next((o for o in (question.options or []) if o.get("id") == progress.selected_answer), None)
+        correct = 1 if selected and selected.get("label") == question.correct_answer_label else 0
+    flagged = 1 if (progress.is_flagged_disagree_key or progress.is_flagged_disagree_ai) else 0
+    return (answered, correct, flagged)
+
+
+def _add_to_summary(db: Session, user_id: str, quiz_id: str, answered: int, correct: int, flagged: int):
+    """Add to the (user, quiz) counters with one upsert, so the database does the arithmetic.
+
+    Concurrent writers to the same quiz don't lose increments, and the first write of a
+    quiz can't collide with another one on the primary key."""
+    table = models.QuizProgressSummary.__table__
+    stmt = _dialect_insert(db, models.QuizProgressSummary).values(
+        user_id=user_id, quiz_id=quiz_id,
+        answered_count=answered, correct_count=correct, flagged_count=flagged,
+        updated_at=datetime.utcnow()
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.quiz_id],
+        set_={
+            "answered_count": table.c.answered_count + stmt.excluded.answered_count,
+            "correct_count": table.c.correct_count + stmt.excluded.correct_count,
+            "flagged_count": table.c.flagged_count + stmt.excluded.flagged_count,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    ))
+
+
+def apply_progress_delta(db: Session, user_id: str, quiz_id: str, before: tuple, after: tuple):
+    """Adjust the (user, quiz) counters by the difference between two progress_state() tuples.
+
+    Does not commit; callers commit together with the progress write.
+    """
+    if before == after or not quiz_id:
+        return
+    _add_to_summary(db, user_id, quiz_id, *(after[i] - before[i] for i in range(3)))
+
+
+def clear_summaries(db: Session, user_id: Optional[str] = None, quiz_ids: Optional[list] = None):
+    """Delete summaries matching the given user and/or quizzes (does not commit)"""
+    query = db.query(models.QuizProgressSummary)
+    if user_id is not None:
+        query = query.filter(models.QuizProgressSummary.user_id == user_id)
+    if quiz_ids is not None:
+        query = query.filter(models.QuizProgressSummary.quiz_id.in_(quiz_ids))
+    query.delete(synchronize_session=False)
+
+
+def merge_summaries(db: Session, target_quiz_id: str, source_quiz_id: str):
+    """Fold the source quiz counters into the target quiz after its questions were moved (does not commit)"""
+    table = models.QuizProgressSummary
+    source_rows = db.query(
+        table.user_id, table.answered_count, table.correct_count, table.flagged_count
+    ).filter(table.quiz_id == source_quiz_id).with_for_update().all()
+    for user_id, answered, correct, flagged in source_rows:
+        _add_to_summary(db, user_id, target_quiz_id, answered, correct, flagged)
+    db.query(table).filter(table.quiz_id == source_quiz_id).delete(synchronize_session=False)
+
+
+def get_summaries(db: Session, user_id: str) -> list:
+    return db.query(models.QuizProgressSummary).filter(
+        models.QuizProgressSummary.user_id == user_id
+    ).all()
+
+
+# questions before migrate_question_content.py: content stored on each row
+_legacy_questions = table(
+    "questions",
+    column("id"), column("quiz_id"), column("options", JSON), column("correct_answer_label")
+)
+
+
+def _content_migrated(db: Session) -> bool:
+    """True once questions point at the shared question_content rows"""
+    inspector = inspect(db.get_bind())
+    return inspector.has_table("question_content") and "content_key" in {
+        c["name"] for c in inspector.get_columns("questions")
+    }
+
+
+def _summary_source_rows(db: Session):
+    progress = (
+        models.UserProgress.user_id,
+        models.UserProgress.selected_answer,
+        models.UserProgress.is_flagged_disagree_key,
+        models.UserProgress.is_flagged_disagree_ai,
+    )
+    if not _content_migrated(db):
+        # Scripts that rebuild before the question bank migration (e.g. dedupe_user_progress.py)
+        return db.query(
+            *progress,
+            _legacy_questions.c.quiz_id,
+            literal(None).label("option_ids"),
+            _legacy_questions.c.options,
+            _legacy_questions.c.correct_answer_label
+        ).join(_legacy_questions, _legacy_questions.c.id == models.UserProgress.question_id)
+    return db.query(
+        *progress,
+        models.Question.quiz_id,
+        models.Question.option_ids,
+        models.QuestionContent.options,
+        models.QuestionContent.correct_answer_label
+    ).join(models.Question, models.Question.id == models.UserProgress.question_id).outerjoin(
+        models.QuestionContent, models.QuestionContent.hash == models.Question.content_key
+    )
+
+
+def rebuild_summaries(db: Session, user_id: Optional[str] = None) -> int:
+    """Recompute summaries from user_progress to repair drift. Returns the number of rows written.
+
+    Commits when done. Restrict to one user with `user_id`, otherwise every user is rebuilt.
+    Works on databases not yet migrated to the shared question bank, reading the old columns.
+    """
+    rows = _summary_source_rows(db)
+    if user_id is not None:
+        rows = rows.filter(models.UserProgress.user_id == user_id)
+
+    counters = {}
+    for row in rows.yield_per(1000):
+        if not row.quiz_id:
+            continue
+        # Legacy rows carry their option ids inline
+        options = row.options if row.option_ids is None else models.merge_options(row.options, row.option_ids)
+        question = SimpleNamespace(options=options, correct_answer_label=row.correct_answer_label)
+        state = progress_state(row, question)
+        totals = counters.setdefault((row.user_id, row.quiz_id), [0, 0, 0])
+        for i in range(3):
+            totals[i] += state[i]
+
+    clear_summaries(db, user_id=user_id)
+    for (uid, quiz_id), (answered, correct, flagged) in counters.items():
+        db.add(models.QuizProgressSummary(
+            user_id=uid, quiz_id=quiz_id,
+            answered_count=answered, correct_count=correct, flagged_count=flagged
+        ))
+    db.commit()
+    return len(counters)
+
+
+# --- Progress writes ---
+
+MAX_BATCH_SIZE = 500
+
+
+def apply_progress_fields(db_progress, progress):
+    """Copy the fields set on a UserProgressUpdate onto a UserProgress row (None means unchanged)"""
+    if progress.selected_answer is not None:
+        db_progress.selected_answer = progress.selected_answer
+    if progress.is_flagged_disagree_key is not None:
+        db_progress.is_flagged_disagree_key = progress.is_flagged_disagree_key
+    if progress.is_flagged_disagree_ai is not None:
+        db_progress.is_flagged_disagree_ai = progress.is_flagged_disagree_ai
+    if progress.ai_analysis is not None:
+        db_progress.ai_analysis = progress.ai_analysis
+
+
+def _dialect_insert(db: Session, model=models.UserProgress):
+    """INSERT construct with ON CONFLICT support for the bound database (Postgres or SQLite)"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model)
+
+
+def _ensure_progress_rows(db: Session, user_id: str, question_ids: list) -> set:
+    """Insert blank progress rows for questions that have none, racing safely on the
+    (user_id, question_id) unique index. Returns the question_ids that were inserted."""
+    now = datetime.utcnow()
+    stmt = _dialect_insert(db).values([
+        {
+            "id": models.generate_uuid(),
+            "user_id": user_id,
+            "question_id": question_id,
+            "is_flagged_disagree_key": False,
+            "is_flagged_disagree_ai": False,
+            "updated_at": now
+        }
+        for question_id in question_ids
+    ]).on_conflict_do_nothing(
+        index_elements=["user_id", "question_id"]
+    ).returning(models.UserProgress.question_id)
+    return set(db.execute(stmt).scalars().all())
+
+
+def write_progress(db: Session, user_id: str, updates: list):
+    """Apply UserProgressUpdate records for one user in a single transaction (race-free upsert).
+
+    Missing rows are created with INSERT ... ON CONFLICT DO NOTHING, then every affected row
+    is locked with SELECT ... FOR UPDATE so concurrent writers to the same question serialize
+    and see the true before/after state. The per-quiz deltas are added to the summary counters
+    with an upsert that increments in the database, so writers to different questions of the
+    same quiz don't overwrite each other's counts. Updates for the same question
+    are applied in order; unknown questions are reported instead of failing the batch.
+
+    Returns ([{"question_id", "status", "detail"}, ...], {question_id: UserProgress}).
+    """
+    question_ids = list(dict.fromkeys(u.question_id for u in updates))
+    questions = {
+        q.id: q for q in db.query(models.Question).filter(models.Question.id.in_(question_ids)).all()
+    }
+    known_ids = [qid for qid in question_ids if qid in questions]
+
+    created = _ensure_progress_rows(db, user_id, known_ids) if known_ids else set()
+    rows = {
+        p.question_id: p for p in db.query(models.UserProgress).filter(
+            models.UserProgress.user_id == user_id,
+            models.UserProgress.question_id.in_(known_ids)
+        ).with_for_update().all()
+    } if known_ids else {}
+
+    results = []
+    deltas = {}
+    seen = set()
+    for update in updates:
+        question = questions.get(update.question_id)
+        if question is None:
+            results.append({"question_id": update.question_id, "status": "error", "detail": "Question not found"})
+            continue
+
+        db_progress = rows[update.question_id]
+        is_new = update.question_id in created and update.question_id not in seen
+        seen.add(update.question_id)
+        before = progress_state(None if is_new else db_progress, question)
+        apply_progress_fields(db_progress, update)
+        after = progress_state(db_progress, question)
+
+        delta = deltas.setdefault(question.quiz_id, [0, 0, 0])
+        for i in range(3):
+            delta[i] += after[i] - before[i]
+        results.append({"question_id": update.question_id, "status": "created" if is_new else "updated", "detail": None})
+
+    for quiz_id, delta in deltas.items():
+        apply_progress_delta(db, user_id, quiz_id, (0, 0, 0), tuple(delta))
+
+    db.commit()
+    return results, rows
+
+
+# --- Delta sync ---
+
+TOMBSTONE_RETENTION_DAYS = 30
+# updated_at/deleted_at are stamped when the statement runs, not when its transaction commits,
+# so a row can become visible with a timestamp older than a cursor handed out in between.
+# Cursors trail the clock by the longest a progress-writing transaction may stay open.
+SYNC_CURSOR_LAG = timedelta(seconds=int(os.getenv("SYNC_CURSOR_LAG_SECONDS", "30")))
+
+
+def record_tombstones(db: Session, user_id: str, question_ids: Optional[list] = None):
+    """Write tombstones for the user's progress rows that are about to be deleted (does not commit).
+
+    Call before deleting the rows. `question_ids=None` covers all of the user's progress.
+    Tombstones older than TOMBSTONE_RETENTION_DAYS are purged on the way.
+    """
+    filters = [models.UserProgress.user_id == user_id]
+    if question_ids is not None:
+        filters.append(models.UserProgress.question_id.in_(question_ids))
+    doomed = select(models.UserProgress.question_id).where(*filters)
+
+    now = datetime.utcnow()
+    db.query(models.ProgressTombstone).filter(
+        models.ProgressTombstone.user_id == user_id,
+        models.ProgressTombstone.question_id.in_(doomed)
+        | (models.ProgressTombstone.deleted_at < now - timedelta(days=TOMBSTONE_RETENTION_DAYS))
+    ).delete(synchronize_session=False)
+    db.execute(
+        insert(models.ProgressTombstone).from_select(
+            ["user_id", "question_id", "deleted_at"],
+            select(literal(user_id), models.UserProgress.question_id, literal(now)).where(*filters)
+        )
+    )
+
+
+def cursor_expired(since: datetime) -> bool:
+    """True when tombstones older than `since` may already have been purged"""
+    return since < datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+
+def sync_cursor() -> datetime:
+    """Cursor for the next delta sync, taken before reading.
+
+    It lags the clock by SYNC_CURSOR_LAG, so writes still committing when it is taken are
+    returned by the next sync. Consecutive deltas overlap by that window; clients apply rows
+    by question_id, so seeing a row twice is harmless.
+    """
+    return datetime.utcnow() - SYNC_CURSOR_LAG
+
+
+def get_progress_delta(db: Session, user_id: str, since: datetime) -> dict:
+    """Rows written and question_ids reset at or after `since`, plus the cursor for the next call.
+
+    The comparison is inclusive and the cursor lags (see sync_cursor), so a write racing
+    with the sync is returned again next time rather than lost.
+    """
+    cursor = sync_cursor()
+    progress = db.query(models.UserProgress).filter(
+        models.UserProgress.user_id == user_id,
+        models.UserProgress.updated_at >= since
+    ).all()
+    deleted = [t[0] for t in db.query(models.ProgressTombstone.question_id).filter(
+        models.ProgressTombstone.user_id == user_id,
+        models.ProgressTombstone.deleted_at >= since
+    ).all()]
+    return {"progress": progress, "deleted": deleted, "cursor": cursor}
+
+
+def iter_progress_json(db: Session, user_id: str):
+    """Yield the user's full progress as a JSON array, a chunk at a time, without building the list"""
+    rows = db.query(models.UserProgress).filter(
+        models.UserProgress.user_id == user_id
+    ).yield_per(500)
+    yield "["
+    first = True
+    for row in rows:
+        item = schemas.UserProgress.model_validate(row).model_dump_json()
+        yield item if first else "," + item
+        first = False
+    yield "]"
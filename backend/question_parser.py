@@ -0,0 +1,109 @@
+"""
+Incremental port of services/parserService.ts (parseContentToBlocks, without the chunking).
+
+The file is read line by line and each question is yielded as soon as its block is
+complete, so neither the whole text nor the whole parsed bank is ever held in memory.
+"""
+import codecs
+import re
+import uuid
+
+# A new block starts at a line beginning with a question header ("QUESTÃO 1", "Question: 1", "1.", "1)")
+BLOCK_START_REGEX = re.compile(r"^(?:(?:QUESTÃO|QUESTAO|Question|Q)[\s:]*\d+|\d+[.\-)\s])", re.IGNORECASE)
+HEADER_REGEX = re.compile(r"^(?:QUESTÃO|QUESTAO|Question|Q)?[\s:]*(\d+)", re.IGNORECASE)
+OPTION_REGEX = re.compile(r"(?:\n+|^)\s*([A-E])[).:\s]\s+")
+ANSWER_REGEX = re.compile(r"(?:Resposta|Answer|Gabarito|Ans|Correct)\s*[:.\-]?\s*([A-E])", re.IGNORECASE)
+EXPLANATION_LABEL_REGEX = re.compile(r"(?:Explanation|Explicação|Comentário|Justificativa)\s*[:.]?", re.IGNORECASE)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def detect_encoding(file_path: str) -> str:
+    """'utf-8' if the whole file decodes as UTF-8, else 'latin-1'. Reads in chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    decoder.decode(b"", final=True)
+                    return "utf-8"
+                decoder.decode(chunk)
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def parse_block(block: str):
+    """Parse one question block. Returns a QuestionCreate-shaped dict, or None if the block is rejected."""
+    trimmed = block.strip()
+    if not trimmed:
+        return None
+
+    # 1. Remove the question header
+    remaining = trimmed
+    header_match = HEADER_REGEX.match(trimmed)
+    if header_match:
+        remaining = trimmed[header_match.end():].strip()
+        remaining = re.sub(r"^[:.\-)\s]+", "", remaining)
+
+    # 2. Extract answer and explanation
+    answer = None
+    explanation = ""
+    question_and_options = remaining
+    answer_match = ANSWER_REGEX.search(remaining)
+    if answer_match:
+        answer = answer_match.group(1).upper()
+        question_and_options = remaining[:answer_match.start()].strip()
+        after_answer = remaining[answer_match.end():].strip()
+        explanation = EXPLANATION_LABEL_REGEX.sub("", after_answer, count=1).strip()
+
+    # 3. Extract options and question text
+    options = []
+    question_text = question_and_options
+    option_matches = list(OPTION_REGEX.finditer(question_and_options))
+    if option_matches:
+        question_text = question_and_options[:option_matches[0].start()].strip()
+        for i, match in enumerate(option_matches):
+            end = option_matches[i + 1].start() if i + 1 < len(option_matches) else len(question_and_options)
+            option_text = question_and_options[match.end():end].strip()
+            if option_text:
+                options.append({"id": str(uuid.uuid4()), "label": match.group(1).upper(), "text": option_text})
+
+    if question_text and options and answer:
+        return {
+            "id": str(uuid.uuid4()),
+            "text": question_text,
+            "options": options,
+            "correct_answer_label": answer,
+            "explanation": explanation or None
+        }
+    print(f"Block rejected. Header: {trimmed[:30]}... Options: {len(options)}, Answer: {'Yes' if answer else 'No'}")
+    return None
+
+
+def iter_blocks(lines):
+    """Group an iterable of lines into raw question blocks"""
+    current = []
+    for line in lines:
+        line = line.replace("\r\n", "\n").replace("\r", "\n")
+        if current and BLOCK_START_REGEX.match(line):
+            yield "".join(current)
+            current = []
+        current.append(line)
+    if current:
+        yield "".join(current)
+
+
+def iter_questions(lines):
+    """Yield parsed questions from an iterable of lines, one block at a time"""
+    for block in iter_blocks(lines):
+        question = parse_block(block)
+        if question:
+            yield question
+
+
+def iter_questions_from_file(file_path: str, encoding: str = None):
+    """Yield parsed questions from a question bank file, detecting UTF-8 vs latin-1 first"""
+    encoding = encoding or detect_encoding(file_path)
+    with open(file_path, "r", encoding=encoding) as f:
+        yield from iter_questions(f)
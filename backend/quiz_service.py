@@ -0,0 +1,136 @@
+import io
+import json
+from sqlalchemy import exists, insert
+from sqlalchemy.orm import Session
+
+from . import models, search_service
+
+INSERT_BATCH_SIZE = 1000
+# Above this many rows Postgres imports go through COPY instead of batched INSERTs
+COPY_THRESHOLD = 2000
+
+QUESTION_COLUMNS = ["id", "quiz_id", "position", "content_key", "option_ids", "content_hash"]
+
+
+def build_question_rows(quiz_id: str, questions: list, start_position: int = 0) -> tuple:
+    """Row dicts for a list of QuestionCreate: (question rows, {content key: question_content row}).
+
+    Identical questions in the list share one content row."""
+    rows = []
+    contents = {}
+    for i, q in enumerate(questions):
+        options = [{"label": opt.label, "text": opt.text} for opt in q.options]
+        key = models.create_content_key(q.text, q.correct_answer_label, q.explanation, options)
+        if key not in contents:
+            contents[key] = {
+                "hash": key,
+                "text": q.text,
+                "correct_answer_label": q.correct_answer_label,
+                "explanation": q.explanation,
+                "options": options,
+            }
+        rows.append({
+            "id": q.id,
+            "quiz_id": quiz_id,
+            "position": start_position + i,
+            "content_key": key,
+            "option_ids": [opt.id for opt in q.options],
+            "content_hash": models.create_question_hash(q.text)
+        })
+    return rows, contents
+
+
+def _content_insert(db: Session):
+    """INSERT construct with ON CONFLICT support for the bound database (Postgres or SQLite)"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(models.QuestionContent)
+
+
+def insert_contents(db: Session, contents: dict) -> list:
+    """Store the content rows the bank doesn't have yet. Returns the keys that were missing.
+
+    Existing keys are looked up first so re-imports of a known file write nothing here;
+    ON CONFLICT DO NOTHING covers a concurrent import of the same content. Does not commit."""
+    table = models.QuestionContent
+    keys = list(contents)
+    existing = set()
+    for i in range(0, len(keys), INSERT_BATCH_SIZE):
+        existing.update(k for (k,) in db.query(table.hash).filter(table.hash.in_(keys[i:i + INSERT_BATCH_SIZE])))
+    new_rows = [row for key, row in contents.items() if key not in existing]
+    for i in range(0, len(new_rows), INSERT_BATCH_SIZE):
+        db.execute(_content_insert(db).on_conflict_do_nothing(index_elements=[table.hash]), new_rows[i:i + INSERT_BATCH_SIZE])
+    return [row["hash"] for row in new_rows]
+
+
+def prune_orphan_content(db: Session) -> list:
+    """Delete content rows no question references any more. Returns their keys. Does not commit.
+
+    Deleting a quiz leaves its content in the bank (another user may import it again, and a
+    concurrent import may be about to reference it); migrate_question_content runs this."""
+    table = models.QuestionContent
+    orphaned = ~exists().where(models.Question.content_key == table.hash)
+    keys = [k for (k,) in db.query(table.hash).filter(orphaned)]
+    for i in range(0, len(keys), INSERT_BATCH_SIZE):
+        db.query(table).filter(table.hash.in_(keys[i:i + INSERT_BATCH_SIZE]), orphaned).delete(synchronize_session=False)
+    return keys
+
+
+def _copy_escape(value) -> str:
+    """Render a value for COPY ... FROM STDIN in text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, ensure_ascii=False)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_rows(db: Session, rows: list):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_escape(row[c]) for c in QUESTION_COLUMNS))
+        buffer.write("\n")
+    buffer.seek(0)
+    # Same connection/transaction as the session, so the quiz row and questions commit together
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {models.Question.__tablename__} ({', '.join(QUESTION_COLUMNS)}) FROM STDIN",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def bulk_insert_questions(db: Session, quiz_id: str, questions: list, start_position: int = 0) -> list:
+    """Insert questions without building ORM objects. Returns the inserted ids in order.
+
+    Content goes to the shared question_content bank (only keys it doesn't have yet); the
+    questions themselves are small reference rows. SQLite and small Postgres imports use
+    batched executemany INSERTs; large Postgres imports are streamed with COPY. The rows are
+    added to the search index in the same transaction. Does not commit.
+    """
+    if not questions:
+        return []
+    # autoflush is off: make sure a freshly added quiz row exists before referencing it
+    db.flush()
+    rows, contents = build_question_rows(quiz_id, questions, start_position)
+    new_keys = insert_contents(db, contents)
+
+    if db.get_bind().dialect.name == "postgresql" and len(rows) >= COPY_THRESHOLD:
+        _copy_rows(db, rows)
+    else:
+        table = models.Question.__table__
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            db.execute(insert(table), rows[i:i + INSERT_BATCH_SIZE])
+
+    search_service.index_questions(db, quiz_id, rows, {key: contents[key] for key in new_keys})
+    return [row["id"] for row in rows]
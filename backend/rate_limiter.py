@@ -0,0 +1,231 @@
+"""
+Token-bucket rate limiting for the AI endpoints.
+
+Two layers:
+- per user, at the endpoint: AI_USER_RPM requests per minute with a burst of AI_USER_BURST;
+  over the limit the request is rejected with 429 and Retry-After. Batch analysis has its own
+  bucket, charged one token per question sent upstream: AI_BATCH_QPM questions per minute with
+  a burst of AI_BATCH_BURST (a full block), so a batch never eats into single-question calls.
+- global, right before each upstream Groq call: GROQ_RPM requests and GROQ_TPM tokens per
+  minute. Calls over budget wait in line for up to RATE_LIMIT_MAX_WAIT seconds instead of
+  being sent to Groq to collect a 429. Token cost is charged up front from the prompt size
+  plus max_tokens, and the unused part is refunded once the real usage is known.
+
+Bucket state lives in a pluggable backend: "database" (the rate_limit_buckets table, shared by
+every worker process; the default) or "memory" (process-local).
+"""
+import asyncio
+import os
+import threading
+import time
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .database import SessionLocal
+
+USER_RPM = float(os.getenv("AI_USER_RPM", "10"))
+USER_BURST = float(os.getenv("AI_USER_BURST", "5"))
+BATCH_QPM = float(os.getenv("AI_BATCH_QPM", "20"))
+BATCH_BURST = float(os.getenv("AI_BATCH_BURST", "100"))
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "12000"))
+MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "20"))
+
+CAS_RETRIES = 10
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded ({scope}), retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class Bucket:
+    def __init__(self, name: str, capacity: float, per_minute: float):
+        self.name = name
+        self.capacity = capacity
+        self.rate = per_minute / 60.0  # tokens per second
+
+
+GLOBAL_REQUESTS = Bucket("groq:requests", GROQ_RPM, GROQ_RPM)
+GLOBAL_TOKENS = Bucket("groq:tokens", GROQ_TPM, GROQ_TPM)
+
+
+def user_bucket(user_id: str) -> Bucket:
+    return Bucket(f"user:{user_id}", USER_BURST, USER_RPM)
+
+
+def batch_bucket(user_id: str) -> Bucket:
+    return Bucket(f"user-batch:{user_id}", BATCH_BURST, BATCH_QPM)
+
+
+def _refill(tokens: float, updated_at: float, bucket: Bucket, now: float) -> float:
+    return min(bucket.capacity, tokens + max(0.0, now - updated_at) * bucket.rate)
+
+
+class MemoryBackend:
+    """Process-local bucket state"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = {}  # key -> (tokens, updated_at)
+
+    def take(self, bucket: Bucket, amount: float) -> float:
+        """Take `amount` tokens (negative refunds). Returns 0 on success, else seconds until enough refill."""
+        now = time.time()
+        with self.lock:
+            tokens, updated_at = self.state.get(bucket.name, (bucket.capacity, now))
+            tokens = _refill(tokens, updated_at, bucket, now)
+            if tokens < amount:
+                return (amount - tokens) / bucket.rate
+            self.state[bucket.name] = (min(bucket.capacity, tokens - amount), now)
+            return 0.0
+
+    def level(self, bucket: Bucket) -> float:
+        with self.lock:
+            tokens, updated_at = self.state.get(bucket.name, (bucket.capacity, time.time()))
+        return _refill(tokens, updated_at, bucket, time.time())
+
+
+class DatabaseBackend:
+    """Bucket state in the rate_limit_buckets table, updated with compare-and-set on `version`"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or SessionLocal
+
+    def take(self, bucket: Bucket, amount: float) -> float:
+        table = models.RateLimitBucket
+        for _ in range(CAS_RETRIES):
+            now = time.time()
+            db = self.session_factory()
+            try:
+                row = db.get(table, bucket.name)
+                if row is None:
+                    tokens, updated_at, version = bucket.capacity, now, None
+                else:
+                    tokens, updated_at, version = row.tokens, row.updated_at, row.version
+                tokens = _refill(tokens, updated_at, bucket, now)
+                if tokens < amount:
+                    return (amount - tokens) / bucket.rate
+
+                remaining = min(bucket.capacity, tokens - amount)
+                if version is None:
+                    db.add(table(key=bucket.name, tokens=remaining, updated_at=now, version=0))
+                    db.commit()
+                    return 0.0
+                swapped = db.execute(
+                    update(table)
+                    .where(table.key == bucket.name, table.version == version)
+                    .values(tokens=remaining, updated_at=now, version=version + 1)
+                ).rowcount
+                db.commit()
+                if swapped:
+                    return 0.0
+                # Another process updated the bucket first; re-read and try again
+            except IntegrityError:
+                db.rollback()
+            finally:
+                db.close()
+        return 1.0 / bucket.rate
+
+    def level(self, bucket: Bucket) -> float:
+        db = self.session_factory()
+        try:
+            row = db.get(models.RateLimitBucket, bucket.name)
+            if row is None:
+                return bucket.capacity
+            return _refill(row.tokens, row.updated_at, bucket, time.time())
+        finally:
+            db.close()
+
+
+def make_backend():
+    if os.getenv("RATE_LIMIT_BACKEND", "database").lower() == "memory":
+        return MemoryBackend()
+    return DatabaseBackend()
+
+
+backend = make_backend()
+
+_metrics_lock = threading.Lock()
+metrics = {"user_allowed": 0, "user_rejected": 0, "upstream_allowed": 0, "upstream_queued": 0,
+           "upstream_rejected": 0, "upstream_wait_seconds": 0.0}
+
+
+def _count(metric: str, value=1):
+    with _metrics_lock:
+        metrics[metric] += value
+
+
+def try_take_all(charges: list) -> float:
+    """Take from every (bucket, amount) or from none. Returns 0 on success, else the longest wait."""
+    taken = []
+    for bucket, amount in charges:
+        wait = backend.take(bucket, min(amount, bucket.capacity))
+        if wait:
+            for done_bucket, done_amount in taken:
+                backend.take(done_bucket, -done_amount)
+            return wait
+        taken.append((bucket, min(amount, bucket.capacity)))
+    return 0.0
+
+
+def check_user(user_id: str):
+    """Per-user limit for AI endpoints. Raises RateLimitExceeded without waiting."""
+    wait = try_take_all([(user_bucket(user_id), 1)])
+    if wait:
+        _count("user_rejected")
+        raise RateLimitExceeded("user", wait)
+    _count("user_allowed")
+
+
+def check_user_batch(user_id: str, questions: int):
+    """Per-user limit for batch analysis, one token per question. Raises RateLimitExceeded without waiting."""
+    wait = try_take_all([(batch_bucket(user_id), questions)])
+    if wait:
+        _count("user_rejected")
+        raise RateLimitExceeded("user", wait)
+    _count("user_allowed")
+
+
+async def acquire_upstream(estimated_tokens: int) -> int:
+    """Wait for room in Groq's request and token budgets. Returns the tokens charged.
+
+    Raises RateLimitExceeded if the wait would exceed MAX_WAIT.
+    """
+    charges = [(GLOBAL_REQUESTS, 1), (GLOBAL_TOKENS, estimated_tokens)]
+    waited = 0.0
+    while True:
+        wait = await run_in_threadpool(try_take_all, charges)
+        if not wait:
+            _count("upstream_allowed")
+            if waited:
+                _count("upstream_wait_seconds", waited)
+            return min(estimated_tokens, int(GLOBAL_TOKENS.capacity))
+        if waited + wait > MAX_WAIT:
+            _count("upstream_rejected")
+            raise RateLimitExceeded("groq", wait)
+        if not waited:
+            _count("upstream_queued")
+        await asyncio.sleep(wait)
+        waited += wait
+
+
+async def refund_tokens(amount: int):
+    """Give back tokens charged by acquire_upstream but not actually used"""
+    if amount > 0:
+        await run_in_threadpool(backend.take, GLOBAL_TOKENS, -amount)
+
+
+def stats() -> dict:
+    with _metrics_lock:
+        result = dict(metrics)
+    result["upstream_wait_seconds"] = round(result["upstream_wait_seconds"], 2)
+    result["backend"] = type(backend).__name__
+    result["groq_requests_available"] = round(backend.level(GLOBAL_REQUESTS), 2)
+    result["groq_tokens_available"] = round(backend.level(GLOBAL_TOKENS))
+    return result
@@ -0,0 +1,30 @@
+"""
+Script para criar e reconstruir a tabela note_summaries (contagem de notas públicas e data
+da última nota por questão) a partir de community_notes.
+Use após deploy inicial da tabela ou se os contadores divergirem.
+
+Uso: python -m backend.rebuild_note_summaries
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from backend.database import SessionLocal, engine
+from backend.models import Base
+from backend import notes_service
+
+def rebuild():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print("🔄 Reconstruindo resumos de notas da comunidade...")
+        written = notes_service.rebuild_summaries(db)
+        print(f"✅ {written} resumos de questões gravados")
+    except Exception as e:
+        print(f"❌ Erro durante reconstrução: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild()
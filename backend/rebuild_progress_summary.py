@@ -0,0 +1,39 @@
+"""
+Script para reconstruir a tabela quiz_progress_summary a partir de user_progress.
+Use após deploy inicial da tabela ou se os contadores divergirem.
+
+Uso: python -m backend.rebuild_progress_summary [username]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from backend.database import SessionLocal, engine
+from backend.models import Base, User
+from backend import progress_service
+
+def rebuild(username=None):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user_id = None
+        if username:
+            user = db.query(User).filter(User.username == username).first()
+            if not user:
+                print(f"❌ Usuário '{username}' não encontrado!")
+                return
+            user_id = user.id
+            print(f"🔄 Reconstruindo contadores de progresso de '{username}'...")
+        else:
+            print("🔄 Reconstruindo contadores de progresso de todos os usuários...")
+
+        written = progress_service.rebuild_summaries(db, user_id=user_id)
+        print(f"✅ {written} resumos (usuário, quiz) gravados")
+    except Exception as e:
+        print(f"❌ Erro durante reconstrução: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,30 @@
+"""
+Script para criar e reconstruir o índice de busca full-text (questões e notas da comunidade).
+Use após o deploy inicial da busca, para indexar o conteúdo já existente.
+
+Uso: python -m backend.rebuild_search_index
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from backend.database import SessionLocal, engine
+from backend.models import Base
+from backend import search_service
+
+def rebuild():
+    Base.metadata.create_all(bind=engine)
+    search_service.ensure_schema(engine)
+    db = SessionLocal()
+    try:
+        print("🔄 Reconstruindo índice de busca...")
+        indexed = search_service.rebuild(db)
+        print(f"✅ {indexed} questões indexadas")
+    except Exception as e:
+        print(f"❌ Erro durante reconstrução: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild()
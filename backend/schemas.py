@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Any
+from typing import Dict, List, Optional, Any
 from datetime import datetime
 
 class Option(BaseModel):
@@ -31,16 +31,60 @@ class QuizBase(BaseModel):
 class QuizCreate(QuizBase):
     questions: List[QuestionCreate]
 
+class NoteSummary(BaseModel):
+    count: int  # Public notes
+    last_note_at: Optional[datetime] = None
+
 class Quiz(QuizBase):
     id: str
     created_at: datetime
     questions: List[Question]
     workplace_id: Optional[str] = None
+    note_summaries: Dict[str, NoteSummary] = {}  # question id -> public note badge
     
     # We might want to include progress here or fetch separately
     class Config:
         from_attributes = True
 
+class QuizImportResult(QuizBase):
+    id: str
+    created_at: datetime
+    inserted_ids: List[str]
+    inserted_count: int
+
+class QuestionsAppendResult(BaseModel):
+    quiz_id: str
+    inserted_ids: List[str]
+    inserted_count: int
+    question_count: int
+
+class QuizSummary(QuizBase):
+    id: str
+    created_at: datetime
+    question_count: int
+
+class QuestionPage(BaseModel):
+    quiz_id: str
+    total: int
+    skip: int
+    limit: int
+    items: List[Question]
+    note_summaries: Dict[str, NoteSummary] = {}
+
+class SearchHit(BaseModel):
+    question: Question
+    quiz_id: str
+    quiz_title: Optional[str] = None
+    score: float
+    matched_in: List[str]  # "question" and/or "notes"
+
+class SearchResults(BaseModel):
+    query: str
+    offset: int
+    limit: int
+    has_more: bool
+    items: List[SearchHit]
+
 class UserProgressBase(BaseModel):
     question_id: str
     selected_answer: Optional[str] = None
@@ -57,6 +101,24 @@ class UserProgress(UserProgressBase):
     class Config:
         from_attributes = True
 
+class ProgressDelta(BaseModel):
+    progress: List[UserProgress]
+    deleted: List[str]  # question_ids whose progress was reset since the cursor
+    cursor: datetime
+
+class ProgressBatchResult(BaseModel):
+    question_id: str
+    status: str  # "created", "updated" or "error"
+    detail: Optional[str] = None
+
+class QuizProgressSummary(BaseModel):
+    quiz_id: str
+    answered_count: int
+    correct_count: int
+    flagged_count: int
+    class Config:
+        from_attributes = True
+
 class UserBase(BaseModel):
     username: str
     email: Optional[str] = None
@@ -100,6 +162,21 @@ class CommunityNote(CommunityNoteBase):
     class Config:
         from_attributes = True
 
+class CommunityNotesBulkRequest(BaseModel):
+    quiz_id: Optional[str] = None
+    question_ids: Optional[List[str]] = None
+    counts_only: bool = False
+    per_question: int = 5  # Newest notes returned per group; older ones via next_cursor
+
+class CommunityNoteGroup(BaseModel):
+    count: int  # Visible notes in the group
+    notes: List[CommunityNote] = []
+    next_cursor: Optional[str] = None  # `before` for GET /community-notes/{question_id}
+
+class CommunityNotesBulk(BaseModel):
+    questions: Dict[str, str]  # question id -> group key (content hash, or the id itself when unhashed)
+    groups: Dict[str, CommunityNoteGroup]
+
 class StudyGroupBase(BaseModel):
     name: str
     members: List[str]
@@ -130,3 +207,17 @@ class Workplace(WorkplaceBase):
 
 class QuizUpdateQuestions(BaseModel):
     questions: List[QuestionCreate]
+
+class GenerationJob(BaseModel):
+    id: str
+    status: str
+    difficulty: str
+    count: int
+    quiz_id: Optional[str] = None
+    questions: Optional[List[QuestionCreate]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,416 @@
+"""
+Full-text search over the question bank: question text, options and explanation, plus the
+community notes visible to the caller.
+
+Two backends behind one interface, picked from the engine's dialect:
+- SQLite: FTS5 tables (unicode61 tokenizer). FTS5 has no Portuguese stemmer, so query terms are
+  reduced with a light suffix stripper and matched as prefixes.
+- PostgreSQL: tsvector columns with GIN indexes and the 'portuguese' text search configuration.
+
+Question documents are indexed once per unique content (see models.QuestionContent), with a
+small (question id, user id) reference table narrowing matches to the caller's questions.
+Text is accent-folded in Python before indexing and querying, so both backends treat
+"informação" and "informacao" alike without extensions. The index is maintained in the same
+transaction as the rows it mirrors: index_questions from quiz_service.bulk_insert_questions,
+index_note from note creation, and the remove_* calls wherever questions or notes are deleted.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import Float, String, func, text
+from sqlalchemy.orm import Session
+
+from . import models, notes_service
+
+MAX_QUERY_TERMS = 8
+MAX_RESULTS = 500  # offset + limit
+NOTE_MATCH_WEIGHT = 0.5  # A question matched only through its notes ranks below direct matches
+INDEX_BATCH_SIZE = 500
+# Per-question tables from before the shared question bank, dropped by migrate_question_content
+LEGACY_TABLES = ("search_questions", "search_question_docs")
+
+PT_STOPWORDS = {
+    "a", "o", "as", "os", "e", "de", "da", "do", "das", "dos", "em", "na", "no", "nas", "nos",
+    "um", "uma", "uns", "umas", "para", "por", "com", "que", "se", "ou", "ao", "aos", "qual", "quais",
+}
+# Longest first; applied once, keeping at least 4 characters of stem (SQLite only)
+PT_SUFFIXES = (
+    "amentos", "imentos", "amento", "imento", "mente", "idades", "idade", "acoes", "icoes",
+    "acao", "icao", "coes", "cao", "soes", "sao", "ismos", "ismo", "istas", "ista",
+    "ivas", "ivos", "iva", "ivo", "oes", "aes", "ais", "eis", "as", "os", "es", "a", "o", "e", "s",
+)
+
+
+def fold(value: str) -> str:
+    """Lowercase and strip accents"""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def query_terms(query: str) -> list:
+    terms = [t for t in re.findall(r"\w+", fold(query)) if t not in PT_STOPWORDS]
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+def light_stem(term: str) -> str:
+    for suffix in PT_SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 4:
+            return term[:-len(suffix)]
+    return term
+
+
+def _options_text(options) -> str:
+    return " ".join(opt.get("text", "") for opt in options or [] if isinstance(opt, dict))
+
+
+class SQLiteSearchBackend:
+    """FTS5 tables keyed by rowid, with plain tables mapping rowids to content keys/note ids"""
+
+    def ensure_schema(self, conn):
+        for statement in (
+            "CREATE TABLE IF NOT EXISTS search_content_docs (id INTEGER PRIMARY KEY, content_key TEXT NOT NULL UNIQUE)",
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_content USING fts5(text, options, explanation, tokenize='unicode61 remove_diacritics 2')",
+            "CREATE TABLE IF NOT EXISTS search_question_refs (question_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, doc_id INTEGER NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_search_question_refs_doc_user ON search_question_refs (doc_id, user_id)",
+            "CREATE TABLE IF NOT EXISTS search_note_docs (id INTEGER PRIMARY KEY, note_id TEXT NOT NULL UNIQUE, group_key TEXT NOT NULL)",
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_notes USING fts5(content, tokenize='unicode61 remove_diacritics 2')",
+        ):
+            conn.execute(text(statement))
+
+    def match_expression(self, terms: list) -> str:
+        return " ".join(f'"{light_stem(t)}"*' for t in terms)
+
+    def _in_clause(self, values: list) -> tuple:
+        params = {f"id{j}": value for j, value in enumerate(values)}
+        return ", ".join(f":{name}" for name in params), params
+
+    def _delete_docs(self, db: Session, docs: str, fts: str, key: str, ids: list):
+        for i in range(0, len(ids), INDEX_BATCH_SIZE):
+            placeholders, params = self._in_clause(ids[i:i + INDEX_BATCH_SIZE])
+            db.execute(text(f"DELETE FROM {fts} WHERE rowid IN (SELECT id FROM {docs} WHERE {key} IN ({placeholders}))"), params)
+            db.execute(text(f"DELETE FROM {docs} WHERE {key} IN ({placeholders})"), params)
+
+    def index_contents(self, db: Session, docs: list):
+        for i in range(0, len(docs), INDEX_BATCH_SIZE):
+            batch = docs[i:i + INDEX_BATCH_SIZE]
+            placeholders, params = self._in_clause([d["content_key"] for d in batch])
+            select_ids = text(f"SELECT content_key, id FROM search_content_docs WHERE content_key IN ({placeholders})")
+            indexed = dict(db.execute(select_ids, params).all())
+            batch = [d for d in batch if d["content_key"] not in indexed]
+            if not batch:
+                continue
+            db.execute(
+                text("INSERT INTO search_content_docs (content_key) VALUES (:content_key)"),
+                [{"content_key": d["content_key"]} for d in batch]
+            )
+            rowids = dict(db.execute(select_ids, params).all())
+            db.execute(
+                text("INSERT INTO search_content (rowid, text, options, explanation) VALUES (:rowid, :text, :options, :explanation)"),
+                [{**d, "rowid": rowids[d["content_key"]]} for d in batch]
+            )
+
+    def remove_contents(self, db: Session, content_keys: list):
+        self._delete_docs(db, "search_content_docs", "search_content", "content_key", content_keys)
+
+    def index_questions(self, db: Session, user_id: str, refs: list):
+        for i in range(0, len(refs), INDEX_BATCH_SIZE):
+            db.execute(text("""
+                INSERT OR REPLACE INTO search_question_refs (question_id, user_id, doc_id)
+                SELECT :question_id, :user_id, id FROM search_content_docs WHERE content_key = :content_key
+            """), [
+                {"question_id": question_id, "user_id": user_id, "content_key": content_key}
+                for question_id, content_key in refs[i:i + INDEX_BATCH_SIZE]
+            ])
+
+    def remove_questions(self, db: Session, question_ids: list):
+        for i in range(0, len(question_ids), INDEX_BATCH_SIZE):
+            placeholders, params = self._in_clause(question_ids[i:i + INDEX_BATCH_SIZE])
+            db.execute(text(f"DELETE FROM search_question_refs WHERE question_id IN ({placeholders})"), params)
+
+    def index_note(self, db: Session, note_id: str, group_key: str, content: str):
+        rowid = db.execute(
+            text("INSERT INTO search_note_docs (note_id, group_key) VALUES (:note_id, :group_key) RETURNING id"),
+            {"note_id": note_id, "group_key": group_key}
+        ).scalar()
+        db.execute(text("INSERT INTO search_notes (rowid, content) VALUES (:rowid, :content)"), {"rowid": rowid, "content": content})
+
+    def remove_notes(self, db: Session, note_ids: list):
+        self._delete_docs(db, "search_note_docs", "search_notes", "note_id", note_ids)
+
+    def question_matches(self, db: Session, terms: list, user_id: str, limit: int) -> list:
+        """[(question_id, score)], best first"""
+        # Each unique content is matched once, then narrowed to the user's references to it
+        return db.execute(text("""
+            WITH matches AS MATERIALIZED (
+                SELECT rowid AS doc_id, -bm25(search_content, 10.0, 4.0, 2.0) AS score
+                FROM search_content WHERE search_content MATCH :match
+            )
+            SELECT r.question_id, m.score
+            FROM matches m JOIN search_question_refs r ON r.doc_id = m.doc_id AND r.user_id = :user_id
+            ORDER BY m.score DESC LIMIT :limit
+        """), {"match": self.match_expression(terms), "user_id": user_id, "limit": limit}).all()
+
+    def note_matches_sql(self) -> str:
+        """Subquery of (note_id, group_key, score) for :match"""
+        return """
+            SELECT d.note_id, d.group_key, -bm25(search_notes) AS score
+            FROM search_notes JOIN search_note_docs d ON d.id = search_notes.rowid
+            WHERE search_notes MATCH :match
+        """
+
+    def clear(self, db: Session):
+        for table in ("search_content", "search_content_docs", "search_question_refs", "search_notes", "search_note_docs"):
+            db.execute(text(f"DELETE FROM {table}"))
+
+
+class PostgresSearchBackend:
+    """tsvector documents with GIN indexes, 'portuguese' configuration"""
+
+    CONTENT_DOCUMENT = (
+        "setweight(to_tsvector('portuguese', :text), 'A') || "
+        "setweight(to_tsvector('portuguese', :options), 'B') || "
+        "setweight(to_tsvector('portuguese', :explanation), 'C')"
+    )
+
+    def ensure_schema(self, conn):
+        for statement in (
+            "CREATE TABLE IF NOT EXISTS search_content (content_key VARCHAR PRIMARY KEY, document TSVECTOR NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_search_content_document ON search_content USING GIN (document)",
+            "CREATE TABLE IF NOT EXISTS search_question_refs (question_id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL, content_key VARCHAR NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_search_question_refs_content_user ON search_question_refs (content_key, user_id)",
+            "CREATE TABLE IF NOT EXISTS search_notes (note_id VARCHAR PRIMARY KEY, group_key VARCHAR NOT NULL, document TSVECTOR NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_search_notes_document ON search_notes USING GIN (document)",
+        ):
+            conn.execute(text(statement))
+
+    def match_expression(self, terms: list) -> str:
+        # Terms are \w+ only, safe inside to_tsquery syntax; the stemmer runs on each of them
+        return " & ".join(f"{t}:*" for t in terms)
+
+    def index_contents(self, db: Session, docs: list):
+        for i in range(0, len(docs), INDEX_BATCH_SIZE):
+            db.execute(text(f"""
+                INSERT INTO search_content (content_key, document)
+                VALUES (:content_key, {self.CONTENT_DOCUMENT})
+                ON CONFLICT (content_key) DO NOTHING
+            """), docs[i:i + INDEX_BATCH_SIZE])
+
+    def remove_contents(self, db: Session, content_keys: list):
+        for i in range(0, len(content_keys), INDEX_BATCH_SIZE):
+            db.execute(text("DELETE FROM search_content WHERE content_key = ANY(:keys)"), {"keys": content_keys[i:i + INDEX_BATCH_SIZE]})
+
+    def index_questions(self, db: Session, user_id: str, refs: list):
+        for i in range(0, len(refs), INDEX_BATCH_SIZE):
+            db.execute(text("""
+                INSERT INTO search_question_refs (question_id, user_id, content_key)
+                VALUES (:question_id, :user_id, :content_key)
+                ON CONFLICT (question_id) DO UPDATE SET user_id = EXCLUDED.user_id, content_key = EXCLUDED.content_key
+            """), [
+                {"question_id": question_id, "user_id": user_id, "content_key": content_key}
+                for question_id, content_key in refs[i:i + INDEX_BATCH_SIZE]
+            ])
+
+    def remove_questions(self, db: Session, question_ids: list):
+        for i in range(0, len(question_ids), INDEX_BATCH_SIZE):
+            db.execute(text("DELETE FROM search_question_refs WHERE question_id = ANY(:ids)"), {"ids": question_ids[i:i + INDEX_BATCH_SIZE]})
+
+    def index_note(self, db: Session, note_id: str, group_key: str, content: str):
+        db.execute(text("""
+            INSERT INTO search_notes (note_id, group_key, document)
+            VALUES (:note_id, :group_key, to_tsvector('portuguese', :content))
+            ON CONFLICT (note_id) DO UPDATE SET group_key = EXCLUDED.group_key, document = EXCLUDED.document
+        """), {"note_id": note_id, "group_key": group_key, "content": content})
+
+    def remove_notes(self, db: Session, note_ids: list):
+        for i in range(0, len(note_ids), INDEX_BATCH_SIZE):
+            db.execute(text("DELETE FROM search_notes WHERE note_id = ANY(:ids)"), {"ids": note_ids[i:i + INDEX_BATCH_SIZE]})
+
+    def question_matches(self, db: Session, terms: list, user_id: str, limit: int) -> list:
+        return db.execute(text("""
+            SELECT r.question_id, ts_rank_cd(c.document, query) AS score
+            FROM search_content c
+            CROSS JOIN to_tsquery('portuguese', :match) AS query
+            JOIN search_question_refs r ON r.content_key = c.content_key AND r.user_id = :user_id
+            WHERE c.document @@ query
+            ORDER BY score DESC LIMIT :limit
+        """), {"match": self.match_expression(terms), "user_id": user_id, "limit": limit}).all()
+
+    def note_matches_sql(self) -> str:
+        return """
+            SELECT note_id, group_key, ts_rank_cd(document, query) AS score
+            FROM search_notes, to_tsquery('portuguese', :match) AS query
+            WHERE document @@ query
+        """
+
+    def clear(self, db: Session):
+        db.execute(text("TRUNCATE search_content, search_question_refs, search_notes"))
+
+
+_sqlite = SQLiteSearchBackend()
+_postgres = PostgresSearchBackend()
+
+
+def _backend(db):
+    """Backend for a Session or Connection"""
+    bind = db.get_bind() if isinstance(db, Session) else db
+    return _postgres if bind.dialect.name == "postgresql" else _sqlite
+
+
+def ensure_schema(engine):
+    with engine.begin() as conn:
+        _backend(conn).ensure_schema(conn)
+
+
+def drop_legacy_schema(engine):
+    """Drop the per-question index tables used before content was shared (re-run rebuild() afterwards)"""
+    with engine.begin() as conn:
+        for table in LEGACY_TABLES:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+def content_doc(content_key: str, question_text: str, options, explanation: str) -> dict:
+    return {
+        "content_key": content_key,
+        "text": fold(question_text),
+        "options": fold(_options_text(options)),
+        "explanation": fold(explanation),
+    }
+
+
+def index_questions(db: Session, quiz_id: str, rows: list, contents: dict):
+    """Index freshly inserted question rows and the content they introduced (both from
+    quiz_service.build_question_rows). Content already in the index is not re-tokenized.
+    Does not commit."""
+    if not rows:
+        return
+    user_id = db.query(models.Quiz.user_id).filter(models.Quiz.id == quiz_id).scalar()
+    if user_id is None:
+        return
+    backend = _backend(db)
+    backend.index_contents(db, [
+        content_doc(key, c["text"], c["options"], c["explanation"]) for key, c in contents.items()
+    ])
+    backend.index_questions(db, user_id, [(r["id"], r["content_key"]) for r in rows])
+
+
+def remove_questions(db: Session, question_ids: list):
+    """Drop question references; their content stays indexed until pruned with remove_contents"""
+    if question_ids:
+        _backend(db).remove_questions(db, list(question_ids))
+
+
+def remove_contents(db: Session, content_keys: list):
+    if content_keys:
+        _backend(db).remove_contents(db, list(content_keys))
+
+
+def index_note(db: Session, note: models.CommunityNote):
+    """Index a note whatever its visibility; visibility is applied when searching. Does not commit."""
+    _backend(db).index_note(db, note.id, note.question_hash or note.question_id, fold(note.content))
+
+
+def remove_notes(db: Session, note_ids: list):
+    if note_ids:
+        _backend(db).remove_notes(db, list(note_ids))
+
+
+def remove_notes_for_questions(db: Session, question_ids: list):
+    """Drop the indexed notes attached to these question ids (before the notes themselves are deleted)"""
+    if question_ids:
+        note_ids = [row.id for row in db.query(models.CommunityNote.id).filter(models.CommunityNote.question_id.in_(question_ids))]
+        remove_notes(db, note_ids)
+
+
+def _note_matches(db: Session, backend, terms: list, user, limit: int) -> list:
+    """[(question_id, score)] for the user's questions whose visible notes match, best first"""
+    note = models.CommunityNote
+    question = models.Question
+    # MATERIALIZED keeps SQLite from flattening the MATCH query into the join (bm25() needs its own scan)
+    matches = text(backend.note_matches_sql()).columns(
+        note_id=String, group_key=String, score=Float
+    ).cte("note_matches").prefix_with("MATERIALIZED")
+    best_score = func.max(matches.c.score)
+    rows = db.query(question.id, best_score).select_from(matches).join(
+        note, note.id == matches.c.note_id
+    ).join(
+        question, (question.content_hash == matches.c.group_key) | (question.id == matches.c.group_key)
+    ).join(models.Quiz, models.Quiz.id == question.quiz_id).filter(
+        models.Quiz.user_id == user.id, notes_service.visible_to(user)
+    ).group_by(question.id).order_by(best_score.desc()).limit(limit).params(match=backend.match_expression(terms))
+    return rows.all()
+
+
+def search(db: Session, user, query: str, limit: int = 20, offset: int = 0) -> tuple:
+    """Ranked page of the user's questions matching `query`. Returns ([(question, quiz title, score,
+    matched_in)], has_more)."""
+    terms = query_terms(query)
+    if not terms:
+        return [], False
+    backend = _backend(db)
+    wanted = min(offset + limit + 1, MAX_RESULTS + 1)
+
+    scores = {}
+    for question_id, score in backend.question_matches(db, terms, user.id, wanted):
+        scores[question_id] = (float(score), ["question"])
+    for question_id, score in _note_matches(db, backend, terms, user, wanted):
+        note_score = float(score) * NOTE_MATCH_WEIGHT
+        if question_id in scores:
+            best, matched_in = scores[question_id]
+            scores[question_id] = (max(best, note_score), matched_in + ["notes"])
+        else:
+            scores[question_id] = (note_score, ["notes"])
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1][0], item[0]))
+    page = ranked[offset:offset + limit]
+    has_more = len(ranked) > offset + limit and offset + limit < MAX_RESULTS
+    if not page:
+        return [], has_more
+
+    rows = db.query(models.Question, models.Quiz.title).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).filter(models.Question.id.in_([question_id for question_id, _ in page])).all()
+    by_id = {q.id: (q, title) for q, title in rows}
+    results = [
+        (by_id[question_id][0], by_id[question_id][1], score, matched_in)
+        for question_id, (score, matched_in) in page if question_id in by_id
+    ]
+    return results, has_more
+
+
+def rebuild(db: Session) -> int:
+    """Re-index every question and note from scratch. Returns questions indexed. Commits."""
+    backend = _backend(db)
+    backend.clear(db)
+    content = models.QuestionContent
+    batch = []
+    for key, question_text, options, explanation in db.query(
+        content.hash, content.text, content.options, content.explanation
+    ).yield_per(INDEX_BATCH_SIZE):
+        batch.append(content_doc(key, question_text, options, explanation))
+        if len(batch) >= INDEX_BATCH_SIZE:
+            backend.index_contents(db, batch)
+            batch = []
+    backend.index_contents(db, batch)
+
+    indexed = 0
+    query = db.query(models.Question.id, models.Question.content_key, models.Quiz.user_id).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).filter(models.Question.content_key.isnot(None)).order_by(models.Quiz.user_id)
+    refs, batch_user = [], None
+    for question_id, content_key, user_id in query.yield_per(INDEX_BATCH_SIZE):
+        if refs and (user_id != batch_user or len(refs) >= INDEX_BATCH_SIZE):
+            backend.index_questions(db, batch_user, refs)
+            indexed += len(refs)
+            refs = []
+        batch_user = user_id
+        refs.append((question_id, content_key))
+    if refs:
+        backend.index_questions(db, batch_user, refs)
+        indexed += len(refs)
+
+    for note in db.query(models.CommunityNote).yield_per(INDEX_BATCH_SIZE):
+        backend.index_note(db, note.id, note.question_hash or note.question_id, fold(note.content))
+    db.commit()
+    return indexed
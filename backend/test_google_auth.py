@@ -0,0 +1,169 @@
+"""
+Script para testar a verificação de ID tokens do Google com um conjunto de chaves local
+(sem rede): assinatura, audiência, emissor, expiração, cache das chaves respeitando o
+max-age, rotação de chaves e a escolha de username único numa única query.
+
+Uso: python -m backend.test_google_auth
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+os.environ.setdefault("SECRET_KEY", "test")
+from backend import models, google_auth
+from backend.main import unique_username
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+
+
+class LocalKeySet:
+    """Serves a JWKS from locally generated RSA keys, counting fetches"""
+
+    def __init__(self, max_age: int = 3600):
+        self.max_age = max_age
+        self.keys = {}
+        self.fetches = 0
+        self.add_key("key-1")
+
+    def add_key(self, kid: str):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        self.keys[kid] = pem
+
+    def jwks(self) -> dict:
+        keys = []
+        for kid, pem in self.keys.items():
+            public = jwk.construct(pem, "RS256").public_key().to_dict()
+            keys.append({**public, "kid": kid, "alg": "RS256", "use": "sig"})
+        return {"keys": keys}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.fetches += 1
+        return httpx.Response(200, json=self.jwks(), headers={"Cache-Control": f"public, max-age={self.max_age}"})
+
+    def sign(self, kid: str, **overrides) -> str:
+        now = int(time.time())
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "sub": "1234567890",
+            "email": "aluno@example.com",
+            "name": "Aluno Teste",
+            "iat": now,
+            "exp": now + 3600,
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, self.keys[kid], algorithm="RS256", headers={"kid": kid})
+
+
+def make_verifier(key_set: LocalKeySet):
+    client = httpx.Client(transport=httpx.MockTransport(key_set.handler))
+    return google_auth.GoogleTokenVerifier("https://certs.test/oauth2/v3/certs", client)
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def expect_invalid(verifier, token: str, label: str):
+    try:
+        verifier.verify(token, CLIENT_ID)
+        check(False, f"Token inválido aceito: {label}")
+    except ValueError:
+        pass
+
+
+def test_verification():
+    key_set = LocalKeySet()
+    verifier = make_verifier(key_set)
+
+    claims = verifier.verify(key_set.sign("key-1"), CLIENT_ID)
+    check(claims["email"] == "aluno@example.com", "Claims incorretas")
+
+    expect_invalid(verifier, key_set.sign("key-1", aud="outro-cliente"), "audiência errada")
+    expect_invalid(verifier, key_set.sign("key-1", iss="https://evil.example.com"), "emissor errado")
+    expect_invalid(verifier, key_set.sign("key-1", exp=int(time.time()) - 60), "expirado")
+    header, _, signature = key_set.sign("key-1").split(".")
+    other_payload = key_set.sign("key-1", email="admin@example.com").split(".")[1]
+    expect_invalid(verifier, f"{header}.{other_payload}.{signature}", "payload adulterado")
+    expect_invalid(verifier, "não-é-um-jwt", "malformado")
+    print(f"✅ Verificação: assinatura, audiência, emissor e expiração conferidos ({key_set.fetches} download)")
+
+
+def test_key_cache():
+    key_set = LocalKeySet(max_age=3600)
+    verifier = make_verifier(key_set)
+    for _ in range(50):
+        verifier.verify(key_set.sign("key-1"), CLIENT_ID)
+    check(key_set.fetches == 1, f"50 logins deveriam baixar as chaves 1 vez, foram {key_set.fetches}")
+
+    # Rotation: a token signed with a new key forces one early refresh
+    key_set.add_key("key-2")
+    verifier._last_fetch -= google_auth.MIN_REFRESH_INTERVAL
+    verifier.verify(key_set.sign("key-2"), CLIENT_ID)
+    check(key_set.fetches == 2, "Chave nova deveria disparar um novo download")
+
+    # Unknown kids don't make every request hit the network
+    for _ in range(5):
+        expect_invalid(verifier, _with_kid(key_set, "key-x"), "kid desconhecido")
+    check(key_set.fetches == 2, f"Kid desconhecido não deveria baixar de novo antes do intervalo: {key_set.fetches}")
+
+    # max-age expiry
+    verifier._expires_at = time.monotonic() - 1
+    verifier.verify(key_set.sign("key-1"), CLIENT_ID)
+    check(key_set.fetches == 3, "Chaves expiradas (max-age) deveriam ser baixadas de novo")
+
+    no_store = LocalKeySet(max_age=0)
+    verifier = make_verifier(no_store)
+    verifier.verify(no_store.sign("key-1"), CLIENT_ID)
+    verifier.verify(no_store.sign("key-1"), CLIENT_ID)
+    check(no_store.fetches == 2, "max-age=0 não deveria ser cacheado")
+    check(google_auth.cache_max_age("no-store") == 0, "no-store deveria desativar o cache")
+    check(google_auth.cache_max_age("public") == google_auth.DEFAULT_MAX_AGE, "Sem max-age deveria usar o padrão")
+    print("✅ Cache de chaves: max-age respeitado, rotação e kid desconhecido tratados")
+
+
+def _with_kid(key_set: LocalKeySet, kid: str) -> str:
+    """Token signed with key-1 but announcing an unknown kid"""
+    now = int(time.time())
+    return jwt.encode({"iss": "accounts.google.com", "aud": CLIENT_ID, "sub": "1", "iat": now, "exp": now + 60},
+                      key_set.keys["key-1"], algorithm="RS256", headers={"kid": kid})
+
+
+def test_unique_username():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    for username in ["aluno", "aluno1", "aluno2", "aluno10", "alunoX", "al_no", "outro"]:
+        db.add(models.User(username=username))
+    db.commit()
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    check(unique_username(db, "aluno") == "aluno3", "Deveria escolher o primeiro sufixo livre")
+    check(len(queries) == 1, f"Esperada 1 query, foram {len(queries)}")
+    check(unique_username(db, "novo") == "novo", "Username livre deveria ser mantido")
+    # LIKE wildcards in the email must be matched literally
+    check(unique_username(db, "al_no") == "al_no1", "'_' deveria ser tratado literalmente")
+    check(unique_username(db, "a%") == "a%", "'%' deveria ser tratado literalmente")
+    db.close()
+    print("✅ Username único: primeiro sufixo livre numa única query")
+
+
+if __name__ == "__main__":
+    test_verification()
+    test_key_cache()
+    test_unique_username()
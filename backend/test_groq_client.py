@@ -0,0 +1,372 @@
+"""
+Script para testar o cliente assíncrono do Groq contra um servidor stub local:
+retry com backoff após 429, chamadas concorrentes, reuso de conexões keep-alive e
+coalescência (single-flight) de análises idênticas concorrentes, streaming SSE
+(tempo até o primeiro token, streams incompletos fora do cache), análise em lote com fallback individual, lote truncado
+(finish_reason "length") e orçamento de saída calibrado, e parser incremental da geração de quizzes (itens inválidos re-solicitados).
+
+Uso: python -m backend.test_groq_client
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+import re
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Process-local limiter with room for the whole test; limits are covered by test_rate_limiter.py
+os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+os.environ.setdefault("GROQ_RPM", "100000")
+os.environ.setdefault("GROQ_TPM", "100000000")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import gemini_service, analysis_cache, models, schemas
+
+CONCURRENT_CALLS = 20
+STUB_LATENCY = 0.3  # seconds per completion
+STREAM_TOKENS = 10
+STREAM_TOKEN_DELAY = 0.05  # seconds between streamed tokens
+
+
+class StubGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    requests_seen = 0
+    client_ports = set()
+    generation_counts = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with StubGroqHandler.lock:
+            StubGroqHandler.requests_seen += 1
+            first = StubGroqHandler.requests_seen == 1
+            StubGroqHandler.client_ports.add(self.client_address[1])
+
+        if first:
+            self._reply(429, {"error": "rate limited"}, {"Retry-After": "0"})
+            return
+        if body.get("stream"):
+            question = body["messages"][-1]["content"]
+            match = re.match(r"Gerar (\d+) questões", question)
+            if match:
+                tokens = self._generated(int(match.group(1)))
+                # The first generation is cut mid-item, as when max_tokens runs out
+                self._stream(tokens, "length" if len(StubGroqHandler.generation_counts) == 1 else "stop")
+            else:
+                self._stream(finish_reason="length" if "TRUNCADA" in question else "stop")
+            return
+        time.sleep(STUB_LATENCY)
+        question = body["messages"][-1]["content"]
+        if "Return ONLY a valid JSON object" in question:
+            # Batch prompt: answer every question except the last, to exercise the fallback
+            indexes = [int(i) for i in re.findall(r"^\[(\d+)\]$", question, re.MULTILINE)]
+            analyses = [{"index": i, "analysis": f"Análise em lote {i}"} for i in indexes[:-1]]
+            content = "```json\n" + json.dumps({"analyses": analyses}) + "\n```"
+        else:
+            content = f"Análise: {question[:20]}"
+        self._reply(200, {"choices": [{"message": {"content": content}, "finish_reason": "stop"}]})
+
+    def _reply(self, status_code, data, headers=None):
+        payload = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _generated(self, count: int) -> list:
+        """Generated quiz split in small chunks. The first request breaks two items, later ones don't."""
+        first = not StubGroqHandler.generation_counts
+        StubGroqHandler.generation_counts.append(count)
+        item = lambda i: {
+            "text": f"Questão gerada {i} {{com chaves}} e \"aspas\"?",
+            "options": [{"label": label, "text": f"Opção {label}"} for label in "ABCD"],
+            "correct_answer_label": "A",
+            "explanation": "Explicação"
+        }
+        valid = [json.dumps(item(i), ensure_ascii=False) for i in range(count - 2 if first else count)]
+        if first:
+            valid.append(json.dumps({"text": "Sem resposta", "options": []}))  # fails QuestionCreate
+        text = "```json\n[" + ", ".join(valid) + (', {"text": "Truncada", "opti' if first else "]\n```")
+        return [text[i:i + 7] for i in range(0, len(text), 7)]
+
+    def _stream(self, tokens=None, finish_reason="stop"):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        tokens = tokens or [f"token{i} " for i in range(STREAM_TOKENS)]
+        delay = STREAM_TOKEN_DELAY if len(tokens) <= STREAM_TOKENS else 0
+        events = [{"choices": [{"delta": {"content": token}, "finish_reason": None}]} for token in tokens]
+        events.append({"choices": [{"delta": {}, "finish_reason": finish_reason}]})
+        for i, event in enumerate(events + ["[DONE]"]):
+            if i and delay:
+                time.sleep(delay)
+            data = event if isinstance(event, str) else json.dumps(event)
+            chunk = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+async def run_calls():
+    # The first call absorbs the stub's 429 and retries
+    first = await gemini_service.call_groq([{"role": "user", "content": "Questão 0"}])
+    assert first and first.startswith("Análise"), first
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        gemini_service.call_groq([{"role": "user", "content": f"Questão {i}"}])
+        for i in range(1, CONCURRENT_CALLS + 1)
+    ])
+    elapsed = time.perf_counter() - start
+
+    # A second wave that fits in the keep-alive pool must not open any new connection
+    ports_before = len(StubGroqHandler.client_ports)
+    results += await asyncio.gather(*[
+        gemini_service.call_groq([{"role": "user", "content": f"Questão {i}"}])
+        for i in range(1, gemini_service.MAX_KEEPALIVE_CONNECTIONS + 1)
+    ])
+    new_connections = len(StubGroqHandler.client_ports) - ports_before
+    await gemini_service.close_client()
+    return results, elapsed, new_connections
+
+
+async def run_coalesced():
+    question = schemas.Question(
+        id=str(uuid.uuid4()),
+        text="Qual é a PRINCIPAL responsabilidade do gerente de segurança?",
+        options=[schemas.Option(id=str(uuid.uuid4()), label=label, text=f"Opção {label}") for label in "ABCD"],
+        correct_answer_label="A"
+    )
+    results = await asyncio.gather(*[gemini_service.analyze_question(question) for _ in range(CONCURRENT_CALLS)])
+    await gemini_service.close_client()
+    return results
+
+
+async def run_stream(question):
+    started = time.perf_counter()
+    first_event = None
+    events = []
+    async for event in gemini_service.stream_analysis(question):
+        if first_event is None:
+            first_event = time.perf_counter() - started
+        events.append(event)
+    await gemini_service.close_client()
+    return events, first_event, time.perf_counter() - started
+
+
+def test_streaming():
+    question = schemas.Question(
+        id=str(uuid.uuid4()),
+        text="Qual deve ser a PRIMEIRA ação após um incidente?",
+        options=[schemas.Option(id=str(uuid.uuid4()), label=label, text=f"Opção {label}") for label in "ABCD"],
+        correct_answer_label="B"
+    )
+    StubGroqHandler.requests_seen = 1  # No 429 this time
+    events, first_event, total = asyncio.run(run_stream(question))
+    deltas = [json.loads(e.split("data: ", 1)[1])["delta"] for e in events if e.startswith("data: ")]
+    stats = gemini_service.stats()
+    print(f"📊 Streaming: primeiro token em {first_event * 1000:.0f}ms, completo em {total * 1000:.0f}ms "
+          f"(ttft_p50={stats['ttft_p50_ms']}ms)")
+
+    cached_events, _, _ = asyncio.run(run_stream(question))
+    ok = (
+        len(deltas) == STREAM_TOKENS
+        and events[-1].startswith("event: done")
+        and first_event < total / 2
+        and analysis_cache.lookup(analysis_cache.make_key(question, gemini_service.ANALYSIS_PROMPT_VERSION, gemini_service.GROQ_MODEL)) == "".join(deltas)
+        and len(cached_events) == 2 and '"cached": true' in cached_events[-1]
+    )
+    if not ok:
+        print("❌ Streaming SSE não entregou os tokens progressivamente ou não gravou o cache")
+        sys.exit(1)
+    print("✅ Streaming OK: tokens progressivos, análise completa gravada no cache")
+
+    truncated = question.model_copy(update={"text": "Questão TRUNCADA pelo max_tokens?"})
+    events, _, _ = asyncio.run(run_stream(truncated))
+    key = analysis_cache.make_key(truncated, gemini_service.ANALYSIS_PROMPT_VERSION, gemini_service.GROQ_MODEL)
+    if not events[-1].startswith("event: error") or analysis_cache.lookup(key) is not None:
+        print("❌ Stream cortado por finish_reason=length foi tratado como completo")
+        sys.exit(1)
+    print("✅ Stream incompleto: evento de erro, nada gravado no cache")
+
+
+def test_batch_analysis():
+    questions = [
+        schemas.Question(
+            id=str(uuid.uuid4()),
+            text=f"Questão de lote número {i}: qual controle é MAIS eficaz?",
+            options=[schemas.Option(id=str(uuid.uuid4()), label=label, text=f"Opção {label}") for label in "ABCD"],
+            correct_answer_label="C"
+        )
+        for i in range(25)
+    ]
+    # Same content under another id: must not cost another analysis
+    questions.append(questions[0].model_copy(update={"id": str(uuid.uuid4())}))
+
+    StubGroqHandler.requests_seen = 1
+    batches = gemini_service.pack_batches(questions[:25])
+    results = asyncio.run(run_batch(questions))
+    requests = StubGroqHandler.requests_seen - 1
+
+    print(f"📊 Lote: {len(questions)} questões -> {len(batches)} lotes, {requests} requisições ao stub "
+          f"(fallbacks: {gemini_service.metrics['batch_fallbacks']})")
+    ok = (
+        len(results) == len(questions)
+        and all(results[q.id] for q in questions)
+        and results[questions[0].id] == results[questions[-1].id]
+        and requests == 2 * len(batches)  # one batched call + one fallback per batch
+    )
+    again = asyncio.run(run_batch(questions))
+    if not ok or again != results or StubGroqHandler.requests_seen - 1 != requests:
+        print("❌ Análise em lote não reduziu as chamadas ou não usou o cache")
+        sys.exit(1)
+    single_key = analysis_cache.make_key(questions[0], gemini_service.ANALYSIS_PROMPT_VERSION, gemini_service.GROQ_MODEL)
+    batch_key = analysis_cache.make_key(questions[0], gemini_service.BATCH_ANALYSIS_PROMPT_VERSION, gemini_service.GROQ_MODEL)
+    if analysis_cache.lookup(single_key) is not None or analysis_cache.lookup(batch_key) != results[questions[0].id]:
+        print("❌ Análise em lote gravada sob a versão do prompt individual")
+        sys.exit(1)
+    print("✅ Lote OK: chamadas agrupadas, fallback individual e cache preenchido (versão própria do lote)")
+
+
+def test_truncated_batch():
+    analyses = [{"index": i, "analysis": f"Análise {i} com \"aspas\", vírgulas e ]colchetes["} for i in range(3)]
+    text = json.dumps({"analyses": analyses}, ensure_ascii=False)
+    cut = text[:text.index('"index": 2') + 20]
+    partial = gemini_service.parse_batch_analyses(cut, 3, truncated=True)
+    if gemini_service.parse_batch_analyses(cut, 3) != {} or sorted(partial) != [0, 1] or partial[1] != analyses[1]["analysis"]:
+        print(f"❌ Lote truncado deveria aproveitar só as análises completas: {partial}")
+        sys.exit(1)
+
+    default = gemini_service.ANALYSIS_OUTPUT_TOKENS
+    unchanged = gemini_service.calibrate_output_budget([4000] * (gemini_service.CALIBRATION_MIN_SAMPLES - 1))
+    measured = gemini_service.calibrate_output_budget([2000] * 90 + [4000] * 10)
+    capped = gemini_service.calibrate_output_budget([20000] * 100)
+    gemini_service.ANALYSIS_OUTPUT_TOKENS = default
+    if unchanged != default or measured != int(1001 * 1.2) + 20 or capped != gemini_service.ANALYSIS_MAX_TOKENS:
+        print(f"❌ Orçamento de saída mal calibrado: {unchanged}, {measured}, {capped}")
+        sys.exit(1)
+    print(f"✅ Lote truncado: {len(partial)} de 3 análises aproveitadas; orçamento calibrado pelo p95 ({measured} tokens)")
+
+
+async def run_batch(questions):
+    results = await gemini_service.analyze_questions(questions)
+    await gemini_service.close_client()
+    return results
+
+
+def test_generation_stream():
+    StubGroqHandler.requests_seen = 1
+    questions = asyncio.run(run_generation(5))
+    counts = StubGroqHandler.generation_counts
+    print(f"📊 Geração: {len(questions)} questões válidas, pedidos ao stub por quantidade: {counts}")
+    if len(questions) != 5 or counts != [5, 2] or len({q.id for q in questions}) != 5 or "{com chaves}" not in questions[0].text:
+        print("❌ Parser incremental não recuperou os itens inválidos re-solicitando só os que faltavam")
+        sys.exit(1)
+    print("✅ Geração OK: itens válidos aproveitados, apenas os faltantes re-solicitados")
+
+
+async def run_generation(count):
+    questions = await gemini_service.generate_questions("Médio", count)
+    await gemini_service.close_client()
+    return questions
+
+
+def test_cache_key():
+    base = schemas.Question(
+        id=str(uuid.uuid4()),
+        text="Qual é o MELHOR indicador de sucesso do programa de segurança?",
+        options=[schemas.Option(id=str(uuid.uuid4()), label=label, text=f"Opção {label}") for label in "ABCD"],
+        correct_answer_label="A",
+        explanation="Alinhamento ao negócio"
+    )
+    key = lambda q: analysis_cache.make_key(q, gemini_service.ANALYSIS_PROMPT_VERSION, gemini_service.GROQ_MODEL)
+    same_content = base.model_copy(update={
+        "id": str(uuid.uuid4()),
+        "options": [opt.model_copy(update={"id": str(uuid.uuid4())}) for opt in base.options]
+    })
+    tampered_options = base.model_copy(update={"options": [base.options[0].model_copy(update={"text": "Outra"})] + base.options[1:]})
+    tampered_explanation = base.model_copy(update={"explanation": "Outra explicação"})
+    if key(same_content) != key(base) or key(tampered_options) == key(base) or key(tampered_explanation) == key(base):
+        print("❌ Chave do cache não cobre todo o conteúdo do prompt")
+        sys.exit(1)
+    print("✅ Chave do cache: mesmo conteúdo compartilha, alternativas/explicação diferentes não")
+
+
+def use_memory_cache_db():
+    """Keep the analysis cache of this test out of the real database"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    analysis_cache.SessionLocal = sessionmaker(bind=engine)
+    analysis_cache.clear_memory()
+
+
+def test_single_flight():
+    # The stub answers the first request with 429: only the shared call may see it
+    StubGroqHandler.requests_seen = 0
+    results = asyncio.run(run_coalesced())
+
+    print(f"📊 {CONCURRENT_CALLS} análises idênticas concorrentes -> {StubGroqHandler.requests_seen} requisições ao stub "
+          f"(coalescidas: {gemini_service.metrics['coalesced']})")
+    if StubGroqHandler.requests_seen != 2 or len(set(results)) != 1 or not results[0].startswith("Análise"):
+        print("❌ Análises idênticas não foram coalescidas em uma única chamada")
+        sys.exit(1)
+    print("✅ Single-flight OK: uma chamada (e um único 429) para todos os pedidos")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGroqHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    gemini_service.GROQ_API_URL = f"http://127.0.0.1:{server.server_address[1]}/openai/v1/chat/completions"
+    os.environ.setdefault("GROQ_API_KEY", "gsk_stub")
+    use_memory_cache_db()
+
+    try:
+        test_cache_key()
+        check_client()
+        test_single_flight()
+        test_streaming()
+        test_batch_analysis()
+        test_truncated_batch()
+        test_generation_stream()
+    finally:
+        server.shutdown()
+
+
+def check_client():
+    results, elapsed, new_connections = asyncio.run(run_calls())
+    sequential = CONCURRENT_CALLS * STUB_LATENCY
+    print(f"🔄 {CONCURRENT_CALLS} chamadas concorrentes em {elapsed:.2f}s (sequencial seria ~{sequential:.1f}s)")
+    print(f"📊 Requisições ao stub: {StubGroqHandler.requests_seen}, conexões TCP: {len(StubGroqHandler.client_ports)}")
+
+    ok = True
+    if not all(r and r.startswith("Análise") for r in results):
+        print("❌ Alguma chamada não retornou a análise")
+        ok = False
+    if elapsed >= sequential / 2:
+        print("❌ As chamadas não rodaram em paralelo")
+        ok = False
+    if new_connections:
+        print(f"❌ Segunda rodada abriu {new_connections} conexões novas em vez de reutilizar o pool")
+        ok = False
+
+    if ok:
+        print("✅ Cliente assíncrono OK: retry após 429, concorrência e keep-alive")
+    else:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
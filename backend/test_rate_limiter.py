@@ -0,0 +1,124 @@
+"""
+Script para testar o rate limiter de IA (token bucket): burst e rejeição, recarga,
+compare-and-set do backend em banco sob concorrência, fila antes do Groq e reembolso
+de tokens não usados.
+
+Uso: python -m backend.test_rate_limiter
+"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import models, rate_limiter
+
+
+def make_db_backend():
+    path = os.path.join(tempfile.mkdtemp(), "rate_limit.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    models.Base.metadata.create_all(bind=engine)
+    return rate_limiter.DatabaseBackend(sessionmaker(bind=engine))
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def test_burst_and_refill(backend):
+    bucket = rate_limiter.Bucket(f"test:burst:{type(backend).__name__}", capacity=5, per_minute=120)  # 2/s
+    granted = [backend.take(bucket, 1) == 0 for _ in range(7)]
+    check(granted == [True] * 5 + [False] * 2, f"Burst deveria liberar 5 de 7: {granted}")
+    wait = backend.take(bucket, 1)
+    check(0 < wait <= 0.5, f"Retry-after inesperado: {wait:.3f}s")
+    time.sleep(1.05)
+    check(backend.take(bucket, 2) == 0, "Bucket não recarregou")
+    print(f"✅ {type(backend).__name__}: burst de 5, rejeição com retry-after={wait * 1000:.0f}ms, recarga")
+
+
+def test_batch_cost(backend):
+    rate_limiter.backend = backend
+    user_id = f"batch-{type(backend).__name__}"
+    rate_limiter.check_user_batch(user_id, 20)
+    level = backend.level(rate_limiter.batch_bucket(user_id))
+    check(abs(level - (rate_limiter.BATCH_BURST - 20)) < 1, f"Lote de 20 questões deveria cobrar 20 tokens: {level:.2f}")
+    try:
+        rate_limiter.check_user_batch(user_id, 1000)
+        check(False, "Lote maior que o restante do bucket deveria ser rejeitado")
+    except rate_limiter.RateLimitExceeded:
+        pass
+    user_id += ":cheio"
+    rate_limiter.check_user_batch(user_id, 1000)  # capped at the bucket capacity: a full bucket is enough
+    check(backend.level(rate_limiter.batch_bucket(user_id)) < 1, "Lote acima da capacidade deveria esvaziar o bucket de lote")
+    # Single-question calls have their own bucket and are unaffected
+    granted = 0
+    for _ in range(int(rate_limiter.USER_BURST)):
+        rate_limiter.check_user(user_id)
+        granted += 1
+    print(f"✅ {type(backend).__name__}: lote cobra por questão no próprio bucket; {granted} análises individuais liberadas em seguida")
+
+
+def test_concurrent_cas(backend):
+    bucket = rate_limiter.Bucket("test:concurrent", capacity=10, per_minute=0.001)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        ok = backend.take(bucket, 1) == 0
+        with lock:
+            results.append(ok)
+
+    threads = [threading.Thread(target=worker) for _ in range(30)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    check(sum(results) == 10, f"Compare-and-set concedeu {sum(results)} de 10 tokens")
+    print(f"✅ DatabaseBackend: 30 threads concorrentes, exatamente {sum(results)} tokens concedidos")
+
+
+async def run_upstream():
+    start = time.perf_counter()
+    for _ in range(3):
+        charged = await rate_limiter.acquire_upstream(100)
+    elapsed = time.perf_counter() - start
+    await rate_limiter.refund_tokens(charged - 10)
+    return elapsed
+
+
+def test_upstream_queue():
+    rate_limiter.backend = rate_limiter.MemoryBackend()
+    rate_limiter.GLOBAL_REQUESTS = rate_limiter.Bucket("groq:requests", capacity=2, per_minute=240)  # 4/s
+    rate_limiter.GLOBAL_TOKENS = rate_limiter.Bucket("groq:tokens", capacity=1000, per_minute=60)
+
+    elapsed = asyncio.run(run_upstream())
+    check(0.2 <= elapsed < 1.0, f"Terceira chamada deveria esperar ~0.25s na fila, levou {elapsed:.2f}s")
+    check(rate_limiter.metrics["upstream_queued"] == 1, "Chamada enfileirada não contabilizada")
+    tokens = rate_limiter.backend.level(rate_limiter.GLOBAL_TOKENS)
+    check(785 <= tokens <= 800, f"Reembolso de tokens não aplicado: {tokens:.0f}")
+
+    rate_limiter.MAX_WAIT = 0.1
+    try:
+        asyncio.run(rate_limiter.acquire_upstream(5000))
+        check(False, "Custo acima do orçamento deveria ser rejeitado")
+    except rate_limiter.RateLimitExceeded as e:
+        check(e.scope == "groq", "Escopo da rejeição incorreto")
+    print(f"✅ Fila antes do Groq: espera de {elapsed:.2f}s, reembolso aplicado, rejeição acima de MAX_WAIT")
+    print(f"📊 {rate_limiter.stats()}")
+
+
+if __name__ == "__main__":
+    test_burst_and_refill(rate_limiter.MemoryBackend())
+    db_backend = make_db_backend()
+    test_burst_and_refill(db_backend)
+    test_batch_cost(rate_limiter.MemoryBackend())
+    test_batch_cost(db_backend)
+    test_concurrent_cas(db_backend)
+    test_upstream_queue()
@@ -0,0 +1,120 @@
+"""
+Script para testar a exclusão de um workplace com progresso respondido e notas públicas:
+os blocos saem junto (cascade) sem violar as chaves estrangeiras dos contadores de progresso,
+a sincronização incremental recebe as exclusões do progresso, e as contagens de notas vistas por outros usuários da mesma questão são atualizadas.
+
+Roda a API real (TestClient) num SQLite temporário, com PRAGMA foreign_keys=ON.
+
+Uso: python -m backend.test_workplace_delete
+"""
+import sys
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# The SQLite fallback lives in ./cism_prepwise.db: run in a scratch directory
+os.chdir(tempfile.mkdtemp())
+os.environ["USE_SQLITE"] = "true"
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+
+from fastapi.testclient import TestClient
+
+from backend import database, main, models
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+
+
+def login(client, username: str) -> dict:
+    db = database.SessionLocal()
+    db.add(models.User(username=username, hashed_password=main.get_password_hash("senha"), is_premium=True))
+    db.commit()
+    db.close()
+    token = client.post("/token", data={"username": username, "password": "senha"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def question(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "text": f"Qual é a PRINCIPAL responsabilidade do gerente de segurança no cenário {i}?",
+        "correct_answer_label": "A",
+        "explanation": "Alinhamento ao negócio",
+        "options": [{"id": str(uuid.uuid4()), "label": label, "text": f"Opção {label}"} for label in "ABCD"],
+    }
+
+
+def create_quiz(client, headers: dict, workplace_id: str = None, questions: list = None) -> tuple:
+    questions = questions or [question(i) for i in range(3)]
+    response = client.post("/quizzes/", headers=headers, json={
+        "title": "CISM - Simulado", "provider": "ISACA", "workplace_id": workplace_id, "questions": questions
+    })
+    check(response.status_code == 200, f"Importação falhou: {response.status_code} {response.text}")
+    return response.json()["id"], questions
+
+
+def test_delete_with_progress(client, headers: dict):
+    workplace_id = client.post("/workplaces/", headers=headers, json={"name": "Preparação CISM"}).json()["id"]
+    quiz_id, questions = create_quiz(client, headers, workplace_id)
+    for q in questions[:2]:
+        client.post("/progress/", headers=headers, json={"question_id": q["id"], "selected_answer": "A"})
+    summaries = client.get("/progress/summary", headers=headers).json()
+    check(any(s["quiz_id"] == quiz_id for s in summaries), "Resumo de progresso do bloco não foi criado")
+
+    since = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+
+    response = client.delete(f"/workplaces/{workplace_id}", headers=headers)
+    check(response.status_code == 200, f"Exclusão do workplace falhou: {response.status_code} {response.text}")
+    summaries = client.get("/progress/summary", headers=headers).json()
+    check(not any(s["quiz_id"] == quiz_id for s in summaries), "Resumo de progresso do bloco excluído ficou para trás")
+    delta = client.get("/progress/", headers=headers, params={"since": since}).json()
+    answered = {q["id"] for q in questions[:2]}
+    check(answered <= set(delta["deleted"]), f"Sincronização não recebeu as exclusões: {delta['deleted']}")
+    check(not answered & {p["question_id"] for p in delta["progress"]}, "Progresso excluído ainda aparece no delta")
+    print("✅ Workplace com progresso excluído: blocos, contadores e progresso removidos (com tombstones para o delta)")
+
+
+def note_count(client, headers: dict, question_id: str) -> int:
+    quizzes = client.get("/quizzes/", headers=headers).json()
+    summaries = {qid: s for quiz in quizzes for qid, s in (quiz.get("note_summaries") or {}).items()}
+    return summaries[question_id]["count"]
+
+
+def test_delete_with_notes(client, headers: dict, other: dict):
+    workplace_id = client.post("/workplaces/", headers=headers, json={"name": "Grupo de estudo"}).json()["id"]
+    _, questions = create_quiz(client, headers, workplace_id)
+    # Another user imported the same questions: public notes are shared by content
+    same = [{**q, "id": str(uuid.uuid4())} for q in questions]
+    create_quiz(client, other, questions=same)
+
+    response = client.post("/community-notes/", headers=headers, json={
+        "question_id": questions[0]["id"], "user_name": "aluno", "content": "Pense como gerente, não como técnico."
+    })
+    check(response.status_code == 200, f"Nota não criada: {response.status_code} {response.text}")
+    check(note_count(client, other, same[0]["id"]) == 1, "Contagem de notas do outro usuário deveria ser 1")
+
+    check(client.delete(f"/workplaces/{workplace_id}", headers=headers).status_code == 200, "Exclusão do workplace falhou")
+    db = database.SessionLocal()
+    remaining = db.query(models.CommunityNote).count()
+    db.close()
+    count = note_count(client, other, same[0]["id"])
+    check(remaining == 0 and count == 0, f"Notas restantes: {remaining}, contagem vista pelo outro usuário: {count}")
+    print("✅ Workplace com notas públicas excluído: notas removidas e contagem atualizada para os outros usuários")
+
+
+def main_test():
+    with TestClient(main.app) as client:
+        headers = login(client, "aluno")
+        other = login(client, "colega")
+        test_delete_with_progress(client, headers)
+        test_delete_with_notes(client, headers, other)
+
+
+if __name__ == "__main__":
+    main_test()
@@ -7,12 +7,17 @@ interface CommunityNotesProps {
     questionId: string;
     userName: string;
     isPremium: boolean;
+    // First page already loaded with the rest of the block (see api.getBlockCommunityNotes)
+    prefetched?: { notes: CommunityNote[], nextCursor: string | null };
+    onNoteCreated?: (note: CommunityNote) => void;
 }
 
-export const CommunityNotes: React.FC<CommunityNotesProps> = ({ questionId, userName, isPremium }) => {
+export const CommunityNotes: React.FC<CommunityNotesProps> = ({ questionId, userName, isPremium, prefetched, onNoteCreated }) => {
     const [notes, setNotes] = useState<CommunityNote[]>([]);
     const [newNote, setNewNote] = useState('');
     const [isLoading, setIsLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
     const [isSubmitting, setIsSubmitting] = useState(false);
 
     // Study Group state
@@ -32,10 +37,11 @@ export const CommunityNotes: React.FC<CommunityNotesProps> = ({ questionId, user
         setIsLoading(true);
         try {
             const [notesData, groupsData] = await Promise.all([
-                api.getCommunityNotes(questionId),
+                prefetched ? Promise.resolve(prefetched) : api.getCommunityNotes(questionId),
                 api.getStudyGroups()
             ]);
-            setNotes(notesData);
+            setNotes(notesData.notes);
+            setNextCursor(notesData.nextCursor);
             setExistingGroups(groupsData);
         } catch (error) {
             console.error('Erro ao buscar dados:', error);
@@ -48,6 +54,20 @@ export const CommunityNotes: React.FC<CommunityNotesProps> = ({ questionId, user
         fetchNotes();
     }, [questionId]);
 
+    const loadMoreNotes = async () => {
+        if (!nextCursor) return;
+        setIsLoadingMore(true);
+        try {
+            const page = await api.getCommunityNotes(questionId, nextCursor);
+            setNotes(prev => [...prev, ...page.notes]);
+            setNextCursor(page.nextCursor);
+        } catch (error) {
+            console.error('Erro ao buscar mais dicas:', error);
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
     const handleSubmit = async () => {
         if (!newNote.trim()) return;
 
@@ -61,6 +81,7 @@ export const CommunityNotes: React.FC<CommunityNotesProps> = ({ questionId, user
                 visibility === 'group' ? sharedWith : undefined
             );
             setNotes(prev => [savedNote, ...prev]);
+            onNoteCreated?.(savedNote);
             setNewNote('');
             setSharedWith([]);
             setSharedWithInput('');
@@ -156,7 +177,7 @@ export const CommunityNotes: React.FC<CommunityNotesProps> = ({ questionId, user
                     </span>
                     Dicas da Comunidade
                 </h4>
-                <span className="text-xs font-bold text-slate-400 uppercase tracking-widest">{notes.length} {notes.length === 1 ? 'Dica' : 'Dicas'}</span>
+                <span className="text-xs font-bold text-slate-400 uppercase tracking-widest">{notes.length}{nextCursor ? '+' : ''} {notes.length === 1 ? 'Dica' : 'Dicas'}</span>
             </div>
 
             {/* Notes List */}
@@ -204,6 +225,13 @@ export const CommunityNotes: React.FC<CommunityNotesProps> = ({ questionId, user
                         <p className="text-slate-500 font-medium">Seja o primeiro a deixar uma dica para seus colegas!</p>
                     </div>
                 )}
+                {!isLoading && nextCursor && (
+                    <div className="flex justify-center">
+                        <Button size="sm" variant="secondary" onClick={loadMoreNotes} disabled={isLoadingMore}>
+                            {isLoadingMore ? 'Carregando...' : 'Ver dicas mais antigas'}
+                        </Button>
+                    </div>
+                )}
             </div>
 
             {/* Input Section */}
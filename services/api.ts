@@ -1,4 +1,5 @@
-import { QuizBlock, UserSession, UserProgress, Workplace } from '../types';
+import { Question, QuizBlock, UserSession, UserProgress, Workplace } from '../types';
+import { generateUUID } from './parserService';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000';
 
@@ -12,6 +13,37 @@ const getHeaders = () => {
     return headers;
 };
 
+// Backend expects snake_case; undefined fields are left untouched on the server
+const toProgressPayload = (questionId: string, updates: Partial<UserProgress>) => {
+    const payload = {
+        question_id: questionId,
+        selected_answer: updates.selectedAnswer !== undefined ? updates.selectedAnswer : undefined,
+        is_flagged_disagree_key: updates.isFlaggedDisagreeKey !== undefined ? updates.isFlaggedDisagreeKey : undefined,
+        is_flagged_disagree_ai: updates.isFlaggedDisagreeAI !== undefined ? updates.isFlaggedDisagreeAI : undefined,
+        ai_analysis: updates.aiAnalysis !== undefined ? updates.aiAnalysis : undefined
+    };
+
+    // Clean undefined values
+    Object.keys(payload).forEach(key => (payload as any)[key] === undefined && delete (payload as any)[key]);
+    return payload;
+};
+
+const toSessionEntry = (p: any): UserProgress => ({
+    selectedAnswer: p.selected_answer,
+    isFlaggedDisagreeKey: p.is_flagged_disagree_key,
+    isFlaggedDisagreeAI: p.is_flagged_disagree_ai,
+    aiAnalysis: p.ai_analysis
+});
+
+// Delta sync cursor returned by GET /progress/ (X-Progress-Cursor header or delta.cursor).
+// It trails the server clock, so consecutive deltas may repeat rows; they are applied by question id.
+let PROGRESS_CURSOR: string | null = null;
+
+// Debounced progress queue (questionId -> merged pending updates), flushed to /progress/batch
+const PROGRESS_FLUSH_DELAY_MS = 1500;
+let pendingProgress: Record<string, Partial<UserProgress>> = {};
+let progressFlushTimer: ReturnType<typeof setTimeout> | null = null;
+
 export const api = {
     // --- Auth ---
     async login(username: string, password: string): Promise<void> {
@@ -217,11 +249,52 @@ export const api = {
                 text: q.text,
                 options: q.options,
                 correctAnswerLabel: q.correct_answer_label,
-                explanation: q.explanation
+                explanation: q.explanation,
+                noteCount: quiz.note_summaries?.[q.id]?.count || 0,
+                lastNoteAt: quiz.note_summaries?.[q.id]?.last_note_at || null
             }))
         }));
     },
 
+    async getQuizSummaries(): Promise<{ id: string, title: string, provider?: string, fileName: string, description?: string, workplace_id?: string, timestamp: string, questionCount: number }[]> {
+        // Metadata + question counts only; questions are fetched per quiz with getQuizQuestions
+        const response = await fetch(`${API_URL}/quizzes/?fields=summary`, { headers: getHeaders() });
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok) throw new Error('Failed to fetch quizzes');
+        const data = await response.json();
+
+        return data.map((quiz: any) => ({
+            id: quiz.id,
+            title: quiz.title,
+            provider: quiz.provider,
+            fileName: quiz.file_name || '',
+            description: quiz.description,
+            workplace_id: quiz.workplace_id,
+            timestamp: quiz.created_at,
+            questionCount: quiz.question_count
+        }));
+    },
+
+    async getQuizQuestions(quizId: string, skip: number = 0, limit: number = 100): Promise<{ total: number, questions: QuizBlock['questions'] }> {
+        const response = await fetch(`${API_URL}/quizzes/${quizId}/questions?skip=${skip}&limit=${limit}`, { headers: getHeaders() });
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok) throw new Error('Failed to fetch quiz questions');
+        const page = await response.json();
+
+        return {
+            total: page.total,
+            questions: page.items.map((q: any) => ({
+                id: q.id,
+                text: q.text,
+                options: q.options,
+                correctAnswerLabel: q.correct_answer_label,
+                explanation: q.explanation,
+                noteCount: page.note_summaries?.[q.id]?.count || 0,
+                lastNoteAt: page.note_summaries?.[q.id]?.last_note_at || null
+            }))
+        };
+    },
+
     async createQuiz(title: string, questions: any[], provider?: string, fileName?: string, workplaceId?: string, description?: string): Promise<QuizBlock> {
         // Map frontend camelCase to backend snake_case
         const backendQuestions = questions.map(q => ({
@@ -242,21 +315,22 @@ export const api = {
 
         const quiz = await response.json();
 
-        // Map response back to frontend
+        // The backend only returns metadata and inserted ids; the questions are the ones we sent
+        const { inserted_ids, inserted_count, ...meta } = quiz;
         return {
-            ...quiz,
+            ...meta,
             timestamp: quiz.created_at,
-            questions: quiz.questions.map((q: any) => ({
+            questions: questions.filter(q => inserted_ids.includes(q.id)).map(q => ({
                 id: q.id,
                 text: q.text,
                 options: q.options,
-                correctAnswerLabel: q.correct_answer_label,
+                correctAnswerLabel: q.correctAnswerLabel,
                 explanation: q.explanation
             }))
         };
     },
 
-    async updateQuizQuestions(quizId: string, questions: any[]): Promise<QuizBlock> {
+    async updateQuizQuestions(quizId: string, questions: any[]): Promise<{ insertedIds: string[], questionCount: number }> {
         const backendQuestions = questions.map(q => ({
             id: q.id,
             text: q.text,
@@ -274,18 +348,9 @@ export const api = {
         if (response.status === 401) throw new Error('Unauthorized');
         if (!response.ok) throw new Error('Failed to update quiz questions');
 
-        const quiz = await response.json();
-        return {
-            ...quiz,
-            timestamp: quiz.created_at,
-            questions: quiz.questions.map((q: any) => ({
-                id: q.id,
-                text: q.text,
-                options: q.options,
-                correctAnswerLabel: q.correct_answer_label,
-                explanation: q.explanation
-            }))
-        };
+        // Questions are appended in the order sent; callers add them to their local copy
+        const result = await response.json();
+        return { insertedIds: result.inserted_ids, questionCount: result.question_count };
     },
 
     async deleteQuiz(quizId: string): Promise<void> {
@@ -329,33 +394,41 @@ export const api = {
         const response = await fetch(`${API_URL}/progress/`, { headers: getHeaders() });
         if (response.status === 401) throw new Error('Unauthorized');
         if (!response.ok) throw new Error('Failed to fetch progress');
+        PROGRESS_CURSOR = response.headers.get('X-Progress-Cursor');
         const progressList = await response.json();
 
         // Convert list back to UserSession map
         const session: UserSession = {};
         progressList.forEach((p: any) => {
-            session[p.question_id] = {
-                selectedAnswer: p.selected_answer,
-                isFlaggedDisagreeKey: p.is_flagged_disagree_key,
-                isFlaggedDisagreeAI: p.is_flagged_disagree_ai,
-                aiAnalysis: p.ai_analysis
-            };
+            session[p.question_id] = toSessionEntry(p);
         });
         return session;
     },
 
-    async updateProgress(questionId: string, updates: Partial<UserProgress>): Promise<void> {
-        // Backend expects snake_case
-        const payload = {
-            question_id: questionId,
-            selected_answer: updates.selectedAnswer !== undefined ? updates.selectedAnswer : undefined,
-            is_flagged_disagree_key: updates.isFlaggedDisagreeKey !== undefined ? updates.isFlaggedDisagreeKey : undefined,
-            is_flagged_disagree_ai: updates.isFlaggedDisagreeAI !== undefined ? updates.isFlaggedDisagreeAI : undefined,
-            ai_analysis: updates.aiAnalysis !== undefined ? updates.aiAnalysis : undefined
-        };
+    async syncProgress(session: UserSession): Promise<UserSession> {
+        // Only pull what changed since the last load; fall back to a full load without a cursor
+        if (!PROGRESS_CURSOR) return api.getProgress();
 
-        // Clean undefined values
-        Object.keys(payload).forEach(key => (payload as any)[key] === undefined && delete (payload as any)[key]);
+        const response = await fetch(`${API_URL}/progress/?since=${encodeURIComponent(PROGRESS_CURSOR)}`, { headers: getHeaders() });
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (response.status === 410) return api.getProgress(); // Cursor too old
+        if (!response.ok) throw new Error('Failed to sync progress');
+        const delta = await response.json();
+        PROGRESS_CURSOR = delta.cursor;
+
+        // Apply resets first: any surviving row for the same question is newer than its tombstone
+        const updated: UserSession = { ...session };
+        delta.deleted.forEach((questionId: string) => {
+            delete updated[questionId];
+        });
+        delta.progress.forEach((p: any) => {
+            updated[p.question_id] = toSessionEntry(p);
+        });
+        return updated;
+    },
+
+    async updateProgress(questionId: string, updates: Partial<UserProgress>): Promise<void> {
+        const payload = toProgressPayload(questionId, updates);
 
         const response = await fetch(`${API_URL}/progress/`, {
             method: 'POST',
@@ -366,6 +439,45 @@ export const api = {
         if (!response.ok) throw new Error('Failed to update progress');
     },
 
+    queueProgress(questionId: string, updates: Partial<UserProgress>): void {
+        // Later updates to the same question win field by field
+        pendingProgress[questionId] = { ...pendingProgress[questionId], ...updates };
+        if (progressFlushTimer) clearTimeout(progressFlushTimer);
+        progressFlushTimer = setTimeout(() => {
+            api.flushProgress().catch(err => console.error('Failed to flush progress queue', err));
+        }, PROGRESS_FLUSH_DELAY_MS);
+    },
+
+    async flushProgress(keepalive: boolean = false): Promise<{ question_id: string, status: string, detail?: string }[]> {
+        if (progressFlushTimer) {
+            clearTimeout(progressFlushTimer);
+            progressFlushTimer = null;
+        }
+        const queued = pendingProgress;
+        pendingProgress = {};
+        const payload = Object.entries(queued).map(([questionId, updates]) => toProgressPayload(questionId, updates));
+        if (payload.length === 0) return [];
+
+        let response: Response;
+        try {
+            response = await fetch(`${API_URL}/progress/batch`, {
+                method: 'POST',
+                headers: getHeaders(),
+                body: JSON.stringify(payload),
+                keepalive, // lets the request outlive the page on unload
+            });
+        } catch (err) {
+            // Network failure: put the updates back (newer queued values take precedence)
+            Object.entries(queued).forEach(([questionId, updates]) => {
+                pendingProgress[questionId] = { ...updates, ...pendingProgress[questionId] };
+            });
+            throw err;
+        }
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok) throw new Error('Failed to update progress');
+        return await response.json();
+    },
+
     async resetBlockProgress(quizId: string): Promise<void> {
         const response = await fetch(`${API_URL}/progress/reset-block/${quizId}`, {
             method: 'DELETE',
@@ -416,6 +528,56 @@ export const api = {
         return await response.json();
     },
 
+    async streamAnalysis(question: Question, onDelta: (text: string) => void): Promise<string> {
+        // Server-Sent Events: {"delta"} messages, then a "done" or "error" event
+        const response = await fetch(`${API_URL}/ai/analyze/stream`, {
+            method: 'POST',
+            headers: getHeaders(),
+            body: JSON.stringify({
+                id: question.id,
+                text: question.text,
+                options: question.options,
+                correct_answer_label: question.correctAnswerLabel,
+                explanation: question.explanation
+            })
+        });
+
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok || !response.body) throw new Error(`AI Analysis failed (${response.status})`);
+
+        let text = '';
+        const handleEvent = (raw: string) => {
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) return;
+            const payload = JSON.parse(data);
+            if (event === 'error') throw new Error(payload.detail);
+            if (event === 'message' && payload.delta) {
+                text += payload.delta;
+                onDelta(text);
+            }
+        };
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const events = buffered.split('\n\n');
+            buffered = events.pop() || '';
+            events.forEach(handleEvent);
+        }
+        handleEvent(buffered + decoder.decode());
+
+        return text;
+    },
+
     async autoloadExam(examName: string): Promise<{ content: string; filename: string } | null> {
         const response = await fetch(`${API_URL}/exams/autoload/${examName}`, {
             headers: getHeaders(),
@@ -431,6 +593,77 @@ export const api = {
         return await response.json();
     },
 
+    async streamExamQuestions(examName: string, onQuestion?: (question: Question) => void): Promise<{ questions: Question[]; filename: string } | null> {
+        // Server-side parse, one question per NDJSON line as the bank is read
+        const response = await fetch(`${API_URL}/exams/autoload/${examName}/stream`, {
+            headers: getHeaders(),
+        });
+
+        if (response.status === 404) return null; // File not found, handle gracefully
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok || !response.body) {
+            const errData = await response.json().catch(() => ({}));
+            throw new Error(errData.detail || 'Failed to autoload exam');
+        }
+
+        const filename = decodeURIComponent(response.headers.get('X-Exam-Filename') || `${examName}.txt`);
+        const questions: Question[] = [];
+        const handleLine = (line: string) => {
+            if (!line.trim()) return;
+            const q = JSON.parse(line);
+            const question: Question = {
+                id: q.id,
+                text: q.text,
+                options: q.options,
+                correctAnswerLabel: q.correct_answer_label,
+                explanation: q.explanation || undefined
+            };
+            questions.push(question);
+            onQuestion?.(question);
+        };
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop() || '';
+            lines.forEach(handleLine);
+        }
+        handleLine(buffered + decoder.decode());
+
+        return { questions, filename };
+    },
+
+    async loadExamPack(examName: string): Promise<{ questions: Question[]; filename: string } | null> {
+        // Pre-parsed pack; 'no-cache' lets the browser revalidate its copy with If-None-Match (304)
+        const response = await fetch(`${API_URL}/exams/pack/${examName}`, {
+            headers: getHeaders(),
+            cache: 'no-cache',
+        });
+
+        if (response.status === 404) return null; // File not found, handle gracefully
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok) {
+            const errData = await response.json().catch(() => ({}));
+            throw new Error(errData.detail || 'Failed to autoload exam');
+        }
+
+        const pack = await response.json();
+        // Packs are shared between users, so question/option ids are assigned here
+        const questions: Question[] = pack.questions.map((q: any) => ({
+            id: generateUUID(),
+            text: q.text,
+            options: q.options.map((o: any) => ({ id: generateUUID(), label: o.label, text: o.text })),
+            correctAnswerLabel: q.correct_answer_label,
+            explanation: q.explanation || undefined
+        }));
+        return { questions, filename: pack.filename };
+    },
+
     async generateAIQuiz(difficulty: string = "Médio", count: number = 5): Promise<any[]> {
         const response = await fetch(`${API_URL}/ai/generate?difficulty=${encodeURIComponent(difficulty)}&count=${count}`, {
             method: 'POST',
@@ -449,9 +682,89 @@ export const api = {
         }));
     },
 
+    async generateAIQuizJob(difficulty: string, count: number, title: string, description?: string): Promise<QuizBlock> {
+        // Generation runs as a background job that also saves the quiz; poll until it finishes
+        const params = new URLSearchParams({ difficulty, count: String(count), save: 'true', title });
+        if (description) params.set('description', description);
+        const response = await fetch(`${API_URL}/ai/generate/jobs?${params}`, {
+            method: 'POST',
+            headers: getHeaders()
+        });
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok) {
+            const err = await response.json().catch(() => ({}));
+            throw new Error(err.detail || 'AI Quiz Generation failed');
+        }
+
+        let job = await response.json();
+        while (job.status !== 'done' && job.status !== 'failed') {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            const poll = await fetch(`${API_URL}/ai/generate/jobs/${job.id}`, { headers: getHeaders() });
+            if (poll.status === 401) throw new Error('Unauthorized');
+            if (!poll.ok) throw new Error('AI Quiz Generation failed');
+            job = await poll.json();
+        }
+        if (job.status === 'failed') throw new Error(job.error || 'AI Quiz Generation failed');
+
+        return {
+            id: job.quiz_id,
+            title,
+            description,
+            provider: 'ISACA',
+            fileName: '',
+            timestamp: Date.now(),
+            questions: job.questions.map((q: any) => ({
+                id: q.id,
+                text: q.text,
+                options: q.options,
+                correctAnswerLabel: q.correct_answer_label,
+                explanation: q.explanation || undefined
+            }))
+        };
+    },
+
+    // --- Search ---
+    // Ranked full-text search over the user's questions and the community notes they can see
+    async searchQuestions(query: string, offset: number = 0, limit: number = 20): Promise<{ hasMore: boolean, items: { question: Question, quizId: string, quizTitle: string, matchedIn: string[] }[] }> {
+        const params = new URLSearchParams({ q: query, offset: String(offset), limit: String(limit) });
+        const response = await fetch(`${API_URL}/search?${params}`, { headers: getHeaders() });
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok) throw new Error('Failed to search questions');
+        const data = await response.json();
+        return {
+            hasMore: data.has_more,
+            items: data.items.map((hit: any) => ({
+                question: {
+                    id: hit.question.id,
+                    text: hit.question.text,
+                    options: hit.question.options,
+                    correctAnswerLabel: hit.question.correct_answer_label,
+                    explanation: hit.question.explanation
+                },
+                quizId: hit.quiz_id,
+                quizTitle: hit.quiz_title,
+                matchedIn: hit.matched_in
+            }))
+        };
+    },
+
     // --- Community Notes ---
-    async getCommunityNotes(questionId: string): Promise<any[]> {
-        const response = await fetch(`${API_URL}/community-notes/${questionId}`, { headers: getHeaders() });
+    // One page of notes, newest first; pass nextCursor back as `before` to load older ones
+    async getCommunityNotes(questionId: string, before?: string): Promise<{ notes: any[], nextCursor: string | null }> {
+        const params = before ? `?before=${encodeURIComponent(before)}` : '';
+        const response = await fetch(`${API_URL}/community-notes/${questionId}${params}`, { headers: getHeaders() });
+        if (response.status === 401) throw new Error('Unauthorized');
+        if (!response.ok) throw new Error('Failed to fetch community notes');
+        return { notes: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+    },
+
+    // Newest notes for every question of a quiz block in one request, grouped by content hash
+    async getBlockCommunityNotes(quizId: string): Promise<{ questions: Record<string, string>, groups: Record<string, { count: number, notes: any[], next_cursor: string | null }> }> {
+        const response = await fetch(`${API_URL}/community-notes/bulk`, {
+            method: 'POST',
+            headers: getHeaders(),
+            body: JSON.stringify({ quiz_id: quizId }),
+        });
         if (response.status === 401) throw new Error('Unauthorized');
         if (!response.ok) throw new Error('Failed to fetch community notes');
         return await response.json();
@@ -1,6 +1,6 @@
 import { Question, QuizBlock } from '../types';
 
-const generateUUID = () => {
+export const generateUUID = () => {
   if (typeof crypto !== 'undefined' && crypto.randomUUID) {
     return crypto.randomUUID();
   }
@@ -8,6 +8,11 @@ const generateUUID = () => {
 };
 
 export const parseContentToBlocks = (fileName: string, content: string, customTitle?: string): QuizBlock[] => {
+  return chunkQuestionsToBlocks(fileName, parseQuestions(content), customTitle);
+};
+
+// Kept in sync with backend/question_parser.py, which streams the same parse for /exams/autoload/{exam}/stream
+export const parseQuestions = (content: string): Question[] => {
   // Normalize whitespace and line breaks
   const normalizedContent = content.replace(/\r\n/g, '\n').replace(/\r/g, '\n');
 
@@ -99,7 +104,10 @@ export const parseContentToBlocks = (fileName: string, content: string, customTi
   });
 
   console.log(`Total questions successfully parsed: ${questions.length}`);
+  return questions;
+};
 
+export const chunkQuestionsToBlocks = (fileName: string, questions: Question[], customTitle?: string): QuizBlock[] => {
   // --- Chunking Logic (Max 100 per block) ---
   const CHUNK_SIZE = 100;
   const blocks: QuizBlock[] = [];
@@ -10,6 +10,8 @@ export interface Question {
   options: Option[];
   correctAnswerLabel: string; // 'A'
   explanation?: string;
+  noteCount?: number; // Public community notes, from the quiz payload's note_summaries
+  lastNoteAt?: string | null;
 }
 
 export interface QuizBlock {